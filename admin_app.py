@@ -4,6 +4,7 @@ from __future__ import annotations
 import os
 from flask import Flask, redirect
 
+from modules.core import assets, compression, metrics
 from protected.admin import admin_bp
 
 def create_admin_app() -> Flask:
@@ -18,9 +19,34 @@ def create_admin_app() -> Flask:
     # data dir (zelfde als main app)
     app.config["DATA_DIR"] = os.environ.get("DATA_DIR", "/opt/mediawize/data")
 
+    # werkboekjes (zelfde map als de main app), voor stats rebuild
+    app.config["WORKBOOK_DIR"] = os.environ.get("WORKBOOK_DIR") or os.path.join(app.config["DATA_DIR"], "workbooks")
+
+    # Wachtwoord-hashing beleid (werkzeug notatie, bijv. "scrypt:32768:8:1" of
+    # "pbkdf2:sha256:600000"); zie modules/core/passwords.py
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+
+    # Metrics (zelfde METRICS_DIR als de main app; label app="admin")
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR") or os.path.join(app.config["DATA_DIR"], "metrics")
+    metrics.init_app(app, "admin")
+
+    # Gefingerprinte assets (+ .gz/.br) in ASSETS_DIR, geserveerd onder /assets
+    # met immutable caching; templates gebruiken asset_url()
+    app.config["ASSETS_DIR"] = os.environ.get("ASSETS_DIR") or os.path.join(app.config["DATA_DIR"], "assets")
+    assets.init_app(app)
+
+    # gzip/br/zstd voor html/json/css (COMPRESS_LEVEL, COMPRESS_MIN_SIZE, ...);
+    # COMPRESS_ENABLED=0 als de reverse proxy het al doet
+    compression.init_app(app)
+
     # admin routes
     app.register_blueprint(admin_bp)
 
+    # gedeelde templates (busy.html, leerlingen_import.html) in de admin layout
+    @app.context_processor
+    def _admin_base():
+        return {"base_template": "admin/base_admin.html"}
+
     @app.get("/")
     def root():
         return redirect("/admin/login")
@@ -6,12 +6,16 @@ from datetime import datetime
 
 from flask import Flask, render_template, session
 
+from modules.core import assets, compression, metrics, profiler
+
 # Blueprints
 from modules.core.auth import bp as auth_bp
 from modules.docent.routes import bp as docent_bp
 from modules.leerling.routes import bp as leerling_bp
 from modules.html_tool.routes import bp as html_bp
 from modules.workbook.routes import bp as workbook_bp
+from modules.toetsen.leerling_routes import bp as toetsen_leerling_bp
+from modules.toetsen.docent_routes import bp as toetsen_docent_bp
 
 
 def create_app() -> Flask:
@@ -23,6 +27,35 @@ def create_app() -> Flask:
     # Data dir (voor users.json / toetsen storage etc)
     app.config["DATA_DIR"] = os.environ.get("DATA_DIR", "/opt/mediawize/data")
 
+    # Online werkboekjes (default DATA_DIR/workbooks); map wordt pas bij eerste gebruik aangemaakt
+    app.config["WORKBOOK_DIR"] = os.environ.get("WORKBOOK_DIR") or os.path.join(app.config["DATA_DIR"], "workbooks")
+
+    # Wachtwoord-hashing beleid (werkzeug notatie, bijv. "scrypt:32768:8:1" of
+    # "pbkdf2:sha256:600000"); zie modules/core/passwords.py
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+
+    # Metrics: per-worker bestanden in METRICS_DIR (default DATA_DIR/metrics),
+    # /metrics alleen met METRICS_TOKEN of als admin
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR") or os.path.join(app.config["DATA_DIR"], "metrics")
+    metrics.init_app(app, "main")
+
+    # Admission control voor zware endpoints (DOCX builds/conversies): per pool
+    # ADMISSION_<POOL>_PER_WORKER / ADMISSION_<POOL>_SLOTS en ADMISSION_QUEUE_TIMEOUT
+    # (env); zie modules/core/admission.py
+
+    # Sampling profiler voor trage requests (PROFILE_SLOW_MS / PROFILE_SAMPLE_N);
+    # uit = geen hooks. Profielen in DATA_DIR/profiles.
+    profiler.init_app(app)
+
+    # Gefingerprinte assets (+ .gz/.br) in ASSETS_DIR, geserveerd onder /assets
+    # met immutable caching; templates gebruiken asset_url()
+    app.config["ASSETS_DIR"] = os.environ.get("ASSETS_DIR") or os.path.join(app.config["DATA_DIR"], "assets")
+    assets.init_app(app)
+
+    # gzip/br/zstd voor html/json/css (COMPRESS_LEVEL, COMPRESS_MIN_SIZE, ...);
+    # COMPRESS_ENABLED=0 als de reverse proxy het al doet
+    compression.init_app(app)
+
     # ---- helpers voor session compatibiliteit ----
     def _session_user_email() -> str | None:
         """
@@ -94,6 +127,10 @@ def create_app() -> Flask:
     app.register_blueprint(html_bp)
     app.register_blueprint(workbook_bp)
 
+    # toetsen
+    app.register_blueprint(toetsen_leerling_bp)
+    app.register_blueprint(toetsen_docent_bp)
+
     return app
 
 
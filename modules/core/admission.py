@@ -0,0 +1,165 @@
+# modules/core/admission.py
+"""
+Admission control voor zware endpoints (DOCX builds, conversies).
+
+Zware requests delen een "pool" met een beperkt aantal plekken, op twee
+niveaus:
+
+- per worker proces: een semaphore (ADMISSION_<POOL>_PER_WORKER, default 1),
+  zodat een worker met threads altijd threads over heeft voor /login;
+- over alle workers heen: N slot-bestanden met een flock
+  (ADMISSION_<POOL>_SLOTS, default 2) onder DATA_DIR/admission.
+
+Wie geen plek krijgt wacht maximaal ADMISSION_QUEUE_TIMEOUT seconden
+(default 10) en krijgt daarna direct een 503 met Retry-After, in plaats van
+een worker minutenlang vast te houden. Een gecrashte worker laat geen slot
+achter: de kernel geeft de flock vrij bij het sluiten van de fd.
+
+    @bp.post("/")
+    @login_required
+    @admission_controlled("docx")
+    def workbook_post(): ...
+
+Metrics: mediawize_admission_queue_depth / _in_use (gauges, opgeteld over
+workers), mediawize_admission_wait_seconds, mediawize_admission_rejected_total.
+"""
+from __future__ import annotations
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Iterator
+
+from . import metrics
+from .storage import _backoff_delays
+
+DEFAULT_PER_WORKER = 1
+DEFAULT_SLOTS = 2
+DEFAULT_QUEUE_TIMEOUT = 10.0
+RETRY_AFTER = 15  # seconden
+
+
+class AdmissionRejected(Exception):
+    """Geen plek binnen de queue timeout."""
+
+
+_semaphores: dict[str, threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+
+
+def _semaphore(pool: str, size: int) -> threading.BoundedSemaphore:
+    with _semaphores_lock:
+        sem = _semaphores.get(pool)
+        if sem is None:
+            sem = _semaphores[pool] = threading.BoundedSemaphore(max(1, size))
+        return sem
+
+
+def _try_slot(directory: Path, pool: str, slots: int) -> int | None:
+    """Probeer een vrij slot-bestand te locken; geeft de (open) fd terug."""
+    directory.mkdir(parents=True, exist_ok=True)
+    # starten bij een willekeurig slot spreidt de locks een beetje
+    first = os.getpid() % slots
+    for i in range(slots):
+        path = directory / f"{pool}.{(first + i) % slots}.lock"
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+    return None
+
+
+@contextmanager
+def admitted(
+    pool: str,
+    directory: Path | str,
+    per_worker: int = DEFAULT_PER_WORKER,
+    slots: int = DEFAULT_SLOTS,
+    timeout: float = DEFAULT_QUEUE_TIMEOUT,
+) -> Iterator[None]:
+    """Houd een plek in `pool` vast; AdmissionRejected na `timeout` seconden wachten."""
+    directory = Path(directory)
+    deadline = time.monotonic() + timeout
+    wait_start = time.perf_counter()
+    metrics.gauge_add("mediawize_admission_queue_depth", 1, pool=pool)
+    fd = None
+    sem = _semaphore(pool, per_worker)
+    try:
+        if not sem.acquire(timeout=max(0.0, timeout)):
+            metrics.inc("mediawize_admission_rejected_total", pool=pool, reason="worker")
+            raise AdmissionRejected(pool)
+        try:
+            fd = _try_slot(directory, pool, slots)
+            if fd is None:
+                for delay in _backoff_delays(max(0.0, deadline - time.monotonic())):
+                    time.sleep(delay)
+                    fd = _try_slot(directory, pool, slots)
+                    if fd is not None:
+                        break
+            if fd is None:
+                metrics.inc("mediawize_admission_rejected_total", pool=pool, reason="global")
+                raise AdmissionRejected(pool)
+        except BaseException:
+            sem.release()
+            raise
+    finally:
+        metrics.gauge_add("mediawize_admission_queue_depth", -1, pool=pool)
+        metrics.observe("mediawize_admission_wait_seconds", time.perf_counter() - wait_start, pool=pool)
+
+    metrics.gauge_add("mediawize_admission_in_use", 1, pool=pool)
+    try:
+        yield
+    finally:
+        metrics.gauge_add("mediawize_admission_in_use", -1, pool=pool)
+        os.close(fd)
+        sem.release()
+
+
+# ------------------------------------------------------------
+# Flask decorator
+# ------------------------------------------------------------
+def _config(name: str, default):
+    from flask import current_app
+
+    value = current_app.config.get(name)
+    if value is None:
+        value = os.environ.get(name)
+    return type(default)(value) if value not in (None, "") else default
+
+
+def admission_controlled(pool: str):
+    """Decorator: view alleen uitvoeren met een vrije plek in `pool`, anders 503."""
+    key = pool.upper()
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            from flask import current_app, jsonify, render_template, request
+
+            directory = Path(current_app.config.get("DATA_DIR", "/opt/mediawize/data")) / "admission"
+            try:
+                with admitted(
+                    pool,
+                    directory,
+                    per_worker=_config(f"ADMISSION_{key}_PER_WORKER", DEFAULT_PER_WORKER),
+                    slots=_config(f"ADMISSION_{key}_SLOTS", DEFAULT_SLOTS),
+                    timeout=_config("ADMISSION_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT),
+                ):
+                    return fn(*args, **kwargs)
+            except AdmissionRejected:
+                headers = {"Retry-After": str(RETRY_AFTER)}
+                if request.accept_mimetypes.best == "application/json":
+                    return jsonify({"error": "busy", "retry_after": RETRY_AFTER}), 503, headers
+                return render_template(
+                    "busy.html",
+                    retry_after=RETRY_AFTER,
+                    page_title="Even geduld",
+                ), 503, headers
+        return wrapper
+    return decorator
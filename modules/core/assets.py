@@ -0,0 +1,195 @@
+# modules/core/assets.py
+"""
+Gefingerprinte static assets, zonder build-stap.
+
+Bij het starten van de app hashen we alle bestanden onder static/ en zetten
+we een kopie met de hash in de naam klaar in ASSETS_DIR (default
+DATA_DIR/assets), plus .gz (en .br als `brotli` geïnstalleerd is) voor
+tekstbestanden:
+
+    static/css/app.css  ->  ASSETS_DIR/css/app.3f9a1c0b7e2d.css
+                            ASSETS_DIR/css/app.3f9a1c0b7e2d.css.gz
+                            ASSETS_DIR/css/app.3f9a1c0b7e2d.css.br
+    ASSETS_DIR/manifest.json   {"css/app.css": "css/app.3f9a1c0b7e2d.css", ...}
+
+Bestanden zijn content-addressed: bestaat de gehashte naam al (andere worker,
+vorige start), dan wordt er niets geschreven. De URL verandert alleen als de
+inhoud verandert, dus /assets/... mag een jaar "immutable" gecached worden.
+
+In templates:
+
+    <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
+
+Onbekende bestanden vallen terug op url_for('static', ...). Nginx kan
+ASSETS_DIR ook direct serveren (gzip_static/brotli_static).
+
+Responsive afbeeldingen: tools/build_responsive_images.py zet breedte-varianten
+plus <map>/responsive/index.json klaar; responsive_image() maakt daar src,
+srcset en width/height van:
+
+    {% set img = responsive_image('assets/images/laptop.webp') %}
+    <img src="{{ img.src }}" srcset="{{ img.srcset }}" sizes="..."
+         width="{{ img.width }}" height="{{ img.height }}">
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+from pathlib import Path
+from typing import Any
+
+from modules.core.storage import write_bytes_atomic
+
+try:  # optioneel
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = "/assets"
+HASH_LEN = 12
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+COMPRESS_SUFFIXES = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".ico"}
+COMPRESS_MIN_BYTES = 512
+RESPONSIVE_INDEX = "responsive/index.json"
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def fingerprint_name(rel: str, digest: str) -> str:
+    """"css/app.css" + hash -> "css/app.<hash>.css"."""
+    head, dot, ext = rel.rpartition(".")
+    if not dot or "/" in ext:
+        return f"{rel}.{digest}"
+    return f"{head}.{digest}.{ext}"
+
+
+def _variants(data: bytes) -> dict[str, bytes]:
+    out = {".gz": gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        out[".br"] = brotli.compress(data, quality=BROTLI_QUALITY)
+    return out
+
+
+def build(static_dir: Path | str, out_dir: Path | str) -> dict[str, str]:
+    """Hash + kopieer + comprimeer alle static bestanden; geeft het manifest terug."""
+    static_dir, out_dir = Path(static_dir), Path(out_dir)
+    manifest: dict[str, str] = {}
+    for src in sorted(static_dir.rglob("*")):
+        if not src.is_file() or src.name.startswith("."):
+            continue
+        rel = src.relative_to(static_dir).as_posix()
+        data = src.read_bytes()
+        name = fingerprint_name(rel, hashlib.sha256(data).hexdigest()[:HASH_LEN])
+        manifest[rel] = name
+
+        target = out_dir / name
+        if not target.exists():
+            write_bytes_atomic(target, data)
+        if src.suffix.lower() in COMPRESS_SUFFIXES and len(data) >= COMPRESS_MIN_BYTES:
+            for suffix, packed in _variants(data).items():
+                variant = target.with_name(target.name + suffix)
+                # alleen bewaren als het echt kleiner is
+                if not variant.exists() and len(packed) < len(data):
+                    write_bytes_atomic(variant, packed)
+
+    manifest_path = out_dir / "manifest.json"
+    payload = json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+    try:
+        unchanged = manifest_path.read_bytes() == payload
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        write_bytes_atomic(manifest_path, payload)
+    return manifest
+
+
+def load_responsive(static_dir: Path | str) -> dict[str, dict[str, Any]]:
+    """Alle responsive/index.json bestanden, gekeyed op het bronpad ("assets/images/x.webp")."""
+    static_dir = Path(static_dir)
+    out: dict[str, dict[str, Any]] = {}
+    for index_path in static_dir.rglob(RESPONSIVE_INDEX):
+        base = index_path.parent.parent.relative_to(static_dir).as_posix()
+        try:
+            entries = json.loads(index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            logger.warning("Ongeldige responsive index: %s", index_path)
+            continue
+        for name, entry in entries.items():
+            entry["variants"] = [
+                {**v, "file": f"{base}/responsive/{v['file']}"} for v in entry.get("variants") or []
+            ]
+            out[f"{base}/{name}"] = entry
+    return out
+
+
+# ------------------------------------------------------------
+# Flask integratie
+# ------------------------------------------------------------
+def init_app(app) -> dict[str, str]:
+    """Manifest bouwen, asset_url() in templates, /assets/<naam> route."""
+    from flask import abort, request, send_file, url_for
+
+    out_dir = Path(app.config.get("ASSETS_DIR") or os.path.join(
+        app.config.get("DATA_DIR", "/opt/mediawize/data"), "assets"))
+    try:
+        manifest = build(app.static_folder, out_dir)
+    except OSError:
+        # assets zijn nice-to-have: zonder schrijfbare map gewoon /static gebruiken
+        logger.exception("Assets fingerprinten mislukt; terugval op /static")
+        manifest = {}
+    served = set(manifest.values())
+
+    def asset_url(filename: str) -> str:
+        name = manifest.get(filename.lstrip("/"))
+        if name is None:
+            return url_for("static", filename=filename)
+        return f"{URL_PREFIX}/{name}"
+
+    responsive = load_responsive(app.static_folder)
+
+    def responsive_image(filename: str) -> dict[str, Any]:
+        """src/srcset/width/height voor een <img>; zonder varianten alleen src."""
+        entry = responsive.get(filename.lstrip("/")) or {}
+        candidates = [f"{asset_url(v['file'])} {v['width']}w" for v in entry.get("variants") or []]
+        if candidates and entry.get("width"):
+            candidates.append(f"{asset_url(filename)} {entry['width']}w")
+        return {
+            "src": asset_url(filename),
+            "srcset": ", ".join(candidates),
+            "width": entry.get("width"),
+            "height": entry.get("height"),
+        }
+
+    app.jinja_env.globals["asset_url"] = asset_url
+    app.jinja_env.globals["responsive_image"] = responsive_image
+
+    @app.get(f"{URL_PREFIX}/<path:name>")
+    def fingerprinted_asset(name: str):
+        if name not in served:
+            abort(404)
+        path = out_dir / name
+        mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        encoding = None
+        for enc, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = path.with_name(path.name + suffix)
+            if request.accept_encodings[enc] and variant.exists():
+                path, encoding = variant, enc
+                break
+
+        resp = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        resp.headers["Vary"] = "Accept-Encoding"
+        resp.headers["Cache-Control"] = CACHE_CONTROL
+        return resp
+
+    app.extensions["mediawize_assets"] = manifest
+    return manifest
+
@@ -1,15 +1,17 @@
 # modules/core/auth.py
 from __future__ import annotations
 
-import json
-import os
 import uuid
 from pathlib import Path
 from datetime import datetime
 from typing import Any, Dict
 
-from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, current_app, jsonify, render_template, request, redirect, url_for, flash, session
+
+from .passwords import canonical_params, current_method, hash_password, needs_rehash, verify_password
+from . import stats
+from .school_index import SchoolIndex, school_index
+from .storage import json_transaction, read_json, write_json
 
 bp = Blueprint("auth", __name__, url_prefix="")
 
@@ -41,65 +43,60 @@ def _load_users() -> Dict[str, Dict[str, Any]]:
       "is_admin": bool
     }
     """
-    p = _users_path()
-    if not p.exists():
-        return {}
-    try:
-        return json.loads(p.read_text(encoding="utf-8"))
-    except Exception:
-        # als bestand corrupt is, liever niet crashen
-        return {}
+    # atomic writes: een lezer ziet altijd een volledig bestand
+    return read_json(_users_path(), dict)
 
 def _save_users(users: Dict[str, Dict[str, Any]]) -> None:
-    p = _users_path()
-    p.write_text(json.dumps(users, indent=2, ensure_ascii=False), encoding="utf-8")
+    write_json(_users_path(), users)
 
 def _load_list(path: Path) -> list[dict]:
-    if not path.exists():
-        return []
-    try:
-        raw = path.read_text(encoding="utf-8").strip()
-        return json.loads(raw) if raw else []
-    except Exception:
-        return []
+    return read_json(path, list)
 
 def _save_list(path: Path, items: list[dict]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(items, indent=2, ensure_ascii=False), encoding="utf-8")
+    write_json(path, items)
 
 def _normalize_email(email: str) -> str:
     return (email or "").strip().lower()
 
-def _schools_sorted() -> list[dict]:
-    schools = _load_list(_schools_path())
-    return sorted(schools, key=lambda s: (s.get("name") or "").lower())
+def _school_index() -> SchoolIndex:
+    # gecacht per proces, ververst als schools.json verandert
+    return school_index(_schools_path())
 
 def _upsert_teacher(email: str, name: str, school_id: str) -> None:
     """
     Zorgt dat teachers.json een record heeft voor deze docent.
-    Upsert op email.
+    Upsert op email, onder lock (read-modify-write).
     """
-    teachers = _load_list(_teachers_path())
     email_lc = _normalize_email(email)
-
-    found = next((t for t in teachers if _normalize_email(t.get("email", "")) == email_lc), None)
-    if found:
-        found["name"] = name or found.get("name") or ""
-        found["school_id"] = school_id
-        found["active"] = True
-        found["updated_at"] = datetime.utcnow().isoformat() + "Z"
+    old_school_id = None
+    created = False
+
+    with json_transaction(_teachers_path(), list) as txn:
+        teachers = txn.data
+        found = next((t for t in teachers if _normalize_email(t.get("email", "")) == email_lc), None)
+        if found:
+            old_school_id = found.get("school_id")
+            found["name"] = name or found.get("name") or ""
+            found["school_id"] = school_id
+            found["active"] = True
+            found["updated_at"] = datetime.utcnow().isoformat() + "Z"
+        else:
+            created = True
+            teachers.append({
+                "id": uuid.uuid4().hex,
+                "name": name or "",
+                "email": email_lc,
+                "school_id": school_id,
+                "role": "docent",
+                "active": True,
+                "created_at": datetime.utcnow().isoformat() + "Z"
+            })
+
+    # dashboard tellers bijwerken
+    if created:
+        stats.teacher_added(_data_dir(), school_id)
     else:
-        teachers.append({
-            "id": uuid.uuid4().hex,
-            "name": name or "",
-            "email": email_lc,
-            "school_id": school_id,
-            "role": "docent",
-            "active": True,
-            "created_at": datetime.utcnow().isoformat() + "Z"
-        })
-
-    _save_list(_teachers_path(), teachers)
+        stats.teacher_moved(_data_dir(), old_school_id, school_id)
 
 def _find_teacher_by_email(email: str) -> dict | None:
     teachers = _load_list(_teachers_path())
@@ -107,8 +104,22 @@ def _find_teacher_by_email(email: str) -> dict | None:
     return next((t for t in teachers if _normalize_email(t.get("email", "")) == email_lc), None)
 
 def _find_school_by_id(school_id: str) -> dict | None:
-    schools = _load_list(_schools_path())
-    return next((s for s in schools if s.get("id") == school_id), None)
+    return _school_index().get(school_id)
+
+def _rehash_password(email: str, old_hash: str, password: str) -> None:
+    """
+    Zet de hash van een user om naar het huidige hash-beleid (na geslaagde login).
+    Alleen als de hash intussen niet door iets anders is gewijzigd.
+    """
+    method = current_method()
+    new_hash = hash_password(password, method=method)
+    with json_transaction(_users_path(), dict) as txn:
+        user = txn.data.get(email)
+        if not user or user.get("password_hash") != old_hash:
+            txn.rollback()
+            return
+        user["password_hash"] = new_hash
+        user["password_method"] = canonical_params(method)
 
 # ---------- routes ----------
 @bp.get("/login")
@@ -130,10 +141,18 @@ def login_post():
     users = _load_users()
     user = users.get(email)
 
-    if not user or not check_password_hash(user.get("password_hash", ""), password):
+    if not user or not verify_password(user.get("password_hash", ""), password):
         flash("Onjuiste inloggegevens.", "error")
         return redirect(url_for("auth.login"))
 
+    # hash transparant op- of afschalen naar het huidige beleid
+    if needs_rehash(user.get("password_hash", "")):
+        try:
+            _rehash_password(email, user.get("password_hash", ""), password)
+        except Exception:
+            # login mag hier nooit op falen; volgende keer opnieuw
+            current_app.logger.exception("Rehash van wachtwoord mislukt voor %s", email)
+
     # session vullen
     session["user"] = user["email"]
     session["role"] = user.get("role", "docent")
@@ -167,9 +186,15 @@ def signup():
     if session.get("user"):
         return redirect(url_for("home"))
 
-    # scholen naar template zodat docent er één kan kiezen
-    schools = _schools_sorted()
-    return render_template("auth/signup.html", page_title="Account maken", schools=schools)
+    # scholen niet meer allemaal in de template: de keuzelijst zoekt via /schools/search
+    return render_template("auth/signup.html", page_title="Account maken")
+
+@bp.get("/schools/search")
+def schools_search():
+    """Type-ahead voor de schoolkeuze: prefix-zoeken op (een woord in) de naam."""
+    q = (request.args.get("q") or "").strip()[:100]
+    hits = _school_index().search(q)
+    return jsonify([{"id": s.get("id"), "name": s.get("name") or ""} for s in hits])
 
 @bp.post("/signup")
 def signup_post():
@@ -191,46 +216,58 @@ def signup_post():
         flash("Wachtwoord moet minimaal 6 tekens zijn.", "error")
         return redirect(url_for("auth.signup"))
 
-    # als docent -> school verplicht
+    # als docent -> school verplicht (leerling: optioneel, alleen als hij bestaat)
     school_id = (request.form.get("school_id") or "").strip()
+    if role == "leerling" and _find_school_by_id(school_id) is None:
+        school_id = ""
     if role == "docent":
-        schools = _load_list(_schools_path())
         if not school_id:
             flash("Kies een school.", "error")
             return redirect(url_for("auth.signup"))
-        if not any(s.get("id") == school_id for s in schools):
+        if _find_school_by_id(school_id) is None:
             flash("Kies een geldige school.", "error")
             return redirect(url_for("auth.signup"))
 
-    users = _load_users()
-    if email in users:
-        flash("Dit e-mailadres bestaat al. Log in.", "error")
-        return redirect(url_for("auth.login"))
-
-    users[email] = {
-        "email": email,
-        "password_hash": generate_password_hash(password),
-        "role": role,
-        "is_admin": False,
-    }
-
-    # eerste account automatisch admin maken (handig op een nieuwe installatie)
-    if len(users) == 1:
-        users[email]["is_admin"] = True
-        users[email]["role"] = "docent"
-        role = "docent"  # zodat onderstaande logic klopt
-
-        # als eerste account admin wordt, moet er ook een school gekozen zijn
-        # (anders krijg je direct een docent zonder school)
-        if not school_id:
-            flash("Als eerste account (admin) moet je een school kiezen.", "error")
-            return redirect(url_for("auth.signup"))
-
-    _save_users(users)
+    # dure hash buiten de lock berekenen, zodat gelijktijdige signups elkaar
+    # alleen kort (tijdens de read-modify-write) blokkeren
+    method = current_method()
+    password_hash = hash_password(password, method=method)
+
+    with json_transaction(_users_path(), dict) as txn:
+        users = txn.data
+        if email in users:
+            txn.rollback()
+            flash("Dit e-mailadres bestaat al. Log in.", "error")
+            return redirect(url_for("auth.login"))
+
+        users[email] = {
+            "email": email,
+            "password_hash": password_hash,
+            "password_method": canonical_params(method),
+            "role": role,
+            "is_admin": False,
+        }
+        if role == "leerling" and school_id:
+            users[email]["school_id"] = school_id
+
+        # eerste account automatisch admin maken (handig op een nieuwe installatie)
+        if len(users) == 1:
+            users[email]["is_admin"] = True
+            users[email]["role"] = "docent"
+            role = "docent"  # zodat onderstaande logic klopt
+
+            # als eerste account admin wordt, moet er ook een school gekozen zijn
+            # (anders krijg je direct een docent zonder school)
+            if not school_id:
+                txn.rollback()
+                flash("Als eerste account (admin) moet je een school kiezen.", "error")
+                return redirect(url_for("auth.signup"))
 
     # docent -> ook in teachers.json zetten/updaten
     if role == "docent":
         _upsert_teacher(email=email, name=name, school_id=school_id)
+    else:
+        stats.student_added(_data_dir(), school_id)
 
     flash("Account aangemaakt. Je kunt nu inloggen.", "ok")
     return redirect(url_for("auth.login"))
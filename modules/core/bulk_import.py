@@ -0,0 +1,262 @@
+# modules/core/bulk_import.py
+"""
+Bulk aanmaken van leerlingaccounts vanuit een CSV.
+
+Flow:
+1. CSV parsen + per regel valideren (parse_students_csv)
+2. wachtwoorden hashen in een process pool (hash_passwords), begrensd op
+   IMPORT_HASH_WORKERS processen (default 4)
+3. alle nieuwe users in één gelockte, gebatchte write naar users.json
+   (import_students), met een resultaat per regel
+
+Hashen is bewust duur (scrypt), dus de import routes draaien achter de
+admission pool "import" (ADMISSION_IMPORT_PER_WORKER / _SLOTS) en
+import_students stopt na IMPORT_TIME_BUDGET seconden (default 20, ruim
+binnen gunicorn's --timeout 30). Regels die dan nog niet aan de beurt waren
+krijgen status "niet verwerkt"; hetzelfde bestand opnieuw uploaden gaat
+verder waar het bleef (bestaande accounts worden overgeslagen).
+"""
+from __future__ import annotations
+
+import csv
+import io
+import multiprocessing
+import os
+import re
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+from werkzeug.security import generate_password_hash
+
+from . import stats
+from .passwords import canonical_params, current_method
+from .storage import json_transaction, read_json
+
+MAX_ROWS = 10_000
+MAX_CSV_BYTES = 2 * 1024 * 1024  # 2MB
+MIN_PASSWORD_LENGTH = 6
+GENERATED_PASSWORD_LENGTH = 10
+# onder deze aantallen is het opstarten van een pool duurder dan inline hashen
+PARALLEL_MIN_ROWS = 16
+# processen per import; met de admission pool erbij max. SLOTS x dit aantal
+HASH_WORKERS = int(os.environ.get("IMPORT_HASH_WORKERS", "4"))
+# seconden hashen per request; daarna "niet verwerkt" (opnieuw uploaden)
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "20"))
+
+# zonder verwarrende tekens (0/O, 1/l/I)
+_PASSWORD_ALPHABET = "abcdefghjkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+
+_EMAIL_COLUMNS = ("email", "e-mail", "mail")
+_NAME_COLUMNS = ("naam", "name")
+_PASSWORD_COLUMNS = ("wachtwoord", "password")
+_CLASS_COLUMNS = ("klas", "class", "groep")
+
+# cellen die Excel/LibreOffice als formule uitvoert (CSV/formula injection);
+# ook "'=..." zelf, anders is strippen bij import niet omkeerbaar
+_FORMULA_RE = re.compile(r"^'*[=+\-@\t\r]")
+
+
+def _normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def _generate_password() -> str:
+    return "".join(secrets.choice(_PASSWORD_ALPHABET) for _ in range(GENERATED_PASSWORD_LENGTH))
+
+
+def _pick(row: dict[str, str], names: tuple[str, ...]) -> str:
+    for n in names:
+        if n in row and row[n] is not None:
+            return csv_unescape(row[n].strip())
+    return ""
+
+
+def csv_escape(value: Any) -> Any:
+    """Export: tekst die als formule zou starten krijgt een `'` ervoor ("=1+1" -> "'=1+1")."""
+    if isinstance(value, str) and _FORMULA_RE.match(value):
+        return "'" + value
+    return value
+
+
+def csv_unescape(value: str) -> str:
+    """Import: precies de `'` van csv_escape weer weg, zodat export -> import verliesvrij is."""
+    if value.startswith("'") and _FORMULA_RE.match(value[1:]):
+        return value[1:]
+    return value
+
+
+def decode_csv(raw: bytes) -> str:
+    """Upload -> tekst: utf-8 (met of zonder BOM), anders cp1252 (Excel op Windows)."""
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def parse_students_csv(text: str) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Parse CSV tekst met kolommen email (verplicht) en optioneel naam,
+    wachtwoord, klas. Scheidingsteken `,` of `;` (Excel NL) wordt herkend.
+
+    Returns:
+        (rows, errors): geldige regels en regels met een foutmelding;
+        beide met "line" (regelnummer in het bestand) en "email".
+    """
+    text = text.lstrip("\ufeff")
+    first_line = text.split("\n", 1)[0]
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    reader.fieldnames = [(f or "").strip().lower() for f in (reader.fieldnames or [])]
+    if not any(c in reader.fieldnames for c in _EMAIL_COLUMNS):
+        return [], [{"line": 1, "email": "", "status": "fout", "message": "Kolom 'email' ontbreekt."}]
+
+    rows: list[dict[str, Any]] = []
+    errors: list[dict[str, Any]] = []
+    seen: set[str] = set()
+
+    for row in reader:
+        line = reader.line_num
+        if len(rows) + len(errors) >= MAX_ROWS:
+            errors.append({"line": line, "email": "", "status": "fout",
+                           "message": f"Maximaal {MAX_ROWS} regels per import."})
+            break
+
+        email = _normalize_email(_pick(row, _EMAIL_COLUMNS))
+        password = _pick(row, _PASSWORD_COLUMNS)
+
+        if not email and not any((v or "").strip() for v in row.values() if isinstance(v, str)):
+            continue  # lege regel
+        if not email or "@" not in email:
+            errors.append({"line": line, "email": email, "status": "fout", "message": "Ongeldig e-mailadres."})
+            continue
+        if email in seen:
+            errors.append({"line": line, "email": email, "status": "fout", "message": "Dubbel in dit bestand."})
+            continue
+        if password and len(password) < MIN_PASSWORD_LENGTH:
+            errors.append({"line": line, "email": email, "status": "fout",
+                           "message": f"Wachtwoord moet minimaal {MIN_PASSWORD_LENGTH} tekens zijn."})
+            continue
+
+        seen.add(email)
+        rows.append({
+            "line": line,
+            "email": email,
+            "name": _pick(row, _NAME_COLUMNS),
+            "klas": _pick(row, _CLASS_COLUMNS),
+            "password": password,
+            "generated": not password,
+        })
+
+    return rows, errors
+
+
+def hash_passwords(
+    passwords: list[str],
+    method: str | None = None,
+    workers: int | None = None,
+    deadline: float | None = None,
+) -> list[str]:
+    """
+    Hash wachtwoorden parallel in een process pool (max. HASH_WORKERS, nooit
+    meer dan er cores zijn). Volgorde van de output is gelijk aan de input.
+
+    Met `deadline` (time.monotonic()) wordt in batches gehasht en na de batch
+    waarin de deadline verstrijkt gestopt; de output is dan een prefix van
+    de input.
+    """
+    if not passwords:
+        return []
+    hasher = partial(generate_password_hash, method=method or current_method())
+    workers = min(workers or HASH_WORKERS, os.cpu_count() or 1, len(passwords))
+    batch = len(passwords) if deadline is None else max(1, workers) * 4
+
+    def run(mapper) -> list[str]:
+        out: list[str] = []
+        for i in range(0, len(passwords), batch):
+            out.extend(mapper(passwords[i:i + batch]))
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return out
+
+    if workers <= 1 or len(passwords) < PARALLEL_MIN_ROWS:
+        return run(lambda chunk: [hasher(p) for p in chunk])
+
+    # "spawn": veilig vanuit een (multi-threaded) gunicorn worker
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        return run(lambda chunk: pool.map(hasher, chunk, chunksize=max(1, len(chunk) // (workers * 4))))
+
+
+def import_students(
+    users_path: Path,
+    rows: list[dict[str, Any]],
+    school_id: str = "",
+) -> list[dict[str, Any]]:
+    """
+    Maak leerlingaccounts aan voor `rows` (output van parse_students_csv).
+    Bestaande e-mailadressen worden overgeslagen. Alle nieuwe users worden in
+    één gelockte write opgeslagen. Na IMPORT_TIME_BUDGET seconden hashen
+    stopt de import; de rest krijgt status "niet verwerkt".
+
+    Returns:
+        Resultaat per regel: line, email, status ("aangemaakt"/"bestaat al"/
+        "niet verwerkt"), message en (alleen bij gegenereerde wachtwoorden)
+        password.
+    """
+    # eerst zonder lock filteren, zodat we geen hashes berekenen voor bestaande users
+    existing = read_json(users_path, dict)
+    todo = [r for r in rows if r["email"] not in existing]
+    for r in todo:
+        if r["generated"]:
+            r["password"] = _generate_password()
+
+    method = current_method()
+    deadline = time.monotonic() + IMPORT_TIME_BUDGET
+    hashes = hash_passwords([r["password"] for r in todo], method=method, deadline=deadline)
+    hash_by_email = {r["email"]: h for r, h in zip(todo, hashes)}
+    deferred = {r["email"] for r in todo[len(hashes):]}
+
+    results: list[dict[str, Any]] = []
+    with json_transaction(users_path, dict) as txn:
+        users = txn.data
+        for r in rows:
+            email = r["email"]
+            if email in deferred and email not in users:
+                results.append({"line": r["line"], "email": email, "status": "niet verwerkt",
+                                "message": "Tijdslimiet bereikt: upload hetzelfde bestand opnieuw om verder te gaan.",
+                                "password": ""})
+                continue
+            if email in users or email not in hash_by_email:
+                results.append({"line": r["line"], "email": email, "status": "bestaat al",
+                                "message": "Account bestaat al, overgeslagen.", "password": ""})
+                continue
+
+            user = {
+                "email": email,
+                "password_hash": hash_by_email[email],
+                "password_method": canonical_params(method),
+                "role": "leerling",
+                "is_admin": False,
+            }
+            if r["name"]:
+                user["name"] = r["name"]
+            if r["klas"]:
+                user["klas"] = r["klas"]
+            if school_id:
+                user["school_id"] = school_id
+            users[email] = user
+
+            results.append({"line": r["line"], "email": email, "status": "aangemaakt", "message": "",
+                            "password": r["password"] if r["generated"] else ""})
+
+        created = sum(1 for res in results if res["status"] == "aangemaakt")
+        if not created:
+            txn.rollback()
+
+    stats.student_added(users_path.parent, school_id, count=created)
+    return results
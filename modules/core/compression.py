@@ -0,0 +1,247 @@
+# modules/core/compression.py
+"""
+Response-compressie als WSGI middleware (gzip, plus br/zstd als `brotli` of
+`zstandard` geïnstalleerd is).
+
+    compression.init_app(app)     # wrapt app.wsgi_app
+
+Wat wel/niet:
+- alleen types uit COMPRESS_MIMETYPES (html, css, js, json, svg, ...);
+  text/event-stream, zip, docx, afbeeldingen blijven ongemoeid
+- niet bij HEAD, 1xx/204/206/304, bestaande Content-Encoding (bijv. de
+  voorgecomprimeerde /assets) of Cache-Control: no-transform
+- bekende lengte onder COMPRESS_MIN_SIZE: niet comprimeren
+- bekende lengte tot COMPRESS_MAX_BUFFER: in één keer, met Content-Length;
+  levert het niets op dan gaat het origineel de deur uit
+- onbekende lengte (gestreamd) of groter: per chunk comprimeren met een
+  sync-flush, zodat de client net zo vroeg bytes ziet als zonder compressie
+
+Instellingen (app.config of env): COMPRESS_LEVEL (gzip 1-9, default 6),
+COMPRESS_BR_QUALITY (0-11, default 4), COMPRESS_ZSTD_LEVEL (default 3),
+COMPRESS_MIN_SIZE (default 1024), COMPRESS_ENCODINGS (voorkeur, default
+"br,zstd,gzip"). Lagere levels = minder CPU, iets meer bytes.
+"""
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Any, Callable, Iterable, Iterator
+
+from werkzeug.http import parse_accept_header
+
+try:  # optioneel
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:  # optioneel
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESS_MIMETYPES = frozenset({
+    "text/html", "text/css", "text/plain", "text/csv", "text/xml", "text/javascript",
+    "application/json", "application/javascript", "application/xml",
+    "application/manifest+json", "image/svg+xml",
+})
+COMPRESS_MAX_BUFFER = 4 * 1024 * 1024
+SKIP_STATUS = {204, 206, 304}
+
+
+# ------------------------------------------------------------
+# Encoders: compress() per chunk, flush() = sync flush, finish() = einde
+# ------------------------------------------------------------
+class _Gzip:
+    def __init__(self, level: int):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: Callable,
+        level: int = 6,
+        br_quality: int = 4,
+        zstd_level: int = 3,
+        min_size: int = 1024,
+        encodings: Iterable[str] = ("br", "zstd", "gzip"),
+        mimetypes: Iterable[str] = COMPRESS_MIMETYPES,
+    ):
+        self.app = app
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        factories: dict[str, Callable[[], Any]] = {"gzip": lambda: _Gzip(level)}
+        if brotli is not None:
+            factories["br"] = lambda: _Brotli(br_quality)
+        if zstandard is not None:
+            factories["zstd"] = lambda: _Zstd(zstd_level)
+        # volgorde = voorkeur van de server; niet-beschikbare vallen weg
+        self.encoders = [(e, factories[e]) for e in encodings if e in factories]
+
+    def _negotiate(self, environ: dict) -> tuple[str, Callable[[], Any]] | None:
+        if environ.get("REQUEST_METHOD") == "HEAD":
+            return None
+        accept = parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        for name, factory in self.encoders:
+            if accept[name]:
+                return name, factory
+        return None
+
+    def _mode(self, status: str, headers: list[tuple[str, str]]) -> str | None:
+        """None = niet aanraken, "buffer" = in één keer, "stream" = per chunk."""
+        code = int(status.split(" ", 1)[0])
+        if code < 200 or code in SKIP_STATUS:
+            return None
+        h = {k.lower(): v for k, v in headers}
+        mimetype = h.get("content-type", "").split(";", 1)[0].strip().lower()
+        if mimetype not in self.mimetypes:
+            return None
+        if "content-encoding" in h or "no-transform" in h.get("cache-control", "").lower():
+            return None
+        length = h.get("content-length")
+        if length is None or not length.isdigit():
+            return "stream"
+        if int(length) < self.min_size:
+            return None
+        return "buffer" if int(length) <= COMPRESS_MAX_BUFFER else "stream"
+
+    @staticmethod
+    def _compressed_headers(headers: list[tuple[str, str]], encoding: str, length: int | None) -> list[tuple[str, str]]:
+        out = []
+        vary = None
+        for k, v in headers:
+            lk = k.lower()
+            if lk in ("content-length", "accept-ranges"):
+                continue
+            if lk == "etag" and not v.startswith("W/"):
+                v = "W/" + v  # andere bytes dan het origineel
+            if lk == "vary":
+                vary = v
+                continue
+            out.append((k, v))
+        out.append(("Vary", f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"))
+        out.append(("Content-Encoding", encoding))
+        if length is not None:
+            out.append(("Content-Length", str(length)))
+        return out
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        negotiated = self._negotiate(environ)
+        if negotiated is None:
+            return self.app(environ, start_response)
+        encoding, factory = negotiated
+        state: dict[str, Any] = {}
+
+        def _start(status, headers, exc_info=None):
+            mode = self._mode(status, headers)
+            # start_response pas tijdens het itereren (generator-app): dan kan
+            # bufferen niet meer, de headers moeten nu de deur uit
+            if mode == "buffer" and state.get("returned"):
+                mode = "stream"
+            state.update(mode=mode, status=status, headers=headers, exc_info=exc_info)
+            if mode is None:
+                return start_response(status, headers, exc_info)
+            if mode == "stream":
+                return start_response(status, self._compressed_headers(headers, encoding, None), exc_info)
+            # buffer: headers uitstellen tot we de gecomprimeerde lengte weten
+            return state.setdefault("written", []).append
+
+        body = self.app(environ, _start)
+        state["returned"] = True
+        mode = state.get("mode")
+
+        if mode == "buffer":
+            try:
+                data = b"".join(state.get("written", []) + list(body))
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+            encoder = factory()
+            packed = encoder.compress(data) + encoder.finish()
+            if len(packed) >= len(data):
+                start_response(state["status"], state["headers"], state["exc_info"])
+                return [data]
+            start_response(state["status"], self._compressed_headers(state["headers"], encoding, len(packed)),
+                           state["exc_info"])
+            return [packed]
+
+        if mode == "stream" or "mode" not in state:
+            return self._stream(body, factory, state)
+        return body
+
+    @staticmethod
+    def _stream(body: Iterable[bytes], factory: Callable[[], Any], state: dict[str, Any]) -> Iterator[bytes]:
+        encoder = None
+        try:
+            for chunk in body:
+                # mode wordt pas bekend bij de eerste chunk als de app lui start_response aanroept
+                if state.get("mode") != "stream":
+                    yield chunk
+                    continue
+                if encoder is None:
+                    encoder = factory()
+                if chunk:
+                    out = encoder.compress(chunk) + encoder.flush()
+                    if out:
+                        yield out
+            if state.get("mode") == "stream":
+                yield (encoder or factory()).finish()
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+
+
+def _setting(app, name: str, default: str) -> str:
+    value = app.config.get(name)
+    return str(value) if value is not None else os.environ.get(name, default)
+
+
+def init_app(app) -> None:
+    """Wrap app.wsgi_app; zet COMPRESS_ENABLED=0 om uit te schakelen (bijv. als nginx het doet)."""
+    if _setting(app, "COMPRESS_ENABLED", "1") in ("0", "false", "no"):
+        return
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        level=int(_setting(app, "COMPRESS_LEVEL", "6")),
+        br_quality=int(_setting(app, "COMPRESS_BR_QUALITY", "4")),
+        zstd_level=int(_setting(app, "COMPRESS_ZSTD_LEVEL", "3")),
+        min_size=int(_setting(app, "COMPRESS_MIN_SIZE", "1024")),
+        encodings=[e.strip() for e in _setting(app, "COMPRESS_ENCODINGS", "br,zstd,gzip").split(",") if e.strip()],
+    )
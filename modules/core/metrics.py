@@ -0,0 +1,410 @@
+# modules/core/metrics.py
+"""
+Request- en storage-metrics in Prometheus tekstformaat.
+
+Per proces houden we counters, histograms en gauges in geheugen bij (één
+lock, een paar dict updates per request). Elke worker schrijft zijn stand
+hooguit eens per FLUSH_INTERVAL (en bij het afsluiten) naar
+METRICS_DIR/<pid>-<starttijd>.json; /metrics leest alle bestanden en telt ze
+op, zodat je met meerdere gunicorn workers toch één totaal ziet. Gauges tellen
+alleen van levende workers.
+
+Counters/histograms van gestopte workers blijven meetellen (net als bij
+prometheus_client multiprocess): /metrics vouwt hun bestand in
+METRICS_DIR/aggregate.json en verwijdert het, zodat de map niet groeit met
+elke worker-herstart. De starttijd in de naam voorkomt dat een hergebruikt
+pid de stand van een oude worker overschrijft.
+
+    metrics.init_app(app, "main")          # hooks + /metrics endpoint
+    with metrics.timed("mediawize_docx_seconds", kind="workbook_build"):
+        ...
+
+/metrics is beschermd: Authorization: Bearer $METRICS_TOKEN, of een
+ingelogde admin sessie.
+"""
+from __future__ import annotations
+
+import atexit
+import glob
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0  # seconden
+AGGREGATE_FILE = "aggregate.json"
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# naam -> (type, help, buckets)
+METRICS: dict[str, tuple[str, str, tuple[float, ...]]] = {
+    "mediawize_http_requests_total": ("counter", "HTTP requests per endpoint en status", ()),
+    "mediawize_http_request_duration_seconds": ("histogram", "Duur van HTTP requests", TIME_BUCKETS),
+    "mediawize_http_response_size_bytes": ("histogram", "Grootte van HTTP responses", SIZE_BUCKETS),
+    "mediawize_http_requests_in_flight": ("gauge", "Requests die nu in behandeling zijn", ()),
+    "mediawize_storage_seconds": ("histogram", "Tijd in storage reads/writes/lock wachten", FAST_BUCKETS),
+    "mediawize_docx_seconds": ("histogram", "Tijd in DOCX builds en conversies", TIME_BUCKETS),
+    "mediawize_admission_queue_depth": ("gauge", "Requests die wachten op een plek in een zware pool", ()),
+    "mediawize_admission_in_use": ("gauge", "Bezette plekken per zware pool", ()),
+    "mediawize_admission_wait_seconds": ("histogram", "Wachttijd voor een plek in een zware pool", TIME_BUCKETS),
+    "mediawize_admission_rejected_total": ("counter", "Zware requests geweigerd (503) na de queue timeout", ()),
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class _Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        # (naam, labels) -> [bucket counts..., +Inf count, sum]
+        self.histograms: dict[tuple[str, Labels], list[float]] = {}
+        self.directory: str | None = None
+        self.last_flush = 0.0
+        self.pid = 0
+        self.start = ""
+
+    def identity(self) -> tuple[int, str]:
+        """(pid, starttijd) van dit proces; opnieuw bepaald na een fork."""
+        pid = os.getpid()
+        if pid != self.pid:
+            self.pid, self.start = pid, _process_start(pid) or f"t{time.time_ns()}"
+        return self.pid, self.start
+
+    def snapshot(self) -> dict[str, Any]:
+        pid, start = self.identity()
+        with self.lock:
+            return {
+                "pid": pid,
+                "start": start,
+                "counters": [[n, dict(l), v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, dict(l), v] for (n, l), v in self.gauges.items()],
+                "histograms": [[n, dict(l), list(v)] for (n, l), v in self.histograms.items()],
+            }
+
+
+def _process_start(pid: int) -> str | None:
+    """Starttijd van een proces (kernel ticks sinds boot, uit /proc); None als onbekend."""
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # comm (veld 2) kan spaties bevatten; de velden erna tellen vanaf de laatste ')'
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+_registry = _Registry()
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# ------------------------------------------------------------
+# Registreren
+# ------------------------------------------------------------
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    key = (name, _labels(labels))
+    with _registry.lock:
+        _registry.counters[key] = _registry.counters.get(key, 0.0) + value
+
+
+def gauge_add(name: str, value: float, **labels: Any) -> None:
+    key = (name, _labels(labels))
+    with _registry.lock:
+        _registry.gauges[key] = _registry.gauges.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    buckets = METRICS[name][2]
+    key = (name, _labels(labels))
+    with _registry.lock:
+        h = _registry.histograms.get(key)
+        if h is None:
+            h = _registry.histograms[key] = [0.0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                h[i] += 1
+                break
+        else:
+            h[len(buckets)] += 1
+        h[-1] += value
+
+
+@contextmanager
+def timed(name: str, **labels: Any) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+# ------------------------------------------------------------
+# Multi-worker: per pid een bestand, optellen bij het lezen
+# ------------------------------------------------------------
+def configure(directory: str | None) -> None:
+    _registry.directory = directory
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def flush(force: bool = False) -> None:
+    directory = _registry.directory
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _registry.last_flush < FLUSH_INTERVAL:
+        return
+    _registry.last_flush = now
+    snap = _registry.snapshot()
+    try:
+        _write(os.path.join(directory, f"{snap['pid']}-{snap['start']}.json"), snap)
+    except OSError:
+        logger.exception("Metrics wegschrijven mislukt")
+
+
+# laatste stand bij het afsluiten van een worker (gunicorn sluit workers af via
+# sys.exit, dus atexit draait); alleen bij SIGKILL/os._exit gaat de laatste
+# seconde verloren
+atexit.register(flush, True)
+
+
+def _write(path: str, data: dict[str, Any]) -> None:
+    # atomic rename, bewust zonder fsync: metrics mogen bij een crash verloren gaan
+    fd, tmp = tempfile.mkstemp(prefix=".metrics.", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(data).encode("utf-8"))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _pid_alive(pid: int, start: str | None = None) -> bool:
+    if pid <= 0:
+        return False
+    if start and not start.startswith("t"):
+        # starttijd vergelijken vangt ook een hergebruikt pid af
+        return _process_start(pid) == start
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path: str) -> dict[str, Any] | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(into: dict[str, Any], snap: dict[str, Any]) -> None:
+    """Counters en histograms van `snap` optellen bij `into` (zelfde lijst-formaat)."""
+    counters = {(n, _labels(l)): v for n, l, v in into.get("counters", [])}
+    for name, labels, value in snap.get("counters", []):
+        key = (name, _labels(labels))
+        counters[key] = counters.get(key, 0.0) + value
+    histograms = {(n, _labels(l)): list(v) for n, l, v in into.get("histograms", [])}
+    for name, labels, values in snap.get("histograms", []):
+        h = histograms.setdefault((name, _labels(labels)), [0.0] * len(values))
+        for i, v in enumerate(values):
+            h[i] += v
+    into["counters"] = [[n, dict(l), v] for (n, l), v in counters.items()]
+    into["histograms"] = [[n, dict(l), v] for (n, l), v in histograms.items()]
+
+
+def compact(directory: str) -> int:
+    """
+    Bestanden van gestopte workers in aggregate.json vouwen en verwijderen.
+
+    Eerst wordt het aggregaat weggeschreven (met de namen in "folded"), dan
+    pas verwijderd: crasht het ertussen, dan ruimt de volgende ronde het
+    bestand alleen op zonder het nog eens op te tellen.
+    """
+    from .storage import StorageBusyError, locked
+
+    aggregate_path = os.path.join(directory, AGGREGATE_FILE)
+    try:
+        with locked(aggregate_path, timeout=0.5):
+            aggregate = _read(aggregate_path) or {"counters": [], "histograms": [], "folded": []}
+            already = set(aggregate.get("folded") or [])
+            dead = []
+            for path in glob.glob(os.path.join(directory, "*.json")):
+                name = os.path.basename(path)
+                if name == AGGREGATE_FILE:
+                    continue
+                if name in already:
+                    dead.append(path)  # vorige ronde al opgeteld, alleen nog weghalen
+                    continue
+                snap = _read(path)
+                if snap is None or _pid_alive(int(snap.get("pid") or 0), snap.get("start")):
+                    continue
+                _merge(aggregate, snap)
+                dead.append(path)
+            if not dead:
+                return 0
+            aggregate["folded"] = [os.path.basename(p) for p in dead]
+            _write(aggregate_path, aggregate)
+            for path in dead:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            return len(dead)
+    except (StorageBusyError, OSError):
+        # een andere worker is al bezig; volgende scrape opnieuw
+        return 0
+
+
+def collect() -> dict[str, Any]:
+    """Opgetelde stand van alle workers (of alleen dit proces zonder METRICS_DIR)."""
+    flush(force=True)
+    snapshots = []
+    if _registry.directory:
+        compact(_registry.directory)
+        aggregate = _read(os.path.join(_registry.directory, AGGREGATE_FILE)) or {}
+        # al opgeteld maar (nog) niet verwijderd: niet dubbel tellen
+        folded = set(aggregate.get("folded") or [])
+        for path in glob.glob(os.path.join(_registry.directory, "*.json")):
+            name = os.path.basename(path)
+            if name == AGGREGATE_FILE or name in folded:
+                continue
+            snap = _read(path)
+            if snap is not None:
+                snapshots.append(snap)
+        snapshots.append(aggregate)
+    else:
+        snapshots.append(_registry.snapshot())
+
+    counters: dict[tuple[str, Labels], float] = {}
+    gauges: dict[tuple[str, Labels], float] = {}
+    histograms: dict[tuple[str, Labels], list[float]] = {}
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", []):
+            key = (name, _labels(labels))
+            counters[key] = counters.get(key, 0.0) + value
+        if _pid_alive(int(snap.get("pid") or 0), snap.get("start")):
+            for name, labels, value in snap.get("gauges", []):
+                key = (name, _labels(labels))
+                gauges[key] = gauges.get(key, 0.0) + value
+        for name, labels, values in snap.get("histograms", []):
+            key = (name, _labels(labels))
+            h = histograms.setdefault(key, [0.0] * len(values))
+            for i, v in enumerate(values):
+                h[i] += v
+    return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Labels, extra: tuple[str, str] | None = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    data = collect()
+    lines: list[str] = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        source = {"counter": data["counters"], "gauge": data["gauges"], "histogram": data["histograms"]}[kind]
+        series = sorted((labels, v) for (n, labels), v in source.items() if n == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind != "histogram":
+                lines.append(f"{name}{_fmt_labels(labels)} {value:g}")
+                continue
+            cumulative = 0.0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', f'{bound:g}'))} {cumulative:g}")
+            cumulative += value[len(buckets)]
+            lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {cumulative:g}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {value[-1]:g}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative:g}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------------------
+# Flask integratie
+# ------------------------------------------------------------
+def init_app(app, app_name: str) -> None:
+    """Request hooks + beschermd /metrics endpoint."""
+    from flask import Response, abort, g, request, session
+
+    directory = app.config.get("METRICS_DIR") or os.path.join(
+        app.config.get("DATA_DIR", "/opt/mediawize/data"), "metrics")
+    configure(directory)
+
+    def _route_labels() -> dict[str, str]:
+        endpoint = request.url_rule.endpoint if request.url_rule else "<unmatched>"
+        return {
+            "app": app_name,
+            "blueprint": request.blueprint or "",
+            "endpoint": endpoint,
+            "method": request.method,
+        }
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+        gauge_add("mediawize_http_requests_in_flight", 1, app=app_name)
+
+    @app.after_request
+    def _metrics_response(response):
+        labels = _route_labels()
+        g._metrics_counted = True
+        inc("mediawize_http_requests_total", status=response.status_code, **labels)
+        # gestreamde responses hebben geen bekende lengte; die tellen niet mee
+        if response.content_length is not None:
+            observe("mediawize_http_response_size_bytes", response.content_length,
+                    app=app_name, blueprint=labels["blueprint"], endpoint=labels["endpoint"])
+        return response
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        gauge_add("mediawize_http_requests_in_flight", -1, app=app_name)
+        if exc is not None and not g.pop("_metrics_counted", False):
+            inc("mediawize_http_requests_total", status=500, **_route_labels())
+        observe("mediawize_http_request_duration_seconds", time.perf_counter() - start, **_route_labels())
+        flush()
+
+    token = app.config.get("METRICS_TOKEN") or os.environ.get("METRICS_TOKEN", "")
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        auth = request.headers.get("Authorization", "")
+        bearer_ok = bool(token) and hmac.compare_digest(auth, f"Bearer {token}")
+        if not bearer_ok and not session.get("is_admin"):
+            abort(403)
+        return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,62 @@
+# modules/core/passwords.py
+"""
+Wachtwoord-hashing beleid op één plek.
+
+Het algoritme + work factor komt uit app.config["PASSWORD_HASH_METHOD"]
+(env PASSWORD_HASH_METHOD), in werkzeug notatie, bijv.:
+- "scrypt"                  (werkzeug default: scrypt:32768:8:1)
+- "scrypt:16384:8:1"
+- "pbkdf2:sha256:600000"
+
+De parameters staan in de prefix van elke hash ("scrypt:32768:8:1$salt$hash")
+en worden per user ook als "password_method" bewaard. Bij een geslaagde login
+wordt een hash met afwijkende parameters opnieuw gehasht naar het huidige beleid.
+"""
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt"
+
+
+def current_method() -> str:
+    """Het geconfigureerde hash-beleid (app config, anders env, anders default)."""
+    method = None
+    if has_app_context():
+        method = current_app.config.get("PASSWORD_HASH_METHOD")
+    return (method or os.environ.get("PASSWORD_HASH_METHOD") or DEFAULT_METHOD).strip()
+
+
+@lru_cache(maxsize=16)
+def canonical_params(method: str) -> str:
+    """
+    Volledige parameter-prefix voor `method`, zoals werkzeug hem wegschrijft
+    ("scrypt" -> "scrypt:32768:8:1"). Zo vergelijken we beleid met opgeslagen hashes.
+    """
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def hash_params(password_hash: str) -> str:
+    """Parameter-prefix van een opgeslagen hash ("" als onbekend formaat)."""
+    if not password_hash or "$" not in password_hash:
+        return ""
+    return password_hash.split("$", 1)[0]
+
+
+def hash_password(password: str, method: str | None = None) -> str:
+    return generate_password_hash(password, method=method or current_method())
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    if not password_hash:
+        return False
+    return check_password_hash(password_hash, password)
+
+
+def needs_rehash(password_hash: str, method: str | None = None) -> bool:
+    """True als de hash niet met het huidige beleid (algoritme + work factor) is gemaakt."""
+    return hash_params(password_hash) != canonical_params(method or current_method())
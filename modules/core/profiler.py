@@ -0,0 +1,252 @@
+# modules/core/profiler.py
+"""
+Opt-in sampling profiler voor trage requests.
+
+Aanzetten via env (of app.config met dezelfde namen):
+
+    PROFILE_SLOW_MS=1500        profiel bewaren van requests trager dan 1,5 s
+    PROFILE_SAMPLE_N=200        en/of: 1 op de 200 requests altijd bewaren
+    PROFILE_INTERVAL_MS=5       sample-interval
+    PROFILE_ENDPOINTS=workbook.workbook_post,html_tool.index_post   (optioneel)
+    PROFILE_MAX_FILES=200       rotatie: oudste profielen eerst weg
+    PROFILE_MAX_BYTES=52428800
+
+Staat het uit (beide 0), dan installeert init_app niets: geen hooks, geen
+thread, geen kosten.
+
+Aan: één daemon thread per worker pakt elke interval de stack van de threads
+die een (gekozen) request afhandelen via sys._current_frames(). Aan het eind
+van het request wordt het profiel weggegooid, of bij traag/gesampled
+weggeschreven naar DATA_DIR/profiles als
+
+    <tijd>-<endpoint>-<pid>-<ms>.folded   collapsed stacks (flamegraph.pl,
+                                          speedscope, inferno)
+    <tijd>-<endpoint>-<pid>-<ms>.json     request metadata
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_MAX_FILES = 200
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+MAX_STACK_DEPTH = 128
+
+
+class _Capture:
+    __slots__ = ("started", "sampled", "stacks", "samples")
+
+    def __init__(self, sampled: bool):
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.samples = 0
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        out_dir: Path,
+        slow_ms: int = 0,
+        sample_n: int = 0,
+        interval_ms: int = DEFAULT_INTERVAL_MS,
+        endpoints: set[str] | None = None,
+        max_files: int = DEFAULT_MAX_FILES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.out_dir = Path(out_dir)
+        self.slow_ms = slow_ms
+        self.sample_n = sample_n
+        self.interval = max(1, interval_ms) / 1000.0
+        self.endpoints = endpoints or None
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._active: dict[int, _Capture] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._thread_pid: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.slow_ms or self.sample_n)
+
+    # ------------------------------------------------------------
+    # Sampler thread
+    # ------------------------------------------------------------
+    def _thread_running(self) -> bool:
+        return self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive()
+
+    def _ensure_thread(self) -> None:
+        # lazy en per pid: na een fork (gunicorn --preload) bestaat de thread niet meer
+        if self._thread_running():
+            return
+        with self._lock:
+            if self._thread_running():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="mediawize-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            samples = []
+            for ident, capture in active:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stack.reverse()
+                samples.append((ident, capture, tuple(stack)))
+            del frames, frame
+            # tellen onder de lock, en alleen als stop() de capture nog niet weggehaald heeft
+            with self._lock:
+                for ident, capture, stack in samples:
+                    if self._active.get(ident) is capture:
+                        capture.stacks[stack] += 1
+                        capture.samples += 1
+
+    # ------------------------------------------------------------
+    # Per request
+    # ------------------------------------------------------------
+    def start(self, endpoint: str | None) -> bool:
+        """Registreer het huidige request; False als het niet geprofiled wordt."""
+        if self.endpoints and endpoint not in self.endpoints:
+            return False
+        sampled = bool(self.sample_n) and random.random() < 1.0 / self.sample_n
+        if not sampled and not self.slow_ms:
+            return False
+        self._ensure_thread()
+        with self._lock:
+            self._active[threading.get_ident()] = _Capture(sampled)
+        return True
+
+    def stop(self, meta: dict[str, Any]) -> Path | None:
+        """Stop het profiel van dit request; schrijf het weg als het traag of gesampled is."""
+        with self._lock:
+            capture = self._active.pop(threading.get_ident(), None)
+        if capture is None:
+            return None
+        duration_ms = (time.perf_counter() - capture.started) * 1000
+        slow = bool(self.slow_ms) and duration_ms >= self.slow_ms
+        if not (slow or capture.sampled) or not capture.samples:
+            return None
+        try:
+            return self._write(capture, duration_ms, "slow" if slow else "sample", meta)
+        except Exception:
+            # een profiler mag een request nooit breken
+            logger.exception("Profiel wegschrijven mislukt")
+            return None
+
+    def _write(self, capture: _Capture, duration_ms: float, reason: str, meta: dict[str, Any]) -> Path:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        endpoint = re.sub(r"[^A-Za-z0-9_.-]+", "_", meta.get("endpoint") or "unknown")
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        # endpoint bevat punten, dus geen with_suffix()
+        base = f"{stamp}-{endpoint}-{os.getpid()}-{int(duration_ms)}ms"
+        folded_path = self.out_dir / f"{base}.folded"
+
+        folded = "".join(f"{';'.join(stack)} {count}\n" for stack, count in capture.stacks.most_common())
+        folded_path.write_text(folded, encoding="utf-8")
+        (self.out_dir / f"{base}.json").write_text(json.dumps({
+            **meta,
+            "reason": reason,
+            "duration_ms": round(duration_ms, 1),
+            "samples": capture.samples,
+            "interval_ms": self.interval * 1000,
+            "pid": os.getpid(),
+            "recorded_at": datetime.utcnow().isoformat() + "Z",
+        }, indent=2, ensure_ascii=False), encoding="utf-8")
+
+        self._rotate()
+        return folded_path
+
+    def _rotate(self) -> None:
+        """Oudste profielen (.folded + .json samen) weg tot we onder max_files en max_bytes zitten."""
+        profiles: dict[str, list[tuple[Path, int]]] = {}
+        for path in self.out_dir.iterdir():
+            if path.suffix not in (".folded", ".json"):
+                continue
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                continue
+            profiles.setdefault(path.name.rsplit(".", 1)[0], []).append((path, size))
+
+        total = sum(size for files in profiles.values() for _, size in files)
+        remaining = len(profiles)
+        for base in sorted(profiles):  # naam begint met timestamp
+            if remaining <= self.max_files and total <= self.max_bytes:
+                break
+            for path, size in profiles[base]:
+                path.unlink(missing_ok=True)
+                total -= size
+            remaining -= 1
+
+
+def _setting(app, name: str, default: str = "") -> str:
+    value = app.config.get(name)
+    return str(value) if value is not None else os.environ.get(name, default)
+
+
+def init_app(app) -> SamplingProfiler | None:
+    """Installeer de hooks alleen als profiling aan staat."""
+    profiler = SamplingProfiler(
+        out_dir=Path(app.config.get("DATA_DIR", "/opt/mediawize/data")) / "profiles",
+        slow_ms=int(_setting(app, "PROFILE_SLOW_MS", "0") or 0),
+        sample_n=int(_setting(app, "PROFILE_SAMPLE_N", "0") or 0),
+        interval_ms=int(_setting(app, "PROFILE_INTERVAL_MS", str(DEFAULT_INTERVAL_MS))),
+        endpoints={e.strip() for e in _setting(app, "PROFILE_ENDPOINTS").split(",") if e.strip()},
+        max_files=int(_setting(app, "PROFILE_MAX_FILES", str(DEFAULT_MAX_FILES))),
+        max_bytes=int(_setting(app, "PROFILE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+    )
+    if not profiler.enabled:
+        return None
+
+    from flask import g, request
+
+    @app.before_request
+    def _profile_start():
+        endpoint = request.url_rule.endpoint if request.url_rule else None
+        g._profiling = profiler.start(endpoint)
+
+    @app.after_request
+    def _profile_status(response):
+        g._profile_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _profile_stop(exc):
+        if not g.pop("_profiling", False):
+            return
+        profiler.stop({
+            "endpoint": request.url_rule.endpoint if request.url_rule else None,
+            "method": request.method,
+            "path": request.path,
+            "status": g.pop("_profile_status", 500 if exc else None),
+            "error": repr(exc) if exc else None,
+        })
+
+    app.extensions["mediawize_profiler"] = profiler
+    return profiler
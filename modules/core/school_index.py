@@ -0,0 +1,74 @@
+# modules/core/school_index.py
+"""
+Gecachte, voorgesorteerde index van schools.json.
+
+De index wordt per proces één keer opgebouwd en automatisch ververst als
+schools.json verandert (ook als de admin app schrijft). Zoeken gaat met
+bisect op prefix van de naam of van een woord in de naam ("tri" vindt
+"SG De Triade"), zonder alle scholen te doorlopen.
+"""
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any
+
+from .storage import FileCache
+from .text_index import SubstringIndex
+
+SEARCH_LIMIT = 20
+
+_WORD_START = re.compile(r"(?:^|(?<=[\s\-_/.(]))\S")
+
+
+class SchoolIndex:
+    def __init__(self, schools: list[dict[str, Any]]):
+        items = [s for s in schools if isinstance(s, dict) and s.get("id")]
+        self.schools: list[dict[str, Any]] = sorted(items, key=lambda s: (s.get("name") or "").lower())
+        self.by_id: dict[str, dict[str, Any]] = {s["id"]: s for s in self.schools}
+
+        # (naam vanaf woordbegin, positie in self.schools), gesorteerd voor bisect
+        keys: list[tuple[str, int]] = []
+        for pos, s in enumerate(self.schools):
+            name = (s.get("name") or "").lower()
+            for m in _WORD_START.finditer(name):
+                keys.append((name[m.start():], pos))
+        keys.sort()
+        self._keys = keys
+        self._substring: SubstringIndex | None = None
+
+    def __len__(self) -> int:
+        return len(self.schools)
+
+    def get(self, school_id: str) -> dict[str, Any] | None:
+        return self.by_id.get(school_id) if school_id else None
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> list[dict[str, Any]]:
+        """Scholen waarvan de naam (of een woord erin) met `query` begint, alfabetisch."""
+        q = " ".join((query or "").lower().split())
+        if not q:
+            return self.schools[:limit]
+
+        hits: set[int] = set()
+        i = bisect_left(self._keys, (q, -1))
+        while i < len(self._keys) and self._keys[i][0].startswith(q):
+            hits.add(self._keys[i][1])
+            i += 1
+        return [self.schools[pos] for pos in sorted(hits)[:limit]]
+
+    @property
+    def substring(self) -> SubstringIndex:
+        """Substring-index op naam + slug (admin lijst); pas bij eerste gebruik opgebouwd."""
+        if self._substring is None:
+            self._substring = SubstringIndex(
+                f"{s.get('name') or ''}\n{s.get('slug') or ''}" for s in self.schools
+            )
+        return self._substring
+
+
+_cache: FileCache[SchoolIndex] = FileCache(SchoolIndex, list)
+
+
+def school_index(schools_path: Path) -> SchoolIndex:
+    return _cache.get(schools_path)
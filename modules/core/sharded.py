@@ -0,0 +1,208 @@
+# modules/core/sharded.py
+"""
+Gesharde map-layout voor "één bestand per id" opslag (werkboekjes, blobs).
+
+Plat (oud):      <root>/<id>.json
+Gesharded:       <root>/ab/cd/<id>.json      (ab/cd = eerste tekens van het id)
+
+Zo blijft elke map klein (max 256 subdirs bij hex id's), ook bij honderd-
+duizenden bestanden; listdir, backups en rsync blijven snel.
+
+Lezen kijkt eerst gesharded, dan plat, en dan nog eens gesharded (voor het
+geval een migratie het bestand er net tussendoor verplaatste). Schrijven gaat
+altijd naar het gesharde pad en ruimt een platte kopie op. Bestaande platte
+bestanden blijven dus gewoon werken; migreren kan online, terwijl de app
+draait:
+
+    python -m modules.core.sharded status  --dir /opt/mediawize/data/workbooks
+    python -m modules.core.sharded migrate --dir /opt/mediawize/data/workbooks
+
+Migreren gebruikt link + unlink i.p.v. rename: bestaat het gesharde bestand
+al (een save was sneller), dan is de platte versie verouderd en wordt die
+alleen verwijderd, nooit eroverheen gezet.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+from .storage import _fsync_dir
+
+SHARD_DEPTH = 2     # aantal map-niveaus
+SHARD_WIDTH = 2     # tekens per niveau
+PAD = "_"           # voor id's korter dan depth * width
+
+_SAFE_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]*$")
+
+
+class ShardedDir:
+    def __init__(self, root: Path | str, suffix: str = ".json", depth: int = SHARD_DEPTH, width: int = SHARD_WIDTH):
+        self.root = Path(root)
+        self.suffix = suffix
+        self.depth = depth
+        self.width = width
+
+    # ------------------------------------------------------------
+    # Paden
+    # ------------------------------------------------------------
+    def _check(self, item_id: str) -> str:
+        if not item_id or not _SAFE_ID_RE.match(item_id):
+            raise ValueError(f"Ongeldig id: {item_id!r}")
+        return item_id
+
+    def shard_dir(self, item_id: str) -> Path:
+        key = self._check(item_id).lower().ljust(self.depth * self.width, PAD)
+        parts = [key[i * self.width:(i + 1) * self.width] for i in range(self.depth)]
+        return self.root.joinpath(*parts)
+
+    def sharded_path(self, item_id: str) -> Path:
+        return self.shard_dir(item_id) / f"{item_id}{self.suffix}"
+
+    def flat_path(self, item_id: str) -> Path:
+        return self.root / f"{self._check(item_id)}{self.suffix}"
+
+    def path(self, item_id: str) -> Path:
+        """Bestaand bestand (gesharded of plat); anders het gesharde pad voor een nieuw bestand."""
+        sharded = self.sharded_path(item_id)
+        if sharded.exists():
+            return sharded
+        flat = self.flat_path(item_id)
+        if flat.exists():
+            return flat
+        return sharded
+
+    def write_path(self, item_id: str) -> Path:
+        """Pad voor een (nieuwe versie van een) bestand: altijd gesharded."""
+        return self.sharded_path(item_id)
+
+    def discard_flat(self, item_id: str) -> None:
+        """Na het schrijven naar het gesharde pad: verouderde platte kopie weg."""
+        try:
+            self.flat_path(item_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def remove(self, item_id: str) -> bool:
+        # eerst plat: een gelijktijdige migrate_one kan de platte kopie anders
+        # nog naar het (net verwijderde) gesharde pad linken
+        removed = False
+        for path in (self.flat_path(item_id), self.sharded_path(item_id)):
+            try:
+                path.unlink()
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    # ------------------------------------------------------------
+    # Itereren
+    # ------------------------------------------------------------
+    def _is_item(self, name: str) -> bool:
+        return name.endswith(self.suffix) and not name.startswith(".")
+
+    def iter_flat(self) -> Iterator[Path]:
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.is_file() and self._is_item(entry.name):
+                        yield Path(entry.path)
+        except FileNotFoundError:
+            return
+
+    def iter_paths(self) -> Iterator[Path]:
+        """Alle bestanden, gesharded en plat (elk id één keer; gesharded wint)."""
+        seen: set[str] = set()
+        for root, dirs, files in os.walk(self.root):
+            depth = len(Path(root).relative_to(self.root).parts)
+            if depth >= self.depth:
+                dirs[:] = []
+            if depth != self.depth:
+                continue
+            for name in files:
+                if self._is_item(name):
+                    seen.add(name)
+                    yield Path(root) / name
+        for path in self.iter_flat():
+            if path.name not in seen:
+                yield path
+
+    def iter_ids(self) -> Iterator[str]:
+        for path in self.iter_paths():
+            yield path.name[: -len(self.suffix)] if self.suffix else path.name
+
+    # ------------------------------------------------------------
+    # Migratie (online)
+    # ------------------------------------------------------------
+    def migrate_one(self, flat: Path) -> bool:
+        """Verplaats één plat bestand naar zijn shard; False als het al gesharded was."""
+        item_id = flat.name[: -len(self.suffix)] if self.suffix else flat.name
+        target = self.sharded_path(item_id)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(flat, target)
+            moved = True
+        except FileExistsError:
+            moved = False  # gesharde versie is nieuwer; platte is verouderd
+        except FileNotFoundError:
+            return False   # intussen verplaatst of verwijderd
+        _fsync_dir(target.parent)
+        try:
+            flat.unlink()
+        except FileNotFoundError:
+            pass
+        return moved
+
+    def migrate(self, batch: int = 500, pause: float = 0.05) -> tuple[int, int]:
+        """Migreer alle platte bestanden in batches; geeft (verplaatst, opgeruimd) terug."""
+        moved = stale = 0
+        for i, flat in enumerate(list(self.iter_flat()), start=1):
+            try:
+                self._check(flat.name[: -len(self.suffix)] if self.suffix else flat.name)
+            except ValueError:
+                continue  # onbekende bestanden laten we staan
+            if self.migrate_one(flat):
+                moved += 1
+            else:
+                stale += 1
+            if batch and i % batch == 0:
+                _fsync_dir(self.root)
+                time.sleep(pause)  # ruimte laten voor de draaiende app
+        _fsync_dir(self.root)
+        return moved, stale
+
+    def status(self) -> dict[str, int]:
+        flat = sum(1 for _ in self.iter_flat())
+        total = sum(1 for _ in self.iter_paths())
+        return {"total": total, "flat": flat, "sharded": total - flat}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Gesharde opslagmappen (ab/cd/<id>.json)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("status", "tel platte en gesharde bestanden"),
+                            ("migrate", "verplaats platte bestanden naar shards (online)")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--dir", required=True, help="bijv. /opt/mediawize/data/workbooks")
+        p.add_argument("--suffix", default=".json")
+        if name == "migrate":
+            p.add_argument("--batch", type=int, default=500)
+            p.add_argument("--pause", type=float, default=0.05, help="seconden pauze per batch")
+    args = parser.parse_args(argv)
+
+    sharded = ShardedDir(args.dir, suffix=args.suffix)
+    if args.command == "migrate":
+        start = time.monotonic()
+        moved, stale = sharded.migrate(batch=args.batch, pause=args.pause)
+        print(f"verplaatst: {moved}, verouderde platte kopieën opgeruimd: {stale} "
+              f"({time.monotonic() - start:.1f}s)")
+    print(sharded.status())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
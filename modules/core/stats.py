@@ -0,0 +1,229 @@
+# modules/core/stats.py
+"""
+Incrementeel bijgehouden statistieken voor het admin dashboard.
+
+In plaats van users.json, teachers.json en alle werkboekjes te scannen,
+werken de events (signup, docent upsert, werkboekje opslaan/verwijderen,
+conversies) kleine tellers in DATA_DIR/stats.json bij. Het dashboard leest
+alleen dat ene (gecachte) bestand.
+
+Events zijn best-effort: een mislukte update breekt nooit de eigenlijke actie.
+Eventuele drift herstel je met een rebuild:
+
+    python -m modules.core.stats rebuild --data-dir /opt/mediawize/data
+
+Werkboekjes staan in WORKBOOK_DIR als die gezet is, anders in
+DATA_DIR/workbooks (zelfde regel als app.py / modules/workbook).
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable
+
+from .storage import FileCache, json_transaction, read_json
+
+logger = logging.getLogger(__name__)
+
+STATS_FILE = "stats.json"
+
+# groepen met per-sleutel tellers
+STUDENTS_PER_SCHOOL = "students_per_school"
+TEACHERS_PER_SCHOOL = "teachers_per_school"
+WORKBOOKS_PER_TEACHER = "workbooks_per_teacher"
+GROUPS = (STUDENTS_PER_SCHOOL, TEACHERS_PER_SCHOOL, WORKBOOKS_PER_TEACHER)
+
+# totalen
+TOTALS = "totals"
+TOTAL_KEYS = ("students", "teachers", "workbooks", "storage_bytes", "conversions", "docx_builds")
+# niet af te leiden uit de data; blijven behouden bij een rebuild
+EVENT_ONLY_KEYS = ("conversions", "docx_builds")
+
+
+def empty_stats() -> dict[str, Any]:
+    return {
+        TOTALS: {k: 0 for k in TOTAL_KEYS},
+        STUDENTS_PER_SCHOOL: {},
+        TEACHERS_PER_SCHOOL: {},
+        WORKBOOKS_PER_TEACHER: {},
+        "updated_at": None,
+        "rebuilt_at": None,
+    }
+
+
+def _normalize(data: Any) -> dict[str, Any]:
+    stats = empty_stats()
+    if isinstance(data, dict):
+        stats[TOTALS].update({k: int(v) for k, v in (data.get(TOTALS) or {}).items() if k in TOTAL_KEYS})
+        for group in GROUPS:
+            stats[group].update({k: int(v) for k, v in (data.get(group) or {}).items()})
+        stats["updated_at"] = data.get("updated_at")
+        stats["rebuilt_at"] = data.get("rebuilt_at")
+    return stats
+
+
+def stats_path(data_dir: Path | str) -> Path:
+    return Path(data_dir) / STATS_FILE
+
+
+_cache: FileCache[dict[str, Any]] = FileCache(_normalize, dict)
+
+
+def read_stats(data_dir: Path | str) -> dict[str, Any]:
+    """Precomputed aggregaten (per proces gecacht tot stats.json verandert)."""
+    return copy.deepcopy(_cache.get(stats_path(data_dir)))
+
+
+def record(data_dir: Path | str, changes: Iterable[tuple[str, str | None, int]]) -> None:
+    """
+    Pas tellers aan. Elke change is (groep, sleutel, delta):
+    - (TOTALS, "students", 1)
+    - (TEACHERS_PER_SCHOOL, school_id, -1)
+    Tellers die op 0 uitkomen verdwijnen uit de per-sleutel groepen.
+    """
+    changes = [(g, k, d) for g, k, d in changes if d and k]
+    if not changes:
+        return
+    try:
+        with json_transaction(stats_path(data_dir), dict) as txn:
+            stats = _normalize(txn.data)
+            for group, key, delta in changes:
+                bucket = stats[group]
+                value = int(bucket.get(key, 0)) + int(delta)
+                if group == TOTALS:
+                    bucket[key] = max(0, value)
+                elif value > 0:
+                    bucket[key] = value
+                else:
+                    bucket.pop(key, None)
+            stats["updated_at"] = datetime.utcnow().isoformat() + "Z"
+            txn.data = stats
+    except Exception:
+        logger.exception("Stats bijwerken mislukt: %s", changes)
+
+
+# ------------------------------------------------------------
+# Event helpers
+# ------------------------------------------------------------
+def student_added(data_dir: Path | str, school_id: str | None, count: int = 1) -> None:
+    record(data_dir, [(TOTALS, "students", count), (STUDENTS_PER_SCHOOL, school_id, count)])
+
+
+def teacher_added(data_dir: Path | str, school_id: str | None) -> None:
+    record(data_dir, [(TOTALS, "teachers", 1), (TEACHERS_PER_SCHOOL, school_id, 1)])
+
+
+def teacher_moved(data_dir: Path | str, old_school_id: str | None, new_school_id: str | None) -> None:
+    if old_school_id == new_school_id:
+        return
+    record(data_dir, [(TEACHERS_PER_SCHOOL, old_school_id, -1), (TEACHERS_PER_SCHOOL, new_school_id, 1)])
+
+
+def workbook_saved(data_dir: Path | str, user_id: str | None, size_bytes: int) -> None:
+    record(data_dir, [
+        (TOTALS, "workbooks", 1),
+        (TOTALS, "storage_bytes", size_bytes),
+        (WORKBOOKS_PER_TEACHER, user_id, 1),
+    ])
+
+
+def workbook_deleted(data_dir: Path | str, user_id: str | None, size_bytes: int) -> None:
+    record(data_dir, [
+        (TOTALS, "workbooks", -1),
+        (TOTALS, "storage_bytes", -size_bytes),
+        (WORKBOOKS_PER_TEACHER, user_id, -1),
+    ])
+
+
+def conversion_done(data_dir: Path | str, kind: str = "conversions") -> None:
+    record(data_dir, [(TOTALS, kind, 1)])
+
+
+# ------------------------------------------------------------
+# Rebuild
+# ------------------------------------------------------------
+def _iter_workbook_files(workbooks_dir: Path) -> Iterable[Path]:
+    if not workbooks_dir.is_dir():
+        return
+    for root, _dirs, files in os.walk(workbooks_dir):
+        for name in files:
+            if name.endswith(".json") and not name.startswith("."):
+                yield Path(root) / name
+
+
+def default_workbooks_dir(data_dir: Path | str) -> Path:
+    """WORKBOOK_DIR uit de omgeving, anders DATA_DIR/workbooks."""
+    return Path(os.environ.get("WORKBOOK_DIR") or Path(data_dir) / "workbooks")
+
+
+def rebuild(data_dir: Path | str, workbooks_dir: Path | str | None = None) -> dict[str, Any]:
+    """Herbereken alle aggregaten vanaf de brondata (conversie-tellers blijven behouden)."""
+    data_dir = Path(data_dir)
+    workbooks_dir = Path(workbooks_dir) if workbooks_dir else default_workbooks_dir(data_dir)
+    stats = empty_stats()
+
+    users = read_json(data_dir / "users.json", dict)
+    for user in users.values() if isinstance(users, dict) else []:
+        if isinstance(user, dict) and user.get("role") == "leerling":
+            stats[TOTALS]["students"] += 1
+            sid = user.get("school_id")
+            if sid:
+                stats[STUDENTS_PER_SCHOOL][sid] = stats[STUDENTS_PER_SCHOOL].get(sid, 0) + 1
+
+    for teacher in read_json(data_dir / "teachers.json", list):
+        if not isinstance(teacher, dict):
+            continue
+        stats[TOTALS]["teachers"] += 1
+        sid = teacher.get("school_id")
+        if sid:
+            stats[TEACHERS_PER_SCHOOL][sid] = stats[TEACHERS_PER_SCHOOL].get(sid, 0) + 1
+
+    for path in _iter_workbook_files(workbooks_dir):
+        try:
+            size = path.stat().st_size
+            owner = (read_json(path, dict) or {}).get("user_id")
+        except OSError:
+            continue
+        stats[TOTALS]["workbooks"] += 1
+        stats[TOTALS]["storage_bytes"] += size
+        if owner:
+            stats[WORKBOOKS_PER_TEACHER][owner] = stats[WORKBOOKS_PER_TEACHER].get(owner, 0) + 1
+
+    now = datetime.utcnow().isoformat() + "Z"
+    with json_transaction(stats_path(data_dir), dict) as txn:
+        old = _normalize(txn.data)
+        for key in EVENT_ONLY_KEYS:
+            stats[TOTALS][key] = old[TOTALS][key]
+        stats["updated_at"] = now
+        stats["rebuilt_at"] = now
+        txn.data = stats
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Mediawize statistieken")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="herbereken stats.json vanaf de brondata")
+    p_rebuild.add_argument("--data-dir", default=os.environ.get("DATA_DIR", "/opt/mediawize/data"))
+    p_rebuild.add_argument("--workbooks-dir", default=None,
+                           help="default: $WORKBOOK_DIR, anders <data-dir>/workbooks")
+    sub.add_parser("show", help="toon stats.json").add_argument(
+        "--data-dir", default=os.environ.get("DATA_DIR", "/opt/mediawize/data"))
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        stats = rebuild(args.data_dir, args.workbooks_dir)
+    else:
+        stats = read_stats(args.data_dir)
+    print(json.dumps(stats[TOTALS] if args.command == "rebuild" else stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# modules/core/storage.py
+"""
+Gedeelde schrijf-laag voor de JSON databestanden (users.json, schools.json,
+teachers.json, workbooks).
+
+- Schrijven gaat via temp-bestand + fsync + atomic rename, zodat lezers nooit
+  een half geschreven bestand zien.
+- Read-modify-write gaat onder een fcntl advisory lock (één .lock bestand per
+  databestand), zodat gunicorn workers elkaars updates niet overschrijven.
+- Lock acquisitie en het lezen van (legacy) half geschreven bestanden gebeurt
+  met retry + exponential backoff.
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Generic, Iterator, TypeVar
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 10.0        # seconden wachten op een lock
+READ_RETRIES = 3           # extra pogingen bij onleesbare JSON
+BACKOFF_START = 0.005      # eerste wachttijd (seconden)
+BACKOFF_MAX = 0.2
+
+
+T = TypeVar("T")
+
+
+class StorageError(Exception):
+    """Basis fout voor de storage laag."""
+
+
+class StorageBusyError(StorageError):
+    """Lock kon niet binnen de timeout verkregen worden."""
+
+
+class StorageCorruptError(StorageError):
+    """Bestand bestaat maar bevat geen geldige JSON (ook niet na retries)."""
+
+
+def _backoff_delays(timeout: float) -> Iterator[float]:
+    delay = BACKOFF_START
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        yield delay
+        delay = min(delay * 2, BACKOFF_MAX)
+
+
+def _lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+@contextmanager
+def locked(path: Path | str, shared: bool = False, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """
+    Advisory lock op `path` (via `<path>.lock`), cross-process via fcntl.flock.
+    Exclusief voor schrijvers, gedeeld (shared=True) voor lezers die een
+    consistente reeks reads nodig hebben.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(_lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+    mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    wait_start = time.perf_counter()
+    try:
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            for delay in _backoff_delays(timeout):
+                time.sleep(delay)
+                try:
+                    fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    continue
+            else:
+                raise StorageBusyError(f"Lock timeout op {path}")
+        metrics.observe("mediawize_storage_seconds", time.perf_counter() - wait_start, op="lock_wait")
+        yield
+    finally:
+        # sluiten geeft de flock ook vrij
+        os.close(fd)
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_bytes_atomic(path: Path | str, data: bytes) -> None:
+    """Schrijf `data` naar temp-bestand in dezelfde map, fsync, en rename over `path`."""
+    path = Path(path)
+    start = time.perf_counter()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+    metrics.observe("mediawize_storage_seconds", time.perf_counter() - start, op="write")
+
+
+def write_json(path: Path | str, data: Any) -> None:
+    """Atomisch JSON wegschrijven (zelfde formaat als voorheen: indent=2, utf-8)."""
+    # eerst serialiseren: een fout hier laat geen temp-bestanden achter
+    payload = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    write_bytes_atomic(path, payload)
+
+
+def _read_json_strict(path: Path, default_factory: Callable[[], Any]) -> Any:
+    """
+    Lees JSON; ontbrekend of leeg bestand -> default. Onleesbare JSON wordt
+    een paar keer opnieuw geprobeerd (een legacy schrijver kan nog bezig zijn)
+    en daarna als StorageCorruptError gemeld.
+    """
+    with metrics.timed("mediawize_storage_seconds", op="read"):
+        return _read_json_retrying(path, default_factory)
+
+
+def _read_json_retrying(path: Path, default_factory: Callable[[], Any]) -> Any:
+    last_error: Exception | None = None
+    delay = BACKOFF_START
+    for attempt in range(READ_RETRIES + 1):
+        try:
+            raw = path.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return default_factory()
+        if not raw:
+            return default_factory()
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            last_error = e
+            if attempt < READ_RETRIES:
+                time.sleep(delay)
+                delay = min(delay * 2, BACKOFF_MAX)
+    raise StorageCorruptError(f"Ongeldige JSON in {path}: {last_error}")
+
+
+def read_json(path: Path | str, default_factory: Callable[[], Any] = dict, strict: bool = False) -> Any:
+    """
+    Lees een JSON databestand. Geeft `default_factory()` terug als het bestand
+    ontbreekt, leeg is of (na retries) corrupt blijft; dat laatste wordt gelogd.
+    Met strict=True wordt corrupte JSON als StorageCorruptError doorgegeven.
+    """
+    path = Path(path)
+    if strict:
+        return _read_json_strict(path, default_factory)
+    try:
+        return _read_json_strict(path, default_factory)
+    except StorageCorruptError as e:
+        # lezers: liever niet crashen (zelfde gedrag als voorheen), wel loggen
+        logger.error(str(e))
+        return default_factory()
+
+
+class JsonTransaction:
+    """Handle binnen `json_transaction`; pas `data` aan of roep `rollback()` aan."""
+
+    def __init__(self, data: Any):
+        self.data = data
+        self.rolled_back = False
+
+    def rollback(self) -> None:
+        self.rolled_back = True
+
+
+@contextmanager
+def json_transaction(
+    path: Path | str,
+    default_factory: Callable[[], Any] = dict,
+    timeout: float = LOCK_TIMEOUT,
+) -> Iterator[JsonTransaction]:
+    """
+    Read-modify-write onder exclusieve lock:
+
+        with json_transaction(users_path, dict) as txn:
+            txn.data[email] = {...}
+
+    Bij een exception of `txn.rollback()` wordt er niets geschreven. Een
+    corrupt bestand wordt nooit stilletjes overschreven (StorageCorruptError).
+    """
+    path = Path(path)
+    with locked(path, timeout=timeout):
+        txn = JsonTransaction(_read_json_strict(path, default_factory))
+        yield txn
+        if not txn.rolled_back:
+            write_json(path, txn.data)
+
+
+class FileCache(Generic[T]):
+    """
+    Per-process cache van een waarde die uit een JSON bestand wordt afgeleid
+    (bijv. een gesorteerde index). Ververst zodra het bestand verandert; door
+    de atomic rename krijgt elke write een nieuwe inode, dus (inode, mtime,
+    size) is een betrouwbare sleutel, ook als een ander proces schrijft.
+    """
+
+    def __init__(self, build: Callable[[Any], T], default_factory: Callable[[], Any] = dict):
+        self._build = build
+        self._default_factory = default_factory
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[tuple[int, int, int] | None, T]] = {}
+
+    @staticmethod
+    def _stamp(path: Path) -> tuple[int, int, int] | None:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self, path: Path | str) -> T:
+        path = Path(path)
+        key = str(path)
+        stamp = self._stamp(path)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            value = self._build(read_json(path, self._default_factory))
+            # stamp opnieuw: als er tijdens het lezen geschreven is, de volgende keer herladen
+            self._entries[key] = (stamp if stamp == self._stamp(path) else None, value)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,62 @@
+# modules/core/text_index.py
+"""
+Substring-zoeken zonder lineaire scan: trigram posting sets.
+
+Elke tekst wordt opgeknipt in alle 3-tekenreeksen ("jansen" -> jan, ans,
+nse, sen); per trigram een set met posities. Een zoekterm van 3+ tekens
+levert de doorsnede van de sets van zijn trigrammen (kleinste eerst) en elke
+kandidaat wordt daarna bevestigd met `q in tekst`. Zo vindt "jansen" ook
+"pjansen@school.nl", net als een gewone `in`, maar zonder alle teksten te
+doorlopen.
+
+Zoektermen van 1-2 tekens hebben geen trigram; die vallen terug op een
+lineaire `in` over de voorbereide teksten (ze matchen toch bijna alles).
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+GRAM = 3
+
+
+def normalize_query(q: str) -> str:
+    """Lowercase, witruimte samengevouwen (zelfde normalisatie als de teksten)."""
+    return " ".join((q or "").lower().split())
+
+
+class SubstringIndex:
+    def __init__(self, texts: Iterable[str]):
+        # velden van één item met "\n" ertussen; een query bevat nooit "\n",
+        # dus matches lopen nooit over twee velden heen
+        self.texts: list[str] = ["\n".join(normalize_query(part) for part in t.split("\n")) for t in texts]
+        grams: dict[str, set[int]] = {}
+        for pos, text in enumerate(self.texts):
+            for g in {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}:
+                grams.setdefault(g, set()).add(pos)
+        self._grams = grams
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, q: str) -> set[int]:
+        """Posities waarvan de tekst `q` (genormaliseerd) bevat."""
+        q = normalize_query(q)
+        if not q:
+            return set(range(len(self.texts)))
+        if len(q) < GRAM:
+            return {p for p, text in enumerate(self.texts) if q in text}
+
+        postings = []
+        for g in {q[i:i + GRAM] for i in range(len(q) - GRAM + 1)}:
+            found = self._grams.get(g)
+            if not found:
+                return set()
+            postings.append(found)
+        postings.sort(key=len)
+        hits = set(postings[0])
+        for s in postings[1:]:
+            hits.intersection_update(s)
+            if not hits:
+                return hits
+        texts = self.texts
+        return {p for p in hits if q in texts[p]}
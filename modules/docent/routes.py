@@ -1,7 +1,12 @@
 # modules/docent/routes.py
 from __future__ import annotations
 
-from flask import Blueprint, render_template, session, redirect, url_for
+from pathlib import Path
+
+from flask import Blueprint, current_app, render_template, request, session, redirect, url_for
+
+from modules.core.admission import admission_controlled
+from modules.core.bulk_import import MAX_CSV_BYTES, decode_csv, import_students, parse_students_csv
 
 bp = Blueprint("docent", __name__, url_prefix="/docent")
 
@@ -29,3 +34,60 @@ def dashboard():
         page_title=brand_name,
         active_tab="docent",
     )
+
+
+@bp.get("/leerlingen/import")
+def leerlingen_import():
+    guard = _login_required_docent()
+    if guard:
+        return guard
+
+    return render_template(
+        "docent/leerlingen_import.html",
+        page_title="Leerlingen importeren",
+        active_tab="docent",
+        results=None,
+        error=None,
+    )
+
+
+@bp.post("/leerlingen/import")
+def leerlingen_import_post():
+    guard = _login_required_docent()
+    if guard:
+        return guard
+    return _leerlingen_import()
+
+
+# pas na de guard: alleen ingelogde docenten wachten op een import-plek
+@admission_controlled("import")
+def _leerlingen_import():
+    def _render(results=None, error=None):
+        return render_template(
+            "docent/leerlingen_import.html",
+            page_title="Leerlingen importeren",
+            active_tab="docent",
+            results=results,
+            error=error,
+        )
+
+    f = request.files.get("file")
+    if not f or not f.filename:
+        return _render(error="Kies een CSV-bestand.")
+
+    raw = f.read(MAX_CSV_BYTES + 1)
+    if len(raw) > MAX_CSV_BYTES:
+        return _render(error="Bestand is te groot (maximaal 2MB).")
+
+    text = decode_csv(raw)
+
+    rows, errors = parse_students_csv(text)
+
+    # leerlingen komen bij de school van de docent
+    school = session.get("school") if isinstance(session.get("school"), dict) else None
+    school_id = (school or {}).get("id") or ""
+
+    data_dir = Path(current_app.config.get("DATA_DIR", "/opt/mediawize/data"))
+    results = import_students(data_dir / "users.json", rows, school_id=school_id) if rows else []
+
+    return _render(results=sorted(results + errors, key=lambda r: r["line"]))
@@ -5,9 +5,10 @@ import os
 import tempfile
 from functools import wraps
 
-from flask import Blueprint, render_template, request, session, redirect, url_for
+from flask import Blueprint, current_app, render_template, request, session, redirect, url_for
 
-from .converter import docx_to_html
+from modules.core import metrics, stats
+from modules.core.admission import admission_controlled
 
 bp = Blueprint("html_tool", __name__, url_prefix="/html")
 
@@ -58,6 +59,7 @@ def index_get():
 @bp.post("/")
 @login_required
 @role_required("docent")
+@admission_controlled("docx")
 def index_post():
     if "file" not in request.files:
         return render_template(
@@ -94,7 +96,12 @@ def index_post():
             f.save(tmp.name)
             tmp_path = tmp.name
 
-        html = docx_to_html(tmp_path)
+        # lazy: python-docx/lxml alleen laden in workers die echt converteren
+        from .converter import docx_to_html
+
+        with metrics.timed("mediawize_docx_seconds", kind="html_conversion"):
+            html = docx_to_html(tmp_path)
+        stats.conversion_done(current_app.config.get("DATA_DIR", "/opt/mediawize/data"))
 
         return render_template(
             "html_tool/index.html",
@@ -1,10 +1,40 @@
-# modules/docent/routes.py
+# modules/toetsen/docent_routes.py
 from __future__ import annotations
 
+import json
+import os
+import threading
+import time
 from functools import wraps
-from flask import Blueprint, render_template, session, redirect, url_for
+from pathlib import Path
 
-bp = Blueprint("docent", __name__, url_prefix="/docent")
+from flask import (
+    Blueprint, Response, abort, current_app, flash, jsonify, render_template, request, session,
+    redirect, stream_with_context, url_for,
+)
+
+# grading (numpy) en pdf_export (multiprocessing) pas laden bij de eerste
+# resultatenpagina; de rest van de app heeft ze niet nodig
+from .question_bank import QuestionBank
+from .storage import ToetsStorage, answered_count
+
+bp = Blueprint("toetsen_docent", __name__, url_prefix="/docent/toetsen")
+
+# Live voortgang (SSE). De stream pollt het eventlog met time.sleep en houdt
+# dus zolang hij open is een worker-thread bezet. De defaults passen bij
+# gunicorn sync workers (één request per proces, --timeout 30): één stream per
+# worker en na SSE_MAX_LIFETIME seconden netjes sluiten, ruim binnen de
+# timeout. De browser verbindt na `retry` opnieuw met Last-Event-ID en mist
+# niets. Alleen met gthread (--threads N) of gevent workers mag
+# SSE_MAX_PER_WORKER omhoog (bijv. 8) en SSE_MAX_LIFETIME langer (bijv. 600).
+# Boven het maximum: 503 en de pagina probeert het later opnieuw.
+SSE_MAX_PER_WORKER = int(os.environ.get("SSE_MAX_PER_WORKER", "1"))
+SSE_MAX_LIFETIME = float(os.environ.get("SSE_MAX_LIFETIME", "25"))
+SSE_POLL_INTERVAL = 1.0      # seconden tussen stat() van het eventlog
+SSE_HEARTBEAT = 10.0         # comment-regel zodat proxies de stream open houden
+SSE_RETRY_MS = 3000
+
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_PER_WORKER)
 
 
 # ------------------------------------------------------------
@@ -31,34 +61,252 @@ def role_required(role: str):
 
 
 # ------------------------------------------------------------
-# Dashboard
-# Endpoint: docent.dashboard
-# Route: /docent/
+# Helpers
+# ------------------------------------------------------------
+def _storage() -> ToetsStorage:
+    return ToetsStorage(Path(current_app.config.get("DATA_DIR", "/opt/mediawize/data")) / "toetsen")
+
+
+def _docent() -> str:
+    u = session.get("user")
+    if isinstance(u, dict):
+        return (u.get("email") or "").strip().lower()
+    return (u or "").strip().lower()
+
+
+def _bank() -> QuestionBank:
+    return QuestionBank(_storage().root, _docent())
+
+
+def _own_toets(toets_id: str) -> dict:
+    toets = _storage().load_toets(toets_id)
+    if not toets or (toets.get("owner") or "").lower() != _docent():
+        abort(404)
+    return toets
+
+
+# ------------------------------------------------------------
+# Toetsen overzicht docent
+# Endpoint: toetsen_docent.overzicht
+# Route: /docent/toetsen/
 # ------------------------------------------------------------
 @bp.get("/")
 @login_required
 @role_required("docent")
-def dashboard():
-    school = session.get("school") if isinstance(session.get("school"), dict) else None
-    brand_name = (school.get("name") if school else None) or "Docent dashboard"
+def overzicht():
+    return render_template(
+        "toetsen/docent_overzicht.html",
+        active_tab="toetsen",
+        page_title="Toetsen",
+        toetsen=_storage().list_toetsen(owner=_docent()),
+    )
+
+
+# ------------------------------------------------------------
+# Resultaten + itemanalyse van één toets
+# Route: /docent/toetsen/<toets_id>/resultaten
+# ------------------------------------------------------------
+@bp.get("/<toets_id>/resultaten")
+@login_required
+@role_required("docent")
+def resultaten(toets_id: str):
+    from .grading import grade
+
+    toets = _own_toets(toets_id)
+    sessions = list(_storage().iter_sessions(toets_id))
+    result = grade(toets, sessions)
+    questions = {str(q.get("id")): q for q in toets.get("questions") or []}
 
     return render_template(
-        "docent/dashboard.html",
-        active_tab="docent",
-        page_title=brand_name,
+        "docent/toets_overzicht.html",
+        active_tab="toetsen",
+        page_title=toets.get("title") or "Resultaten",
+        toets=toets,
+        result=result,
+        questions=questions,
+        open_sessions=sum(1 for s in sessions if not s.get("submitted_at")),
+    )
+
+
+# ------------------------------------------------------------
+# Resultaten als ZIP met PDFs (klasoverzicht + per leerling), gestreamd
+# Route: /docent/toetsen/<toets_id>/resultaten.zip
+# ------------------------------------------------------------
+@bp.get("/<toets_id>/resultaten.zip")
+@login_required
+@role_required("docent")
+def resultaten_zip(toets_id: str):
+    from .grading import grade
+    from .pdf_export import iter_results_zip
+
+    toets = _own_toets(toets_id)
+    sessions = [s for s in _storage().iter_sessions(toets_id) if s.get("submitted_at")]
+    result = grade(toets, sessions)
+
+    filename = f"resultaten-{toets.get('code') or toets_id}.zip"
+    return Response(
+        stream_with_context(iter_results_zip(toets, result, sessions)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
 # ------------------------------------------------------------
-# (Placeholder) Toetsen pagina docent
-# Route: /docent/toetsen
+# Live voortgang via Server-Sent Events
+# Route: /docent/toetsen/<toets_id>/live
+# Event id = byte-offset in het eventlog; bij reconnect stuurt de browser
+# Last-Event-ID en krijgt hij alleen wat daarna gebeurd is.
 # ------------------------------------------------------------
-@bp.get("/toetsen")
+def _sse(event: str, data: object, event_id: int | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _live_stream(storage: ToetsStorage, toets_id: str, last_id: int | None):
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+
+    if last_id is None:
+        # offset vóór het lezen van de sessies: events daartussen komen dubbel
+        # binnen, maar die zijn idempotent (client zet gewoon de stand)
+        offset = storage.events_offset(toets_id)
+        students = [
+            {
+                "student": s.get("student"),
+                "answered": answered_count(s),
+                "submitted": bool(s.get("submitted_at")),
+            }
+            for s in storage.iter_sessions(toets_id)
+        ]
+        yield _sse("snapshot", {"students": students}, offset)
+    else:
+        offset = last_id
+
+    # poll en heartbeat hebben elk hun eigen timer; slapen tot de eerstvolgende,
+    # zodat de heartbeat op tijd komt, los van het poll-interval
+    now = time.monotonic()
+    end = now + SSE_MAX_LIFETIME
+    next_poll, next_beat = now, now + SSE_HEARTBEAT
+    while now < end:
+        if now >= next_poll:
+            # alleen een stat(); het log wordt pas gelezen als het gegroeid is
+            if storage.events_offset(toets_id) > offset:
+                events, offset = storage.read_events(toets_id, offset)
+                for event_id, event in events:
+                    yield _sse(event.get("type", "progress"), event, event_id)
+                next_beat = time.monotonic() + SSE_HEARTBEAT
+            next_poll = time.monotonic() + SSE_POLL_INTERVAL
+
+        if time.monotonic() >= next_beat:
+            yield ": ping\n\n"
+            next_beat = time.monotonic() + SSE_HEARTBEAT
+
+        time.sleep(max(0.0, min(next_poll, next_beat, end) - time.monotonic()))
+        now = time.monotonic()
+
+
+@bp.get("/<toets_id>/live")
 @login_required
 @role_required("docent")
-def toetsen_overzicht():
+def live(toets_id: str):
+    _own_toets(toets_id)
+    raw_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    last_id = int(raw_id) if raw_id and raw_id.isdigit() else None
+
+    if not _sse_slots.acquire(blocking=False):
+        return Response(
+            f"retry: {SSE_RETRY_MS * 5}\n\n",
+            status=503,
+            mimetype="text/event-stream",
+            headers={"Retry-After": str(SSE_RETRY_MS * 5 // 1000)},
+        )
+
+    released = threading.Event()
+
+    def release() -> None:
+        if not released.is_set():
+            released.set()
+            _sse_slots.release()
+
+    resp = Response(
+        stream_with_context(_live_stream(_storage(), toets_id, last_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # ook als de stream nooit gestart wordt (client weg) de slot vrijgeven
+    resp.call_on_close(release)
+    return resp
+
+
+# ------------------------------------------------------------
+# Vragenbank
+# Route: /docent/toetsen/vragenbank?q=breuken vak:wiskunde tag:h2
+# ------------------------------------------------------------
+@bp.get("/vragenbank")
+@login_required
+@role_required("docent")
+def vragenbank():
+    q = (request.args.get("q") or "").strip()
     return render_template(
-        "toetsen/docent_overzicht.html",
+        "toetsen/vragenbank.html",
         active_tab="toetsen",
-        page_title="Toetsen",
+        page_title="Vragenbank",
+        q=q,
+        questions=_bank().search(q, limit=50),
     )
+
+
+@bp.get("/vragenbank/zoeken")
+@login_required
+@role_required("docent")
+def vragenbank_zoeken():
+    q = (request.args.get("q") or "").strip()
+    return jsonify([
+        {"id": v["id"], "text": v.get("text"), "vak": v.get("vak"), "tags": v.get("tags") or []}
+        for v in _bank().search(q)
+    ])
+
+
+@bp.post("/vragenbank")
+@login_required
+@role_required("docent")
+def vragenbank_opslaan():
+    text = (request.form.get("text") or "").strip()
+    if not text:
+        flash("Vul een vraag in.", "error")
+        return redirect(url_for("toetsen_docent.vragenbank"))
+
+    options = [o.strip() for o in (request.form.get("options") or "").splitlines() if o.strip()]
+    try:
+        points = max(0.0, float((request.form.get("points") or "1").replace(",", ".")))
+    except ValueError:
+        points = 1.0
+    question = {
+        "id": request.form.get("id") or None,
+        "type": "mc" if options else "open",
+        "text": text,
+        "options": options,
+        "answer": (request.form.get("answer") or "").strip() or None,
+        "points": points,
+        "vak": (request.form.get("vak") or "").strip(),
+        "tags": [t.strip() for t in (request.form.get("tags") or "").split(",") if t.strip()],
+    }
+    if question["id"] and not _bank().get(question["id"]):
+        abort(404)
+    try:
+        _bank().save(question)
+    except ValueError:
+        abort(400)
+    flash("Vraag opgeslagen.", "ok")
+    return redirect(url_for("toetsen_docent.vragenbank", q=request.args.get("q", "")))
+
+
+@bp.post("/vragenbank/<qid>/verwijderen")
+@login_required
+@role_required("docent")
+def vragenbank_verwijderen(qid: str):
+    try:
+        removed = _bank().delete(qid)
+    except ValueError:
+        abort(404)
+    flash("Vraag verwijderd." if removed else "Vraag niet gevonden.", "ok" if removed else "error")
+    return redirect(url_for("toetsen_docent.vragenbank"))
@@ -0,0 +1,176 @@
+# modules/toetsen/grading.py
+"""
+Nakijken en itemanalyse voor toetsen.
+
+Alle ingeleverde sessies van een toets gaan in één matrix (leerlingen x
+vragen); scores, p-waarden, item-rest correlaties en de scoreverdeling
+worden daarna in een paar NumPy bewerkingen berekend in plaats van per
+leerling per vraag in Python.
+
+Automatisch nakijken:
+- mc:   antwoord == q["answer"] (optietekst)
+- open: alleen als q["answer"] gezet is; vergelijking zonder hoofdletters en
+        overtollige spaties. Open vragen zonder antwoordmodel tellen niet mee
+        (die worden handmatig nagekeken).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+import numpy as np
+
+N_TERM = 1.0  # normering: cijfer = 9 * score / max + N (begrensd op 1..10)
+
+
+@dataclass
+class ItemStats:
+    question_id: str
+    max_points: float
+    mean: float
+    p_value: float          # gemiddelde fractie van de punten (moeilijkheid)
+    item_rest: float | None  # correlatie item vs. rest van de toets (discriminatie)
+
+
+@dataclass
+class GradeResult:
+    students: list[str]
+    question_ids: list[str]
+    scores: np.ndarray       # (leerlingen x vragen) behaalde punten
+    totals: np.ndarray       # (leerlingen,)
+    grades: np.ndarray       # (leerlingen,) cijfer 1..10
+    max_total: float
+    items: list[ItemStats]
+    distribution: list[tuple[str, int]]
+    manual_questions: list[str] = field(default_factory=list)
+
+    @property
+    def mean(self) -> float:
+        return float(self.totals.mean()) if self.totals.size else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(self.totals.std()) if self.totals.size else 0.0
+
+    def rows(self) -> list[dict[str, Any]]:
+        """Per leerling: e-mail, totaal en cijfer (voor tabellen en exports)."""
+        return [
+            {"student": s, "total": float(t), "grade": float(g)}
+            for s, t, g in zip(self.students, self.totals, self.grades)
+        ]
+
+
+def _norm(value: Any) -> str:
+    return " ".join(str(value).split()).lower() if value is not None else ""
+
+
+def _hashable(value: Any) -> Any:
+    # antwoorden zijn strings, maar oude sessies kunnen lijsten/dicts bevatten
+    return value if value is None or isinstance(value, (str, int, float)) else str(value)
+
+
+def gradable_questions(toets: dict[str, Any]) -> tuple[list[dict[str, Any]], list[str]]:
+    """(automatisch na te kijken vragen, id's van handmatige vragen)."""
+    auto, manual = [], []
+    for q in toets.get("questions") or []:
+        if q.get("answer") not in (None, ""):
+            auto.append(q)
+        else:
+            manual.append(str(q.get("id")))
+    return auto, manual
+
+
+def _item_rest(scores: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    """Pearson correlatie per kolom tussen item en (totaal - item), gevectoriseerd."""
+    rest = totals[:, None] - scores
+    x = scores - scores.mean(axis=0)
+    y = rest - rest.mean(axis=0)
+    num = (x * y).sum(axis=0)
+    den = np.sqrt((x * x).sum(axis=0) * (y * y).sum(axis=0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def _distribution(totals: np.ndarray, max_total: float, bins: int = 10) -> list[tuple[str, int]]:
+    if max_total <= 0:
+        return []
+    if max_total <= 20 and float(max_total).is_integer():
+        edges = np.arange(0, max_total + 2) - 0.5
+        counts, _ = np.histogram(totals, bins=edges)
+        return [(f"{i}", int(c)) for i, c in enumerate(counts)]
+    edges = np.linspace(0, max_total, bins + 1)
+    counts, _ = np.histogram(totals, bins=edges)
+    return [(f"{edges[i]:g}-{edges[i + 1]:g}", int(c)) for i, c in enumerate(counts)]
+
+
+def _correct_matrix(sessions: list[dict[str, Any]], qids: list[str], keys: list[str]) -> np.ndarray:
+    """
+    (leerlingen x vragen) bool matrix: antwoord gelijk aan het antwoordmodel.
+
+    Veel leerlingen geven dezelfde antwoorden (zeker bij mc), dus normaliseren
+    we elk verschillend antwoord maar één keer: de matrix bevat integer codes
+    per ruw antwoord, en nakijken is daarna één vergelijking op codes.
+    """
+    shape = (len(sessions), len(qids))
+    if not shape[0] or not shape[1]:
+        return np.zeros(shape, dtype=bool)
+    raw_codes: dict[Any, int] = {None: 0}
+    flat = np.fromiter(
+        (raw_codes.setdefault(_hashable(a.get(q)), len(raw_codes))
+         for s in sessions for a in (s.get("answers") or {},) for q in qids),
+        dtype=np.int64, count=shape[0] * shape[1],
+    )
+    # ruwe code -> code van het genormaliseerde antwoord ("  A " en "a" worden gelijk)
+    norm_codes: dict[str, int] = {}
+    lookup = np.empty(len(raw_codes), dtype=np.int64)
+    for raw, code in raw_codes.items():
+        lookup[code] = norm_codes.setdefault(_norm(raw), len(norm_codes))
+    codes = lookup[flat].reshape(shape)
+    key_codes = np.array([norm_codes.get(k, -1) for k in keys], dtype=np.int64)
+    return codes == key_codes[None, :]
+
+
+def grade(toets: dict[str, Any], sessions: Iterable[dict[str, Any]], submitted_only: bool = True) -> GradeResult:
+    """Kijk alle sessies van een toets na en bereken de itemanalyse."""
+    questions, manual = gradable_questions(toets)
+    qids = [str(q.get("id")) for q in questions]
+    sessions = [s for s in sessions if s.get("submitted_at") or not submitted_only]
+    students = [s.get("student") or "" for s in sessions]
+
+    points = np.array([float(q.get("points", 1) or 0) for q in questions], dtype=float)
+    correct = _correct_matrix(sessions, qids, [_norm(q.get("answer")) for q in questions])
+    scores = correct.astype(float) * points[None, :]
+    totals = scores.sum(axis=1)
+    max_total = float(points.sum())
+
+    if max_total > 0:
+        grades = np.clip(9.0 * totals / max_total + N_TERM, 1.0, 10.0).round(1)
+    else:
+        grades = np.zeros_like(totals)
+
+    items: list[ItemStats] = []
+    if len(sessions):
+        means = scores.mean(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            p_values = np.where(points > 0, means / points, np.nan)
+        rir = _item_rest(scores, totals) if len(sessions) > 2 else np.full(len(qids), np.nan)
+        for j, qid in enumerate(qids):
+            items.append(ItemStats(
+                question_id=qid,
+                max_points=float(points[j]),
+                mean=float(means[j]),
+                p_value=float(p_values[j]),
+                item_rest=None if np.isnan(rir[j]) else float(rir[j]),
+            ))
+
+    return GradeResult(
+        students=students,
+        question_ids=qids,
+        scores=scores,
+        totals=totals,
+        grades=grades,
+        max_total=max_total,
+        items=items,
+        distribution=_distribution(totals, max_total),
+        manual_questions=manual,
+    )
@@ -2,9 +2,22 @@
 from __future__ import annotations
 
 from functools import wraps
-from flask import Blueprint, render_template, session, redirect, url_for
+from pathlib import Path
 
-bp = Blueprint("leerling", __name__, url_prefix="/leerling")
+from flask import (
+    Blueprint, abort, current_app, flash, jsonify, redirect, render_template,
+    request, session, url_for,
+)
+
+from .shuffle import shuffled_questions
+from .storage import SessionSubmitted, ToetsStorage, VersionConflict
+
+bp = Blueprint("toetsen_leerling", __name__, url_prefix="/leerling/toets")
+
+# grenzen voor één autosave patch
+MAX_PATCH_ANSWERS = 200
+MAX_ANSWER_CHARS = 20_000
+MAX_PATCH_ID_CHARS = 64
 
 
 # ------------------------------------------------------------
@@ -32,33 +45,187 @@ def role_required(role: str):
 
 
 # ------------------------------------------------------------
-# Dashboard
-# Endpoint: leerling.dashboard
-# Route: /leerling
+# Helpers
+# ------------------------------------------------------------
+def _storage() -> ToetsStorage:
+    return ToetsStorage(Path(current_app.config.get("DATA_DIR", "/opt/mediawize/data")) / "toetsen")
+
+
+def _student() -> str:
+    u = session.get("user")
+    if isinstance(u, dict):
+        return (u.get("email") or "").strip().lower()
+    return (u or "").strip().lower()
+
+
+def _load_toets(toets_id: str) -> dict:
+    toets = _storage().load_toets(toets_id)
+    if not toets:
+        abort(404)
+    return toets
+
+
+def _is_closed(toets: dict) -> bool:
+    return toets.get("status") == "closed"
+
+
+def _question_ids(toets: dict) -> set[str]:
+    return {str(q.get("id")) for q in toets.get("questions") or [] if q.get("id") is not None}
+
+
+# ------------------------------------------------------------
+# Toetscode invoeren
+# Endpoint: toetsen_leerling.toets_maken
+# Route: /leerling/toets/
 # ------------------------------------------------------------
 @bp.get("/")
 @login_required
 @role_required("leerling")
-def dashboard():
+def toets_maken():
     return render_template(
-        "leerling/dashboard.html",
-        active_tab="leerling",
-        page_title="Leerling dashboard",
+        "toetsen/leerling_toets.html",
+        active_tab="toets_maken",
+        page_title="Toets maken",
     )
 
 
 # ------------------------------------------------------------
-# (Placeholder) Toets maken
-# Route: /leerling/toets
+# Toetscode -> toets (via de code-index, zonder alle toetsen te scannen)
+# Route: POST /leerling/toets/start
 # ------------------------------------------------------------
-@bp.get("/toets")
+@bp.post("/start")
 @login_required
 @role_required("leerling")
-def toets_maken():
-    # Later: toetscode invoer + random volgorde + verzenden
+def start():
+    code = (request.form.get("code") or "").strip()
+    toets_id = _storage().resolve_code(code)
+    toets = _storage().load_toets(toets_id) if toets_id else None
+    if not toets:
+        flash("Onbekende toetscode. Controleer de code en probeer het opnieuw.", "error")
+        return redirect(url_for("toetsen_leerling.toets_maken"))
+    return redirect(url_for("toetsen_leerling.toets_invullen", toets_id=toets_id))
+
+
+# ------------------------------------------------------------
+# Toets invullen
+# Route: /leerling/toets/<toets_id>
+# ------------------------------------------------------------
+@bp.get("/<toets_id>")
+@login_required
+@role_required("leerling")
+def toets_invullen(toets_id: str):
+    toets = _load_toets(toets_id)
+    storage = _storage()
+    student = _student()
+
+    state = storage.load_session(toets_id, student)
+    if state is None:
+        if _is_closed(toets):
+            flash("Deze toets is gesloten.", "error")
+            return redirect(url_for("toetsen_leerling.toets_maken"))
+        state = storage.start_session(toets_id, student)
+
     return render_template(
-        "toetsen/leerling_toets.html",
+        "leerling/toets_maken.html",
         active_tab="toets_maken",
-        page_title="Toets maken",
+        page_title=toets.get("title") or "Toets",
+        toets=toets,
+        # volgorde per leerling, elke keer identiek herberekend
+        questions=shuffled_questions(toets, student),
+        answers=state.get("answers") or {},
+        version=state.get("seq", 0),
+        submitted=bool(state.get("submitted_at")),
+        closed=_is_closed(toets),
     )
 
+
+# ------------------------------------------------------------
+# Autosave: alleen gewijzigde antwoorden sinds de laatst bevestigde versie
+# Route: PATCH /leerling/toets/<toets_id>/antwoorden
+# Body: {"base_version": 12, "patch_id": "...", "answers": {"q3": "..."}}
+# ------------------------------------------------------------
+@bp.patch("/<toets_id>/antwoorden")
+def antwoorden_patch(toets_id: str):
+    # JSON endpoint: geen redirect naar de loginpagina maar een statuscode
+    if not session.get("user") or session.get("role") != "leerling":
+        return jsonify({"error": "niet ingelogd"}), 401
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "ongeldige body"}), 400
+
+    answers = body.get("answers")
+    base_version = body.get("base_version")
+    patch_id = body.get("patch_id")
+    if not isinstance(answers, dict) or len(answers) > MAX_PATCH_ANSWERS:
+        return jsonify({"error": "ongeldige antwoorden"}), 400
+    if not isinstance(base_version, int) or isinstance(base_version, bool):
+        return jsonify({"error": "base_version ontbreekt"}), 400
+    if not isinstance(patch_id, str) or not patch_id or len(patch_id) > MAX_PATCH_ID_CHARS:
+        return jsonify({"error": "patch_id ontbreekt"}), 400
+
+    toets = _load_toets(toets_id)
+    if _is_closed(toets):
+        return jsonify({"error": "gesloten", "closed": True}), 409
+    valid_ids = _question_ids(toets)
+    for qid, value in answers.items():
+        if qid not in valid_ids:
+            return jsonify({"error": f"onbekende vraag: {qid}"}), 400
+        if value is not None and (not isinstance(value, str) or len(value) > MAX_ANSWER_CHARS):
+            return jsonify({"error": f"ongeldig antwoord bij {qid}"}), 400
+
+    storage = _storage()
+    student = _student()
+    if storage.load_session(toets_id, student) is None:
+        return jsonify({"error": "toets niet gestart"}), 409
+
+    try:
+        state = storage.apply_patch(toets_id, student, answers, patch_id=patch_id, base_version=base_version)
+    except VersionConflict as e:
+        return jsonify({
+            "error": "conflict",
+            "version": e.state.get("seq", 0),
+            "answers": e.state.get("answers") or {},
+        }), 409
+    except SessionSubmitted:
+        return jsonify({"error": "ingeleverd", "submitted": True}), 409
+
+    return jsonify({"version": state.get("seq", 0)})
+
+
+# ------------------------------------------------------------
+# Inleveren (formulier bevat alle antwoorden als vangnet)
+# Route: POST /leerling/toets/<toets_id>/inleveren
+# ------------------------------------------------------------
+@bp.post("/<toets_id>/inleveren")
+@login_required
+@role_required("leerling")
+def inleveren(toets_id: str):
+    toets = _load_toets(toets_id)
+    if _is_closed(toets):
+        flash("Deze toets is gesloten; inleveren kan niet meer.", "error")
+        return redirect(url_for("toetsen_leerling.toets_invullen", toets_id=toets_id))
+    storage = _storage()
+    student = _student()
+
+    state = storage.load_session(toets_id, student)
+    if state is None:
+        return redirect(url_for("toetsen_leerling.toets_invullen", toets_id=toets_id))
+    if state.get("submitted_at"):
+        flash("Je had deze toets al ingeleverd.", "ok")
+        return redirect(url_for("toetsen_leerling.toets_invullen", toets_id=toets_id))
+
+    final = {}
+    for qid in _question_ids(toets):
+        value = request.form.get(f"q_{qid}")
+        if value is not None and state["answers"].get(qid) != value:
+            final[qid] = value[:MAX_ANSWER_CHARS]
+    try:
+        if final:
+            storage.apply_patch(toets_id, student, final)
+        storage.submit(toets_id, student)
+    except SessionSubmitted:
+        pass
+
+    flash("Je toets is ingeleverd.", "ok")
+    return redirect(url_for("toetsen_leerling.toets_invullen", toets_id=toets_id))
@@ -1 +1,328 @@
+# modules/toetsen/pdf_export.py
+"""
+PDF export van toetsresultaten: één PDF per leerling plus een klasoverzicht,
+samen als één gestreamde ZIP.
 
+- Pure Python PDF writer (Helvetica, WinAnsi, Flate gecomprimeerde pagina's);
+  geen extra dependencies.
+- Rendering gebeurt in een process pool (alle cores). Er staan nooit meer dan
+  `window` PDFs tegelijk in de wachtrij, en elke PDF gaat direct de ZIP in en
+  wordt daarna losgelaten: geheugen blijft begrensd, ook voor 200+ leerlingen.
+- De toets zelf gaat één keer per worker mee (initializer), niet per taak.
+"""
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+import re
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Iterable, Iterator
+
+PARALLEL_MIN_STUDENTS = 8  # daaronder is een pool opstarten duurder dan renderen
+
+PAGE_W, PAGE_H = 595, 842  # A4 in punten
+MARGIN = 50
+
+
+# ------------------------------------------------------------
+# Minimale PDF writer
+# ------------------------------------------------------------
+def _pdf_text(s: str) -> bytes:
+    raw = str(s).encode("cp1252", "replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class SimplePdf:
+    """Tekstregels en gevulde rechthoeken op A4, met automatische paginering."""
+
+    def __init__(self, title: str = ""):
+        self.title = title
+        self._pages: list[list[bytes]] = []
+        self._ops: list[bytes] = []
+        self.y = 0.0
+        self.new_page()
+
+    def new_page(self) -> None:
+        self._ops = []
+        self._pages.append(self._ops)
+        self.y = PAGE_H - MARGIN
+
+    def text(self, x: float, y: float, s: str, size: float = 11, bold: bool = False) -> None:
+        font = b"/F2" if bold else b"/F1"
+        self._ops.append(b"BT %s %g Tf %g %g Td (%s) Tj ET" % (font, size, x, y, _pdf_text(s)))
+
+    def rect(self, x: float, y: float, w: float, h: float, rgb: tuple[float, float, float] = (0.23, 0.51, 0.96)) -> None:
+        self._ops.append(b"%g %g %g rg %g %g %g %g re f 0 g" % (*rgb, x, y, w, h))
+
+    def _ensure(self, height: float) -> None:
+        if self.y - height < MARGIN:
+            self.new_page()
+
+    def line(self, s: str = "", size: float = 11, bold: bool = False, indent: float = 0) -> None:
+        """Schrijf tekst op de volgende regel(s); lange tekst wordt afgebroken."""
+        width = PAGE_W - 2 * MARGIN - indent
+        max_chars = max(10, int(width / (size * 0.5)))
+        lines = []
+        for para in str(s).splitlines() or [""]:
+            while len(para) > max_chars:
+                cut = para.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                lines.append(para[:cut])
+                para = para[cut:].lstrip()
+            lines.append(para)
+        for part in lines:
+            self._ensure(size * 1.4)
+            self.y -= size * 1.4
+            if part:
+                self.text(MARGIN + indent, self.y, part, size, bold)
+
+    def gap(self, height: float = 8) -> None:
+        self.y -= height
+
+    def to_bytes(self) -> bytes:
+        objects: list[bytes] = []
+
+        def add(body: bytes) -> int:
+            objects.append(body)
+            return len(objects)
+
+        catalog = add(b"")  # placeholder, pages ref volgt
+        pages = add(b"")
+        f1 = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        f2 = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        kids = []
+        for ops in self._pages:
+            content = zlib.compress(b"\n".join(ops))
+            c = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(content), content))
+            kids.append(add(
+                b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] "
+                b"/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> /Contents %d 0 R >>"
+                % (pages, PAGE_W, PAGE_H, f1, f2, c)
+            ))
+        objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages
+        objects[pages - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+        info = add(b"<< /Title (%s) /Producer (Mediawize) >>" % _pdf_text(self.title))
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for i, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        for off in offsets:
+            out += b"%010d 00000 n \n" % off
+        out += b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1, catalog, info, xref)
+        return bytes(out)
+
+
+# ------------------------------------------------------------
+# Inhoud
+# ------------------------------------------------------------
+def _fmt(x: float) -> str:
+    return f"{x:g}".replace(".", ",")
+
+
+def _grade(x: float) -> str:
+    return f"{x:.1f}".replace(".", ",")
+
+
+def render_student_pdf(toets: dict[str, Any], row: dict[str, Any]) -> bytes:
+    """
+    row: {"student", "answers", "total", "grade", "item_scores": {qid: punten}}
+    (item_scores alleen voor automatisch nagekeken vragen)
+    """
+    pdf = SimplePdf(f"{toets.get('title') or 'Toets'} - {row['student']}")
+    pdf.line(toets.get("title") or "Toets", size=18, bold=True)
+    pdf.line(row["student"], size=12)
+    pdf.line(f"Score: {_fmt(row['total'])} / {_fmt(row['max_total'])}    Cijfer: {_grade(row['grade'])}", size=12, bold=True)
+    pdf.gap(10)
+
+    answers = row.get("answers") or {}
+    item_scores = row.get("item_scores") or {}
+    for n, q in enumerate(toets.get("questions") or [], start=1):
+        qid = str(q.get("id"))
+        pdf.gap(6)
+        pdf.line(f"Vraag {n}", bold=True)
+        pdf.line(q.get("text") or "", size=10)
+        given = answers.get(qid)
+        pdf.line(f"Antwoord: {given if given not in (None, '') else '(geen antwoord)'}", size=10, indent=12)
+        if qid in item_scores:
+            points = float(q.get("points", 1) or 0)
+            mark = "goed" if item_scores[qid] > 0 else f"fout (juist: {q.get('answer')})"
+            pdf.line(f"{_fmt(item_scores[qid])} / {_fmt(points)} punt - {mark}", size=10, indent=12)
+        else:
+            pdf.line("Wordt handmatig nagekeken", size=10, indent=12)
+    return pdf.to_bytes()
+
+
+def render_class_pdf(toets: dict[str, Any], summary: dict[str, Any]) -> bytes:
+    """summary: {"rows": [...], "items": [...], "distribution": [...], "mean", "std", "max_total"}"""
+    pdf = SimplePdf(f"{toets.get('title') or 'Toets'} - klasoverzicht")
+    pdf.line(toets.get("title") or "Toets", size=18, bold=True)
+    pdf.line(f"Klasoverzicht - {datetime.now().strftime('%d-%m-%Y')}", size=12)
+    pdf.line(
+        f"{len(summary['rows'])} leerlingen, gemiddelde {_fmt(round(summary['mean'], 1))} / "
+        f"{_fmt(summary['max_total'])} (sd {_fmt(round(summary['std'], 1))})",
+        size=11,
+    )
+
+    pdf.gap(10)
+    pdf.line("Leerlingen", size=13, bold=True)
+    for r in sorted(summary["rows"], key=lambda r: r["student"]):
+        pdf.line(f"{r['student']}   {_fmt(r['total'])} pt   cijfer {_grade(r['grade'])}", size=10)
+
+    pdf.gap(10)
+    pdf.line("Itemanalyse", size=13, bold=True)
+    for n, item in enumerate(summary["items"], start=1):
+        rir = "-" if item["item_rest"] is None else _fmt(round(item["item_rest"], 2))
+        pdf.line(f"{n}. {item['question_id']}   p = {_fmt(round(item['p_value'], 2))}   item-rest = {rir}", size=10)
+
+    if summary["distribution"]:
+        pdf.gap(10)
+        pdf.line("Scoreverdeling", size=13, bold=True)
+        peak = max(c for _, c in summary["distribution"]) or 1
+        for label, count in summary["distribution"]:
+            pdf.line(f"{label}", size=9)
+            if count:
+                pdf.rect(MARGIN + 70, pdf.y, 300 * count / peak, 7)
+            pdf.text(MARGIN + 380, pdf.y, str(count), size=9)
+    return pdf.to_bytes()
+
+
+def _safe_name(s: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", s or "leerling").strip("_") or "leerling"
+
+
+def student_filename(student: str) -> str:
+    """Unieke ZIP-naam: leesbaar deel + korte hash ("a.b@x" en "a_b@x" botsen anders)."""
+    digest = hashlib.sha1((student or "").encode("utf-8")).hexdigest()[:8]
+    return f"leerlingen/{_safe_name(student)}-{digest}.pdf"
+
+
+def _render(toets: dict[str, Any], task: tuple[str, dict[str, Any]]) -> tuple[str, bytes]:
+    kind, payload = task
+    if kind == "class":
+        return "klasoverzicht.pdf", render_class_pdf(toets, payload)
+    return student_filename(payload["student"]), render_student_pdf(toets, payload)
+
+
+# ------------------------------------------------------------
+# Process pool
+# ------------------------------------------------------------
+# alleen in pool-processen gezet (initializer); nooit in het webproces, waar
+# meerdere exports tegelijk in threads kunnen draaien
+_worker_toets: dict[str, Any] | None = None
+
+
+def _init_worker(toets: dict[str, Any]) -> None:
+    global _worker_toets
+    _worker_toets = toets
+
+
+def _render_task(task: tuple[str, dict[str, Any]]) -> tuple[str, bytes]:
+    return _render(_worker_toets, task)
+
+
+def build_tasks(result: Any, sessions: Iterable[dict[str, Any]]) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Taken uit een grading.GradeResult: eerst het klasoverzicht, dan per leerling."""
+    rows = result.rows()
+    yield "class", {
+        "rows": rows,
+        "items": [vars(i) for i in result.items],
+        "distribution": result.distribution,
+        "mean": result.mean,
+        "std": result.std,
+        "max_total": result.max_total,
+    }
+    answers = {s.get("student"): s.get("answers") or {} for s in sessions}
+    for i, row in enumerate(rows):
+        yield "student", {
+            **row,
+            "max_total": result.max_total,
+            "answers": answers.get(row["student"], {}),
+            "item_scores": dict(zip(result.question_ids, result.scores[i].tolist())),
+        }
+
+
+def _render_parallel(
+    toets: dict[str, Any], tasks: Iterator[tuple[str, dict[str, Any]]], workers: int, window: int
+) -> Iterator[tuple[str, bytes]]:
+    ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(toets,))
+    queue: deque[Future] = deque()
+    try:
+        for task in tasks:
+            queue.append(pool.submit(_render_task, task))
+            if len(queue) >= window:
+                yield queue.popleft().result()
+        while queue:
+            yield queue.popleft().result()
+    finally:
+        # ook bij een afgebroken download: openstaande taken niet meer renderen
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def render_all(
+    toets: dict[str, Any],
+    tasks: Iterable[tuple[str, dict[str, Any]]],
+    n_tasks: int,
+    workers: int | None = None,
+) -> Iterator[tuple[str, bytes]]:
+    """(bestandsnaam, pdf bytes) in taakvolgorde; parallel als dat loont."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or n_tasks < PARALLEL_MIN_STUDENTS:
+        for task in tasks:
+            yield _render(toets, task)
+        return
+    yield from _render_parallel(toets, iter(tasks), workers, window=2 * workers)
+
+
+# ------------------------------------------------------------
+# Gestreamde ZIP
+# ------------------------------------------------------------
+class _ChunkSink:
+    """Write-only, niet-seekable bestand voor zipfile; chunks worden opgehaald met take()."""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buf += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def iter_results_zip(
+    toets: dict[str, Any],
+    result: Any,
+    sessions: Iterable[dict[str, Any]],
+    workers: int | None = None,
+) -> Iterator[bytes]:
+    """ZIP met klasoverzicht.pdf en leerlingen/<email>-<hash>.pdf, in chunks per bestand."""
+    sink = _ChunkSink()
+    tasks = build_tasks(result, sessions)
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        # PDF pagina's zijn al Flate gecomprimeerd; nogmaals deflaten kost alleen CPU
+        for name, data in render_all(toets, tasks, len(result.students) + 1, workers):
+            zf.writestr(name, data)
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    tail = sink.take()
+    if tail:
+        yield tail
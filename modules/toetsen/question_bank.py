@@ -0,0 +1,265 @@
+# modules/toetsen/question_bank.py
+"""
+Vragenbank per docent met een inverted index op schijf.
+
+Layout onder DATA_DIR/toetsen/bank/<owner_key>:
+
+    q/<question_id>.json     de vraag zelf (ook de "forward index": de oude
+                             termen van een vraag volgen uit het oude bestand)
+    index/<c>.json           postings {term: [question_id, ...]} voor alle
+                             termen die met teken <c> beginnen
+
+Termen: accent-gevouwen, lowercase woorden uit vraagtekst en opties (zonder
+Nederlandse stopwoorden), plus "vak:<vak>" en "tag:<tag>" voor filters en
+"_all" voor alle vragen.
+
+Opslaan/verwijderen past alleen de postings van gewijzigde termen aan (en dus
+alleen de betrokken shards). Zoeken gebruikt per proces gecachte shards:
+exacte termen zijn een dict lookup, het laatste woord matcht als prefix via
+bisect, en de kleinste postinglijst gaat eerst bij het doorsnijden. Er wordt
+nooit over alle vragen gelopen.
+
+Question id's zijn tijd-geordend, dus sorteren op id = nieuwste eerst.
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import re
+import secrets
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable
+
+from modules.core.storage import FileCache, locked, read_json, write_json
+
+SEARCH_LIMIT = 20
+MIN_TOKEN_LEN = 2
+ALL_TERM = "_all"
+
+STOPWORDS = frozenset("""
+aan al als bij dan dat de der des die dit door een en er haar het hij hoe
+ik in is je met na naar niet of om onder op over te tot uit van voor wat
+we wel wie wij zal ze zij zijn zo
+""".split())
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def fold(text: str) -> str:
+    """Lowercase en accenten weg: "Café één" -> "cafe een"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        t for t in _TOKEN_RE.findall(fold(text))
+        if len(t) >= MIN_TOKEN_LEN and t not in STOPWORDS
+    ]
+
+
+def _filter_value(value: str) -> str:
+    return "-".join(_TOKEN_RE.findall(fold(value)))
+
+
+def question_terms(q: dict[str, Any] | None) -> set[str]:
+    if not q:
+        return set()
+    parts = [q.get("text") or ""] + [str(o) for o in q.get("options") or []]
+    terms = {t for part in parts for t in tokenize(part)}
+    if q.get("vak"):
+        terms.add("vak:" + _filter_value(q["vak"]))
+    for tag in q.get("tags") or []:
+        if _filter_value(tag):
+            terms.add("tag:" + _filter_value(tag))
+    terms.add(ALL_TERM)
+    return terms
+
+
+def _shard(term: str) -> str:
+    c = term[0]
+    return c if c.isalnum() else "_"
+
+
+def _new_id() -> str:
+    return f"{time.time_ns() // 1_000_000:013x}{secrets.token_hex(4)}"
+
+
+def _safe_qid(qid: str) -> str:
+    if not qid or not all(c in "0123456789abcdef" for c in qid):
+        raise ValueError(f"Ongeldig vraag-id: {qid!r}")
+    return qid
+
+
+class _Shard:
+    """Gecachte shard: postings + gesorteerde termen voor prefix search."""
+
+    def __init__(self, data: Any):
+        self.postings: dict[str, list[str]] = data if isinstance(data, dict) else {}
+        # alleen woorden: filtertermen ("vak:…", "tag:…") delen de shard, maar mogen
+        # nooit via type-ahead matchen; die gaan alleen via de expliciete filters
+        self.terms: list[str] = sorted(t for t in self.postings if ":" not in t)
+
+    def prefix(self, prefix: str) -> set[str]:
+        out: set[str] = set()
+        i = bisect_left(self.terms, prefix)
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            out.update(self.postings[self.terms[i]])
+            i += 1
+        return out
+
+
+_shard_cache: FileCache[_Shard] = FileCache(_Shard, dict)
+
+
+class QuestionBank:
+    def __init__(self, data_dir: str | Path, owner: str):
+        owner_key = hashlib.sha1((owner or "").strip().lower().encode("utf-8")).hexdigest()[:20]
+        self.owner = (owner or "").strip().lower()
+        self.root = Path(data_dir) / "bank" / owner_key
+        self.questions_dir = self.root / "q"
+        self.index_dir = self.root / "index"
+
+    # ------------------------------------------------------------
+    # Paden / lezen
+    # ------------------------------------------------------------
+    def _question_path(self, qid: str) -> Path:
+        return self.questions_dir / f"{_safe_qid(qid)}.json"
+
+    def _shard_path(self, shard: str) -> Path:
+        return self.index_dir / f"{shard}.json"
+
+    def get(self, qid: str) -> dict[str, Any] | None:
+        try:
+            return read_json(self._question_path(qid), dict) or None
+        except ValueError:
+            return None
+
+    def _postings(self, term: str) -> list[str]:
+        return _shard_cache.get(self._shard_path(_shard(term))).postings.get(term, [])
+
+    # ------------------------------------------------------------
+    # Schrijven (incrementeel)
+    # ------------------------------------------------------------
+    def _update_index(self, qid: str, old_terms: set[str], new_terms: set[str]) -> None:
+        removed, added = old_terms - new_terms, new_terms - old_terms
+        by_shard: dict[str, list[tuple[str, bool]]] = {}
+        for term in removed:
+            by_shard.setdefault(_shard(term), []).append((term, False))
+        for term in added:
+            by_shard.setdefault(_shard(term), []).append((term, True))
+
+        for shard, changes in by_shard.items():
+            path = self._shard_path(shard)
+            postings = read_json(path, dict)
+            for term, add in changes:
+                ids = postings.setdefault(term, [])
+                i = bisect_left(ids, qid)
+                present = i < len(ids) and ids[i] == qid
+                if add and not present:
+                    insort(ids, qid)
+                elif not add and present:
+                    del ids[i]
+                if not ids:
+                    del postings[term]
+            write_json(path, postings)
+
+    def save(self, question: dict[str, Any]) -> dict[str, Any]:
+        """Nieuwe vraag of bewerking van een bestaande (zelfde id)."""
+        q = dict(question)
+        q["id"] = q.get("id") or _new_id()
+        q["owner"] = self.owner
+        q["tags"] = [t.strip() for t in q.get("tags") or [] if t and t.strip()]
+        now = datetime.utcnow().isoformat() + "Z"
+        q["updated_at"] = now
+
+        path = self._question_path(q["id"])
+        # één lock per bank: schrijvers van dezelfde docent na elkaar, lezers nooit geblokkeerd
+        with locked(self.root / "bank"):
+            old = read_json(path, dict) or None
+            q["created_at"] = (old or {}).get("created_at") or q.get("created_at") or now
+            write_json(path, q)
+            self._update_index(q["id"], question_terms(old), question_terms(q))
+        return q
+
+    def delete(self, qid: str) -> bool:
+        path = self._question_path(qid)
+        with locked(self.root / "bank"):
+            old = read_json(path, dict) or None
+            if not old:
+                return False
+            self._update_index(qid, question_terms(old), set())
+            path.unlink(missing_ok=True)
+        return True
+
+    def rebuild(self) -> int:
+        """Herstel: index opnieuw opbouwen uit de vraagbestanden (onderhoud, niet per request)."""
+        with locked(self.root / "bank"):
+            postings: dict[str, dict[str, list[str]]] = {}
+            count = 0
+            for path in sorted(self.questions_dir.glob("*.json")) if self.questions_dir.is_dir() else []:
+                q = read_json(path, dict)
+                if not q.get("id"):
+                    continue
+                count += 1
+                for term in question_terms(q):
+                    postings.setdefault(_shard(term), {}).setdefault(term, []).append(q["id"])
+            for old in self.index_dir.glob("*.json") if self.index_dir.is_dir() else []:
+                if old.stem not in postings:
+                    old.unlink()
+            for shard, data in postings.items():
+                write_json(self._shard_path(shard), {t: sorted(ids) for t, ids in data.items()})
+        return count
+
+    # ------------------------------------------------------------
+    # Zoeken
+    # ------------------------------------------------------------
+    @staticmethod
+    def parse_query(query: str) -> tuple[list[str], list[str]]:
+        """"breuken vak:wiskunde tag:h2" -> (["breuken"], ["vak:wiskunde", "tag:h2"])."""
+        words, filters = [], []
+        for part in (query or "").split():
+            key, sep, value = part.partition(":")
+            if sep and key.lower() in ("vak", "tag") and _filter_value(value):
+                filters.append(f"{key.lower()}:{_filter_value(value)}")
+            else:
+                words.append(part)
+        return tokenize(" ".join(words)), filters
+
+    def search_ids(
+        self,
+        query: str = "",
+        vak: str | None = None,
+        tags: Iterable[str] = (),
+        limit: int = SEARCH_LIMIT,
+    ) -> list[str]:
+        tokens, filters = self.parse_query(query)
+        if vak:
+            filters.append("vak:" + _filter_value(vak))
+        filters += ["tag:" + _filter_value(t) for t in tags if _filter_value(t)]
+
+        sets: list[set[str] | list[str]] = [self._postings(f) for f in filters]
+        sets += [self._postings(t) for t in tokens[:-1]]
+        if tokens:
+            last = tokens[-1]
+            # laatste woord als prefix (type-ahead): "breu" vindt "breuken"
+            sets.append(_shard_cache.get(self._shard_path(_shard(last))).prefix(last))
+        if not sets:
+            sets = [self._postings(ALL_TERM)]
+
+        sets.sort(key=len)
+        if not sets[0]:
+            return []
+        hits = set(sets[0])
+        for s in sets[1:]:
+            hits.intersection_update(s)
+            if not hits:
+                return []
+        return heapq.nlargest(limit, hits)
+
+    def search(self, query: str = "", vak: str | None = None, tags: Iterable[str] = (), limit: int = SEARCH_LIMIT) -> list[dict[str, Any]]:
+        return [q for q in (self.get(qid) for qid in self.search_ids(query, vak, tags, limit)) if q]
@@ -0,0 +1,82 @@
+# modules/toetsen/shuffle.py
+"""
+Deterministische volgorde van vragen en antwoordopties per (toets, leerling).
+
+De permutatie wordt afgeleid van sha256(toets_id, leerling, ...) en hoeft
+dus nergens opgeslagen te worden: elke pagina-load en het nakijken rekenen
+exact dezelfde volgorde uit. We gebruiken bewust niet `random.Random`: de
+uitkomst daarvan is niet gegarandeerd gelijk tussen Python versies, deze
+Fisher-Yates op een sha256 stroom wel.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Iterator, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+def _stream(*parts: str) -> Iterator[int]:
+    """Oneindige reeks 64-bit getallen uit sha256(seed || teller)."""
+    seed = hashlib.sha256("\x1f".join(parts).encode("utf-8")).digest()
+    counter = 0
+    while True:
+        block = hashlib.sha256(seed + counter.to_bytes(8, "big")).digest()
+        for i in range(0, 32, 8):
+            yield int.from_bytes(block[i:i + 8], "big")
+        counter += 1
+
+
+def _below(stream: Iterator[int], n: int) -> int:
+    # rejection sampling: geen modulo-bias
+    limit = (1 << 64) - ((1 << 64) % n)
+    while True:
+        x = next(stream)
+        if x < limit:
+            return x % n
+
+
+def permutation(n: int, *seed: str) -> list[int]:
+    """Permutatie van range(n), volledig bepaald door `seed`."""
+    order = list(range(n))
+    stream = _stream(*seed)
+    for i in range(n - 1, 0, -1):
+        j = _below(stream, i + 1)
+        order[i], order[j] = order[j], order[i]
+    return order
+
+
+def shuffled(items: Sequence[T], *seed: str) -> list[T]:
+    return [items[i] for i in permutation(len(items), *seed)]
+
+
+def _student_seed(student: str) -> str:
+    return (student or "").strip().lower()
+
+
+def question_order(toets: dict[str, Any], student: str) -> list[str]:
+    """Vraag-id's in de volgorde waarin deze leerling ze ziet."""
+    questions = toets.get("questions") or []
+    ids = [str(q.get("id")) for q in questions]
+    if not toets.get("shuffle", True):
+        return ids
+    return shuffled(ids, "vragen", str(toets.get("id")), _student_seed(student))
+
+
+def shuffled_questions(toets: dict[str, Any], student: str) -> list[dict[str, Any]]:
+    """
+    Vragen (kopieën) in de volgorde voor deze leerling, met geschudde opties
+    bij meerkeuzevragen. Antwoorden worden op optietekst opgeslagen, dus het
+    nakijken hangt niet van de getoonde volgorde af.
+    """
+    toets_id = str(toets.get("id"))
+    student = _student_seed(student)
+    by_id = {str(q.get("id")): q for q in toets.get("questions") or []}
+    out = []
+    for qid in question_order(toets, student):
+        q = dict(by_id[qid])
+        options = q.get("options")
+        if options and toets.get("shuffle", True) and q.get("shuffle_options", True):
+            q["options"] = shuffled(list(options), "opties", toets_id, student, qid)
+        out.append(q)
+    return out
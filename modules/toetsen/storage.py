@@ -1 +1,439 @@
+# modules/toetsen/storage.py
+"""
+Toetsen storage engine.
 
+Layout onder DATA_DIR/toetsen:
+
+    toetsen/<toets_id>.json                    definitie van de toets
+    codes.json                                 toetscode -> toets_id
+    sessions/<toets_id>/<student_key>.log      append-only antwoordlog (JSON lines)
+    sessions/<toets_id>/<student_key>.snap.json  periodieke snapshot (compactie)
+    sessions/<toets_id>/_events.log            voortgangsevents (live overzicht docent)
+
+Elke toetssessie (toets x leerling) heeft een eigen log met een eigen lock.
+Een antwoord of inlevering is één klein, gefsyncd record dat aan het log
+wordt toegevoegd; er wordt nooit een gedeeld JSON document herschreven en
+leerlingen die tegelijk inleveren wachten dus nooit op elkaar.
+
+Na COMPACT_EVERY records wordt het log samengevouwen in een snapshot (atomic
+write) en geleegd. Records hebben een oplopend `seq`; bij het laden worden
+records met seq <= snapshot.seq overgeslagen, zodat een crash tussen
+snapshot en truncate geen dubbele toepassing geeft.
+
+Autosave stuurt alleen gewijzigde antwoorden als "patch" (één record per
+patch). De versie van een sessie is de laatste seq; een patch op een oude
+versie geeft VersionConflict, een herhaalde patch_id wordt niet opnieuw
+toegepast (idempotent bij retries).
+
+Voortgang (gestart, N beantwoord, ingeleverd) gaat daarnaast als klein event
+naar één _events.log per toets (O_APPEND, zonder fsync: afgeleide data). De
+byte-offset na een event is zijn id, zodat een live view kan hervatten vanaf
+het laatst ontvangen event zonder sessies opnieuw te lezen.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator
+
+from modules.core.storage import FileCache, json_transaction, locked, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+COMPACT_EVERY = 64  # records in het log voordat we compacteren
+PATCH_IDS_KEEP = 32  # recente patch_ids per sessie (voor idempotente retries)
+
+CODES_FILE = "codes.json"
+CODE_DIGITS = 4
+
+EVENTS_FILE = "_events.log"
+EVENTS_READ_MAX = 256 * 1024
+
+LOG_SUFFIX = ".log"
+SNAPSHOT_SUFFIX = ".snap.json"
+
+
+class ToetsStorageError(Exception):
+    """Basis fout voor de toetsen storage."""
+
+
+class SessionNotStarted(ToetsStorageError):
+    """Er is nog geen sessie voor deze leerling en toets."""
+
+
+class SessionSubmitted(ToetsStorageError):
+    """De toets is al ingeleverd; er kan niets meer worden gewijzigd."""
+
+
+class VersionConflict(ToetsStorageError):
+    """Patch gebaseerd op een verouderde versie; `state` is de actuele sessie."""
+
+    def __init__(self, state: dict[str, Any]):
+        super().__init__(f"Versieconflict (actueel: {state.get('seq')})")
+        self.state = state
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def student_key(student: str) -> str:
+    """Bestandsnaam-veilige, stabiele sleutel voor een leerling (e-mail)."""
+    return hashlib.sha1((student or "").strip().lower().encode("utf-8")).hexdigest()[:20]
+
+
+def _safe_id(value: str) -> str:
+    if not value or not all(c.isalnum() or c in "-_" for c in value):
+        raise ToetsStorageError(f"Ongeldig id: {value!r}")
+    return value
+
+
+def normalize_code(code: str) -> str:
+    """"tri-4821", "TRI 4821" en "TRI4821" zijn dezelfde code."""
+    return re.sub(r"[^0-9A-Z]", "", (code or "").upper())
+
+
+def _new_code(title: str) -> str:
+    prefix = normalize_code(re.sub(r"[^A-Za-z]", "", title or ""))[:3] or "TST"
+    return f"{prefix}-{secrets.randbelow(10 ** CODE_DIGITS):0{CODE_DIGITS}d}"
+
+
+# per proces gecacht; ververst zodra codes.json verandert
+_codes_cache: FileCache[dict[str, str]] = FileCache(lambda d: d if isinstance(d, dict) else {}, dict)
+
+
+def empty_session(toets_id: str, student: str) -> dict[str, Any]:
+    return {
+        "toets_id": toets_id,
+        "student": student,
+        "started_at": None,
+        "submitted_at": None,
+        "answers": {},
+        "patch_ids": [],
+        "seq": 0,
+    }
+
+
+def answered_count(state: dict[str, Any]) -> int:
+    return sum(1 for v in (state.get("answers") or {}).values() if v not in (None, ""))
+
+
+def apply_record(state: dict[str, Any], rec: dict[str, Any]) -> None:
+    """Vouw één logrecord in de sessie-state (idempotent per seq)."""
+    op = rec.get("op")
+    if op == "start":
+        state["started_at"] = state.get("started_at") or rec.get("ts")
+        state["student"] = rec.get("student") or state.get("student")
+    elif op == "answer":
+        state["answers"][rec["q"]] = rec.get("v")
+    elif op == "patch":
+        state["answers"].update(rec.get("a") or {})
+        if rec.get("id"):
+            ids = state.setdefault("patch_ids", [])
+            ids.append(rec["id"])
+            del ids[:-PATCH_IDS_KEEP]
+    elif op == "submit":
+        state["submitted_at"] = state.get("submitted_at") or rec.get("ts")
+    state["seq"] = rec.get("seq", state.get("seq", 0))
+
+
+class ToetsStorage:
+    """Opslag van toetsdefinities en append-only antwoordlogs per sessie."""
+
+    def __init__(self, data_dir: str | Path):
+        self.root = Path(data_dir)
+        self.toetsen_dir = self.root / "toetsen"
+        self.sessions_dir = self.root / "sessions"
+
+    # ------------------------------------------------------------
+    # Toetsdefinities
+    # ------------------------------------------------------------
+    def toets_path(self, toets_id: str) -> Path:
+        return self.toetsen_dir / f"{_safe_id(toets_id)}.json"
+
+    def save_toets(self, toets: dict[str, Any]) -> dict[str, Any]:
+        """
+        Sla een toetsdefinitie op (nieuw id als er nog geen is) en werk de
+        code-index bij. Zonder code krijgt de toets een unieke code.
+        """
+        toets = dict(toets)
+        toets.setdefault("id", uuid.uuid4().hex)
+        toets.setdefault("created_at", _now())
+        toets["updated_at"] = _now()
+
+        with json_transaction(self.codes_path, dict) as txn:
+            codes = txn.data
+            key = normalize_code(toets.get("code") or "")
+            if key and codes.get(key) not in (None, toets["id"]):
+                txn.rollback()
+                raise ToetsStorageError(f"Toetscode {toets['code']} is al in gebruik")
+            while not key:
+                toets["code"] = _new_code(toets.get("title") or "")
+                key = normalize_code(toets["code"])
+                if key in codes:
+                    key = ""
+            # oude code van deze toets vrijgeven
+            for old in [k for k, v in codes.items() if v == toets["id"] and k != key]:
+                del codes[old]
+            codes[key] = toets["id"]
+            write_json(self.toets_path(toets["id"]), toets)
+        return toets
+
+    def load_toets(self, toets_id: str) -> dict[str, Any] | None:
+        try:
+            path = self.toets_path(toets_id)
+        except ToetsStorageError:
+            return None
+        data = read_json(path, dict)
+        return data or None
+
+    @property
+    def codes_path(self) -> Path:
+        return self.root / CODES_FILE
+
+    def resolve_code(self, code: str) -> str | None:
+        """Toetscode -> toets_id via de gecachte index (geen scan over alle toetsen)."""
+        key = normalize_code(code)
+        return _codes_cache.get(self.codes_path).get(key) if key else None
+
+    def list_toetsen(self, owner: str | None = None) -> list[dict[str, Any]]:
+        if not self.toetsen_dir.is_dir():
+            return []
+        out = []
+        for path in self.toetsen_dir.glob("*.json"):
+            toets = read_json(path, dict)
+            if toets and (owner is None or toets.get("owner") == owner):
+                out.append(toets)
+        return sorted(out, key=lambda t: t.get("created_at") or "", reverse=True)
+
+    # ------------------------------------------------------------
+    # Sessies: paden + lezen
+    # ------------------------------------------------------------
+    def _session_base(self, toets_id: str, student: str) -> Path:
+        return self.sessions_dir / _safe_id(toets_id) / student_key(student)
+
+    def _log_path(self, toets_id: str, student: str) -> Path:
+        return self._session_base(toets_id, student).with_suffix(LOG_SUFFIX)
+
+    def _snapshot_path(self, toets_id: str, student: str) -> Path:
+        base = self._session_base(toets_id, student)
+        return base.with_name(base.name + SNAPSHOT_SUFFIX)
+
+    @staticmethod
+    def _read_log(log_path: Path) -> tuple[list[dict[str, Any]], bool]:
+        """
+        Lees alle records. Returns (records, clean_end); clean_end is False als
+        de laatste regel niet met een newline eindigt (afgebroken write).
+        """
+        try:
+            raw = log_path.read_bytes()
+        except FileNotFoundError:
+            return [], True
+        records = []
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # alleen een afgebroken laatste regel kan hier komen; overslaan
+                logger.warning("Onleesbaar record in %s overgeslagen", log_path)
+        return records, (not raw or raw.endswith(b"\n"))
+
+    def _fold(self, toets_id: str, student: str, log_path: Path, snap_path: Path) -> tuple[dict[str, Any], int, bool]:
+        # eerst het log, dan de snapshot: zo mist een lezer zonder lock nooit
+        # records als er tussendoor gecompacteerd wordt
+        records, clean_end = self._read_log(log_path)
+        state = read_json(snap_path, dict) or empty_session(toets_id, student)
+        state.setdefault("answers", {})
+        base_seq = state.get("seq", 0)
+        pending = 0
+        for rec in records:
+            if rec.get("seq", 0) > base_seq:
+                apply_record(state, rec)
+                pending += 1
+        return state, pending, clean_end
+
+    def load_session(self, toets_id: str, student: str) -> dict[str, Any] | None:
+        """Huidige state van een sessie (None als de leerling nog niet gestart is)."""
+        state, _, _ = self._fold(toets_id, student, self._log_path(toets_id, student),
+                                 self._snapshot_path(toets_id, student))
+        return state if state.get("started_at") else None
+
+    def iter_sessions(self, toets_id: str) -> Iterator[dict[str, Any]]:
+        """Alle gestarte sessies van een toets (voor overzicht en nakijken)."""
+        directory = self.sessions_dir / _safe_id(toets_id)
+        if not directory.is_dir():
+            return
+        keys = set()
+        for name in os.listdir(directory):
+            if name.startswith("_"):
+                continue  # _events.log e.d., geen sessie
+            if name.endswith(SNAPSHOT_SUFFIX):
+                keys.add(name[: -len(SNAPSHOT_SUFFIX)])
+            elif name.endswith(LOG_SUFFIX):
+                keys.add(name[: -len(LOG_SUFFIX)])
+        for key in sorted(keys):
+            base = directory / key
+            state, _, _ = self._fold(toets_id, "", base.with_suffix(LOG_SUFFIX),
+                                     base.with_name(key + SNAPSHOT_SUFFIX))
+            if state.get("started_at"):
+                yield state
+
+    # ------------------------------------------------------------
+    # Sessies: schrijven
+    # ------------------------------------------------------------
+    def _append(
+        self, toets_id: str, student: str, op: str, /,
+        base_version: int | None = None, **fields: Any,
+    ) -> dict[str, Any]:
+        """Voeg één record toe onder de lock van déze sessie en geef de nieuwe state terug."""
+        log_path = self._log_path(toets_id, student)
+        snap_path = self._snapshot_path(toets_id, student)
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with locked(log_path):
+            state, pending, clean_end = self._fold(toets_id, student, log_path, snap_path)
+
+            if op != "start" and not state.get("started_at"):
+                raise SessionNotStarted(f"Sessie {toets_id}/{student} is niet gestart")
+            if state.get("submitted_at"):
+                if op == "submit":
+                    return state
+                raise SessionSubmitted(f"Sessie {toets_id}/{student} is al ingeleverd")
+            if op == "start" and state.get("started_at"):
+                return state
+            if op == "patch":
+                if fields.get("id") and fields["id"] in state.get("patch_ids", ()):
+                    return state  # retry van een al toegepaste patch
+                if base_version is not None and base_version != state.get("seq", 0):
+                    raise VersionConflict(state)
+
+            rec = {"seq": state.get("seq", 0) + 1, "ts": _now(), "op": op, **fields}
+            line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n"
+            if not clean_end:
+                line = "\n" + line
+
+            fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            answered_before = answered_count(state)
+            apply_record(state, rec)
+            if pending + 1 >= COMPACT_EVERY or op == "submit":
+                self._compact_locked(log_path, snap_path, state)
+
+            answered = answered_count(state)
+            if op == "start":
+                self._emit(toets_id, {"type": "started", "student": student, "answered": answered})
+            elif op == "submit":
+                self._emit(toets_id, {"type": "submitted", "student": student, "answered": answered})
+            elif answered != answered_before:
+                self._emit(toets_id, {"type": "progress", "student": student, "answered": answered})
+            return state
+
+    # ------------------------------------------------------------
+    # Voortgangsevents
+    # ------------------------------------------------------------
+    def _events_path(self, toets_id: str) -> Path:
+        return self.sessions_dir / _safe_id(toets_id) / EVENTS_FILE
+
+    def _emit(self, toets_id: str, event: dict[str, Any]) -> None:
+        event = {**event, "ts": _now()}
+        line = (json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        try:
+            # één write met O_APPEND: regels van verschillende workers lopen niet door elkaar
+            fd = os.open(self._events_path(toets_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError:
+            logger.exception("Toets event schrijven mislukt (%s)", toets_id)
+
+    def events_offset(self, toets_id: str) -> int:
+        """Huidige eind-offset van het eventlog (id van het laatste event)."""
+        try:
+            return self._events_path(toets_id).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def read_events(self, toets_id: str, offset: int = 0) -> tuple[list[tuple[int, dict[str, Any]]], int]:
+        """
+        Events na `offset`. Returns ([(event_id, event)], nieuwe offset); alleen
+        complete regels, een regel die nog geschreven wordt komt de volgende keer.
+        """
+        try:
+            with open(self._events_path(toets_id), "rb") as f:
+                f.seek(max(0, offset))
+                data = f.read(EVENTS_READ_MAX)
+        except FileNotFoundError:
+            return [], offset
+        end = data.rfind(b"\n")
+        if end < 0:
+            return [], offset
+        events = []
+        pos = offset
+        for line in data[: end + 1].splitlines(keepends=True):
+            pos += len(line)
+            try:
+                events.append((pos, json.loads(line)))
+            except ValueError:
+                continue
+        return events, offset + end + 1
+
+    @staticmethod
+    def _compact_locked(log_path: Path, snap_path: Path, state: dict[str, Any]) -> None:
+        # snapshot eerst (atomic), dan het log legen; records <= seq worden bij
+        # het laden toch al overgeslagen
+        write_json(snap_path, state)
+        fd = os.open(log_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, 0)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def compact(self, toets_id: str, student: str) -> None:
+        log_path = self._log_path(toets_id, student)
+        snap_path = self._snapshot_path(toets_id, student)
+        with locked(log_path):
+            state, pending, _ = self._fold(toets_id, student, log_path, snap_path)
+            if pending:
+                self._compact_locked(log_path, snap_path, state)
+
+    def start_session(self, toets_id: str, student: str) -> dict[str, Any]:
+        return self._append(toets_id, student, "start", student=student)
+
+    def record_answer(self, toets_id: str, student: str, question_id: str, value: Any) -> dict[str, Any]:
+        return self._append(toets_id, student, "answer", q=str(question_id), v=value)
+
+    def apply_patch(
+        self,
+        toets_id: str,
+        student: str,
+        answers: dict[str, Any],
+        patch_id: str | None = None,
+        base_version: int | None = None,
+    ) -> dict[str, Any]:
+        """
+        Pas een set gewijzigde antwoorden in één record toe.
+        - base_version: versie waarop de client de wijziging baseerde
+          (None = geen controle, bijv. bij inleveren)
+        - patch_id: client-id; dezelfde patch nogmaals sturen is een no-op
+        """
+        answers = {str(k): v for k, v in (answers or {}).items()}
+        return self._append(toets_id, student, "patch", base_version=base_version, id=patch_id, a=answers)
+
+    def submit(self, toets_id: str, student: str) -> dict[str, Any]:
+        return self._append(toets_id, student, "submit")
@@ -6,11 +6,16 @@ from __future__ import annotations
 
 import io
 import logging
-from typing import Any
+import os
+import tempfile
+import tracemalloc
+from dataclasses import dataclass
+from typing import IO, Any
 
 from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from PIL import Image
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +33,173 @@ IMAGE_WIDTH_INCHES = 2.0
 COVER_WIDTH_INCHES = 6.5
 IMAGES_PER_ROW = 3
 
+# Output is written to a SpooledTemporaryFile: small documents stay in memory,
+# larger ones roll over to disk (TMPDIR) past WORKBOOK_SPOOL_MAX_MB.
+DEFAULT_SPOOL_MAX_MB = 8
+
+# Memory budget per export (WORKBOOK_MEMORY_BUDGET_MB). python-docx keeps the
+# encoded images as-is, so peak memory is roughly two copies of the input
+# (request, document parts) plus the object model and the in-memory part of
+# the output spool. Downscaling adds one decoded image (RGBA) on top of that
+# while it runs.
+DEFAULT_MEMORY_BUDGET_MB = 256
+DOCX_BASE_BYTES = 8 * 1024 * 1024
+PER_STEP_BYTES = 64 * 1024
+ENCODED_COPIES = 2
+DECODED_BYTES_PER_PIXEL = 4
+TARGET_DPI = 200               # enough for print at the placed width
+DOWNSCALE_JPEG_QUALITY = 85
+
+
+class WorkbookTooLargeError(Exception):
+    """Export does not fit the memory budget, even after downscaling."""
+
+    def __init__(self, estimate: "MemoryEstimate", budget: int, needed: int | None = None):
+        needed = estimate.peak_bytes if needed is None else needed
+        super().__init__(
+            f"Workbook too large: estimated {needed / 1e6:.0f} MB, budget {budget / 1e6:.0f} MB"
+        )
+        self.estimate = estimate
+        self.budget = budget
+
+
+@dataclass
+class MemoryEstimate:
+    """Estimated peak memory of one export, derived from the inputs only."""
+
+    images: int
+    encoded_bytes: int
+    max_decoded_bytes: int
+    steps: int
+    downscaled: int = 0
+    downscale_bytes: int = 0   # peak of the downscale pass, if it ran
+
+    @property
+    def build_bytes(self) -> int:
+        """Peak while building and saving the document."""
+        return (
+            DOCX_BASE_BYTES
+            + self.steps * PER_STEP_BYTES
+            + ENCODED_COPIES * self.encoded_bytes
+            + min(self.encoded_bytes, spool_max_bytes())
+        )
+
+    @property
+    def peak_bytes(self) -> int:
+        """Build peak, or the downscale peak if that was higher."""
+        return max(self.build_bytes, self.downscale_bytes)
+
+
+def memory_budget() -> int:
+    """Budget in bytes from WORKBOOK_MEMORY_BUDGET_MB."""
+    return int(float(os.environ.get("WORKBOOK_MEMORY_BUDGET_MB", DEFAULT_MEMORY_BUDGET_MB)) * 1024 * 1024)
+
+
+def spool_max_bytes() -> int:
+    """In-memory part of the output spool, from WORKBOOK_SPOOL_MAX_MB."""
+    return int(float(os.environ.get("WORKBOOK_SPOOL_MAX_MB", DEFAULT_SPOOL_MAX_MB)) * 1024 * 1024)
+
+
+def _image_size(img_bytes: bytes) -> tuple[int, int] | None:
+    """Pixel dimensions from the image header (Pillow does not decode pixels here)."""
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+def _iter_images(meta: dict[str, Any], steps: list[dict[str, Any]]):
+    """Yield (bytes, placed width in inches, replace callback) for every image."""
+    if meta.get("cover_bytes"):
+        yield meta["cover_bytes"], COVER_WIDTH_INCHES, lambda b: meta.__setitem__("cover_bytes", b)
+    for step in steps:
+        images = step.get("images") or []
+        for i, img in enumerate(images):
+            if img:
+                yield img, IMAGE_WIDTH_INCHES, lambda b, images=images, i=i: images.__setitem__(i, b)
+
+
+def estimate_memory(meta: dict[str, Any], steps: list[dict[str, Any]]) -> MemoryEstimate:
+    """Estimate peak memory from image sizes, pixel dimensions and step count."""
+    images = encoded = max_decoded = 0
+    for img, _, _ in _iter_images(meta, steps):
+        images += 1
+        encoded += len(img)
+        size = _image_size(img)
+        if size:
+            max_decoded = max(max_decoded, size[0] * size[1] * DECODED_BYTES_PER_PIXEL)
+    return MemoryEstimate(images=images, encoded_bytes=encoded, max_decoded_bytes=max_decoded, steps=len(steps))
+
+
+def _downscale(img_bytes: bytes, width_inches: float) -> bytes | None:
+    """Shrink to the placed width at TARGET_DPI; None if that does not help."""
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as im:
+            target_w = int(width_inches * TARGET_DPI)
+            if im.width <= target_w:
+                return None
+            target_h = max(1, round(im.height * target_w / im.width))
+            # lets the JPEG decoder decode directly at 1/2, 1/4 or 1/8 scale
+            im.draft("RGB", (target_w, target_h))
+            has_alpha = im.mode in ("RGBA", "LA", "P")
+            small = im.convert("RGBA" if has_alpha else "RGB").resize((target_w, target_h), Image.LANCZOS)
+            out = io.BytesIO()
+            if has_alpha:
+                small.save(out, "PNG", optimize=True)
+            else:
+                small.save(out, "JPEG", quality=DOWNSCALE_JPEG_QUALITY, optimize=True)
+            data = out.getvalue()
+            return data if len(data) < len(img_bytes) else None
+    except Exception as e:
+        logger.warning(f"Downscale failed, keeping original image: {e}")
+        return None
+
+
+def enforce_memory_budget(
+    meta: dict[str, Any],
+    steps: list[dict[str, Any]],
+    budget: int | None = None,
+) -> MemoryEstimate:
+    """
+    Check the estimated peak against the budget before building.
+
+    Over budget, images are first downscaled in place (in meta/steps). That
+    keeps the original inputs alive plus one decoded image, so it is only
+    attempted if that peak fits; otherwise, or if the build still does not
+    fit afterwards, WorkbookTooLargeError is raised.
+
+    Returns:
+        The estimate the build will run with
+    """
+    budget = memory_budget() if budget is None else budget
+    estimate = estimate_memory(meta, steps)
+    if estimate.build_bytes <= budget:
+        return estimate
+
+    # downscaling decodes one image at a time while all originals are still held
+    estimate.downscale_bytes = DOCX_BASE_BYTES + estimate.encoded_bytes + estimate.max_decoded_bytes
+    if estimate.downscale_bytes > budget:
+        raise WorkbookTooLargeError(estimate, budget, estimate.downscale_bytes)
+
+    logger.info(
+        f"Workbook estimate {estimate.build_bytes / 1e6:.0f} MB over budget "
+        f"{budget / 1e6:.0f} MB, downscaling {estimate.images} images"
+    )
+    downscaled = 0
+    for img, width_inches, replace in list(_iter_images(meta, steps)):
+        smaller = _downscale(img, width_inches)
+        if smaller is not None:
+            replace(smaller)
+            downscaled += 1
+
+    after = estimate_memory(meta, steps)
+    after.downscaled = downscaled
+    after.downscale_bytes = estimate.downscale_bytes
+    if after.peak_bytes > budget:
+        raise WorkbookTooLargeError(after, budget)
+    return after
+
 
 # ============================================================
 # HELPERS
@@ -225,7 +397,7 @@ def _add_step(doc: Document, idx: int, step: dict[str, Any]) -> None:
                     row = table.add_row().cells
                 
                 cell = row[i % cols]
-                if _try_add_image(cell.paragraphs[0], img_bytes, width_inches=IMAGE_WIDTH_INCHES):
+                if _try_add_image(cell.paragraphs[0].add_run(), img_bytes, width_inches=IMAGE_WIDTH_INCHES):
                     pass  # Image added successfully
                 else:
                     cell.text = "(afbeelding kon niet worden ingeladen)"
@@ -242,7 +414,7 @@ def _add_step(doc: Document, idx: int, step: dict[str, Any]) -> None:
 def build_workbook_docx_front_and_steps(
     meta: dict[str, Any],
     steps: list[dict[str, Any]]
-) -> io.BytesIO:
+) -> IO[bytes]:
     """
     Build complete workbook DOCX document.
     
@@ -262,11 +434,18 @@ def build_workbook_docx_front_and_steps(
             - images: List of image bytes
     
     Returns:
-        BytesIO object containing DOCX document
+        SpooledTemporaryFile positioned at 0 containing the DOCX document;
+        the caller must close it
         
     Raises:
+        WorkbookTooLargeError: If the export exceeds the memory budget,
+            even after downscaling images
         Exception: If document generation fails
     """
+    estimate = enforce_memory_budget(meta, steps)
+    trace = os.environ.get("WORKBOOK_TRACEMALLOC") == "1" and not tracemalloc.is_tracing()
+    if trace:
+        tracemalloc.start()
     try:
         doc = Document()
         
@@ -284,14 +463,29 @@ def build_workbook_docx_front_and_steps(
             for i, step in enumerate(steps, start=1):
                 _add_step(doc, i, step)
         
-        # Export to BytesIO
-        out = io.BytesIO()
-        doc.save(out)
+        # Export to a spool: in memory up to the threshold, on disk beyond it
+        out = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes(), prefix="werkboekje-", suffix=".docx")
+        try:
+            doc.save(out)
+        except BaseException:
+            out.close()
+            raise
+        del doc
         out.seek(0)
         
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            logger.info(
+                f"Workbook memory: estimated {estimate.peak_bytes / 1e6:.1f} MB, "
+                f"traced peak {peak / 1e6:.1f} MB excluding the input itself "
+                f"({estimate.images} images, {estimate.downscaled} downscaled)"
+            )
         logger.info(f"Workbook generated successfully with {len(steps)} steps")
         return out
     
     except Exception as e:
         logger.error(f"Error building workbook: {e}", exc_info=True)
         raise
+    finally:
+        if trace:
+            tracemalloc.stop()
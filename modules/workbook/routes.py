@@ -5,23 +5,24 @@ Enhanced workbook routes with both DOCX generation and online viewing.
 from __future__ import annotations
 
 import logging
-from functools import wraps
+import os
+from functools import lru_cache, wraps
 from typing import Any
 import uuid
 
-from flask import Blueprint, render_template, request, send_file, session, redirect, url_for, jsonify
+from flask import Blueprint, Response, current_app, render_template, request, session, redirect, url_for, jsonify
 from werkzeug.utils import secure_filename
 
-from .builder import build_workbook_docx_front_and_steps
+from modules.core import metrics, stats
+from modules.core.admission import admission_controlled
+
+# builder (python-docx/lxml) wordt pas bij de eerste DOCX-export geïmporteerd
 from .viewer import WorkbookStorage, WorkbookRenderer, generate_workbook_id
 
 logger = logging.getLogger(__name__)
 
 bp = Blueprint("workbook", __name__, url_prefix="/workbook")
 
-# Initialize storage
-storage = WorkbookStorage()
-
 # ============================================================
 # CONFIGURATION & CONSTANTS
 # ============================================================
@@ -32,6 +33,7 @@ MAX_STEP_COUNT = 50
 MAX_TEXT_LENGTH = 5000
 MAX_TITLE_LENGTH = 500
 MAX_MATERIALEN_ROWS = 20
+SPOOL_CHUNK_SIZE = 64 * 1024
 
 # ============================================================
 # SECURITY & VALIDATION HELPERS
@@ -117,6 +119,49 @@ def _values_from_form() -> dict[str, Any]:
     return values
 
 
+def _data_dir() -> str:
+    return current_app.config.get("DATA_DIR", "/opt/mediawize/data")
+
+
+def _iter_file(f, chunk_size: int = SPOOL_CHUNK_SIZE):
+    """Yield chunks of `f` and close it when done (or when the client disconnects)."""
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+def _send_spooled(f, download_name: str, mimetype: str) -> Response:
+    """
+    Stream a (spooled) temp file as a download with a known Content-Length.
+    No send_file here: that would call fileno() for sendfile and force the
+    spool to disk even for small documents.
+    """
+    size = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    response = Response(_iter_file(f), mimetype=mimetype, direct_passthrough=True)
+    response.content_length = size
+    response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    response.cache_control.no_cache = True
+    # also close when the generator never starts (e.g. client gone before the first chunk)
+    response.call_on_close(f.close)
+    return response
+
+
+@lru_cache(maxsize=None)
+def _storage_for(workbook_dir: str) -> WorkbookStorage:
+    return WorkbookStorage(workbook_dir)
+
+
+def _storage() -> WorkbookStorage:
+    """Lazy: de map wordt pas bij het eerste gebruik aangemaakt (niet bij import)."""
+    return _storage_for(current_app.config.get("WORKBOOK_DIR") or os.path.join(_data_dir(), "workbooks"))
+
+
 def _get_user_id() -> str:
     """Get user ID from session."""
     user = session.get("user")
@@ -147,6 +192,7 @@ def workbook_get():
 @bp.post("/")
 @login_required
 @role_required("docent")
+@admission_controlled("docx")
 def workbook_post():
     """Generate workbook with option to save online or download DOCX."""
     try:
@@ -290,8 +336,13 @@ def workbook_post():
                 "steps": steps,
             }
             
-            if storage.save_workbook(workbook_id, workbook_data):
+            if _storage().save_workbook(workbook_id, workbook_data):
                 logger.info(f"Workbook saved online: {workbook_id}")
+                stats.workbook_saved(
+                    _data_dir(),
+                    workbook_data.get("user_id"),
+                    os.path.getsize(_storage().workbook_path(workbook_id)),
+                )
                 return redirect(url_for("workbook.view_workbook", workbook_id=workbook_id))
             else:
                 error_msg = "Fout bij opslaan werkboekje"
@@ -305,15 +356,29 @@ def workbook_post():
                 )
         else:
             # Download as DOCX
-            output = build_workbook_docx_front_and_steps(meta, steps)
+            from .builder import WorkbookTooLargeError, build_workbook_docx_front_and_steps
+
+            try:
+                with metrics.timed("mediawize_docx_seconds", kind="workbook_build"):
+                    output = build_workbook_docx_front_and_steps(meta, steps)
+            except WorkbookTooLargeError as e:
+                logger.warning(f"Workbook rejected: {e}")
+                return render_template(
+                    "workbook/index.html",
+                    step_count=step_count,
+                    values=values,
+                    error="Dit werkboekje is te groot om te maken. Gebruik minder of kleinere afbeeldingen.",
+                    active_tab="workbook",
+                    page_title="Werkboekjes",
+                ), 413
             vak = (meta.get("vak") or "BWI").upper()
             
             logger.info(f"Workbook downloaded: {vak} with {len(steps)} steps")
+            stats.conversion_done(_data_dir(), "docx_builds")
             
-            return send_file(
+            return _send_spooled(
                 output,
-                as_attachment=True,
-                download_name=f"werkboekje_{vak}.docx",
+                download_name=secure_filename(f"werkboekje_{vak}.docx") or "werkboekje.docx",
                 mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             )
     
@@ -334,7 +399,7 @@ def view_workbook(workbook_id: str):
     """Display workbook online."""
     try:
         # Load workbook from storage
-        workbook_data = storage.load_workbook(workbook_id)
+        workbook_data = _storage().load_workbook(workbook_id)
         
         if not workbook_data:
             logger.warning(f"Workbook not found: {workbook_id}")
@@ -359,7 +424,7 @@ def list_workbooks():
     """List user's workbooks."""
     try:
         user_id = _get_user_id()
-        workbooks = storage.list_workbooks(user_id=user_id)
+        workbooks = _storage().list_workbooks(user_id=user_id)
         
         return render_template(
             "workbook/list.html",
@@ -379,13 +444,19 @@ def delete_workbook(workbook_id: str):
     """Delete a workbook."""
     try:
         # Verify ownership
-        workbook_data = storage.load_workbook(workbook_id)
+        workbook_data = _storage().load_workbook(workbook_id)
         if not workbook_data or workbook_data.get("user_id") != _get_user_id():
             logger.warning(f"Unauthorized delete attempt: {workbook_id}")
             return jsonify({"error": "Unauthorized"}), 403
         
-        if storage.delete_workbook(workbook_id):
+        try:
+            size = os.path.getsize(_storage().workbook_path(workbook_id))
+        except OSError:
+            size = 0
+
+        if _storage().delete_workbook(workbook_id):
             logger.info(f"Workbook deleted: {workbook_id}")
+            stats.workbook_deleted(_data_dir(), workbook_data.get("user_id"), size)
             return jsonify({"success": True})
         else:
             return jsonify({"error": "Failed to delete"}), 500
@@ -11,6 +11,9 @@ import os
 from datetime import datetime
 from typing import Any
 
+from modules.core.sharded import ShardedDir
+from modules.core.storage import write_json
+
 logger = logging.getLogger(__name__)
 
 # ============================================================
@@ -32,12 +35,23 @@ DESIGN_COLORS = {
 # ============================================================
 
 class WorkbookStorage:
-    """Handle workbook persistence (JSON-based for now)."""
+    """
+    Handle workbook persistence (JSON-based for now).
+
+    Files live in a sharded layout (``ab/cd/<id>.json``); flat ``<id>.json``
+    files from before the sharding are still read, and moved over on the next
+    save or by ``python -m modules.core.sharded migrate``.
+    """
     
     def __init__(self, data_dir: str = "/opt/mediawize/data/workbooks"):
         self.data_dir = data_dir
+        self.files = ShardedDir(data_dir, suffix=".json")
         os.makedirs(data_dir, exist_ok=True)
     
+    def workbook_path(self, workbook_id: str) -> str:
+        """Path of the JSON file for `workbook_id` (sharded, or legacy flat)."""
+        return str(self.files.path(workbook_id))
+    
     def save_workbook(self, workbook_id: str, data: dict[str, Any]) -> bool:
         """
         Save workbook data to JSON file.
@@ -50,15 +64,17 @@ class WorkbookStorage:
             True if successful
         """
         try:
-            filepath = os.path.join(self.data_dir, f"{workbook_id}.json")
+            filepath = self.files.write_path(workbook_id)
             
             # Add metadata
             data["id"] = workbook_id
             data["created_at"] = datetime.utcnow().isoformat()
             data["updated_at"] = datetime.utcnow().isoformat()
             
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # atomic: temp-bestand + fsync + rename
+            write_json(filepath, data)
+            # a legacy flat copy would now be stale
+            self.files.discard_flat(workbook_id)
             
             logger.info(f"Workbook saved: {workbook_id}")
             return True
@@ -77,14 +93,19 @@ class WorkbookStorage:
             Workbook data dictionary or None if not found
         """
         try:
-            filepath = os.path.join(self.data_dir, f"{workbook_id}.json")
+            filepath = self.workbook_path(workbook_id)
             
             if not os.path.exists(filepath):
                 logger.warning(f"Workbook not found: {workbook_id}")
                 return None
             
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                # moved from flat to sharded by a running migration; look again
+                with open(self.workbook_path(workbook_id), "r", encoding="utf-8") as f:
+                    data = json.load(f)
             
             return data
         except Exception as e:
@@ -94,9 +115,7 @@ class WorkbookStorage:
     def delete_workbook(self, workbook_id: str) -> bool:
         """Delete workbook file."""
         try:
-            filepath = os.path.join(self.data_dir, f"{workbook_id}.json")
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            if self.files.remove(workbook_id):
                 logger.info(f"Workbook deleted: {workbook_id}")
                 return True
             return False
@@ -116,19 +135,17 @@ class WorkbookStorage:
         """
         try:
             workbooks = []
-            for filename in os.listdir(self.data_dir):
-                if filename.endswith(".json"):
-                    workbook_id = filename[:-5]
-                    data = self.load_workbook(workbook_id)
-                    if data:
-                        if user_id is None or data.get("user_id") == user_id:
-                            workbooks.append({
-                                "id": workbook_id,
-                                "title": data.get("opdracht_titel", "Untitled"),
-                                "vak": data.get("vak", ""),
-                                "created_at": data.get("created_at"),
-                                "updated_at": data.get("updated_at"),
-                            })
+            for workbook_id in self.files.iter_ids():
+                data = self.load_workbook(workbook_id)
+                if data:
+                    if user_id is None or data.get("user_id") == user_id:
+                        workbooks.append({
+                            "id": workbook_id,
+                            "title": data.get("opdracht_titel", "Untitled"),
+                            "vak": data.get("vak", ""),
+                            "created_at": data.get("created_at"),
+                            "updated_at": data.get("updated_at"),
+                        })
             return sorted(workbooks, key=lambda x: x.get("created_at", ""), reverse=True)
         except Exception as e:
             logger.error(f"Error listing workbooks: {e}")
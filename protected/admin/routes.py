@@ -1,21 +1,43 @@
 # protected/admin/routes.py
 import os
-import json
 import uuid
 from pathlib import Path
 from datetime import datetime
 
 from flask import (
+    Response,
+    current_app,
+    jsonify,
     render_template,
     request,
     redirect,
     url_for,
     session,
     flash,
+    stream_with_context,
 )
 
+from modules.core import stats
+from modules.core.admission import admission_controlled
+from modules.core.bulk_import import MAX_CSV_BYTES, decode_csv, import_students, parse_students_csv
+from modules.core.school_index import school_index
+from modules.core.storage import json_transaction, read_json
+
 from . import admin_bp
 from .decorators import admin_required
+from .services import (
+    SCHOOL_CSV_FIELDS,
+    TEACHER_CSV_FIELDS,
+    TEACHER_SORTS,
+    ImportPlan,
+    apply_plan,
+    clamp_paging,
+    iter_csv,
+    plan_school_import,
+    plan_teacher_import,
+    query_schools,
+    teacher_index,
+)
 
 
 # =================================================
@@ -72,34 +94,53 @@ def admin_logout():
 @admin_bp.get("/")
 @admin_required
 def admin_dashboard():
+    # voorberekende tellers (stats.json); geen scans over users/teachers/werkboekjes
+    data = stats.read_stats(_data_dir())
+    schools = school_index(_schools_path())
+
+    def _top(group: str, n: int = 10, names: bool = True) -> list[tuple[str, int]]:
+        rows = sorted(data[group].items(), key=lambda kv: kv[1], reverse=True)[:n]
+        if names:
+            return [((schools.get(k) or {}).get("name") or k, v) for k, v in rows]
+        return rows
+
     return render_template(
         "admin/dashboard.html",
+        totals=data[stats.TOTALS],
+        teachers_per_school=_top(stats.TEACHERS_PER_SCHOOL),
+        students_per_school=_top(stats.STUDENTS_PER_SCHOOL),
+        workbooks_per_teacher=_top(stats.WORKBOOKS_PER_TEACHER, names=False),
+        stats_updated_at=data.get("updated_at"),
+        stats_rebuilt_at=data.get("rebuilt_at"),
         active_tab="admin",
         page_title="Beheer",
     )
 
 
+@admin_bp.post("/stats/rebuild")
+@admin_required
+def admin_stats_rebuild():
+    stats.rebuild(_data_dir(), current_app.config.get("WORKBOOK_DIR") or stats.default_workbooks_dir(_data_dir()))
+    flash("Statistieken opnieuw berekend.", "ok")
+    return redirect(url_for("admin.admin_dashboard"))
+
+
 # =================================================
 # DATA HELPERS – SCHOOLS
 # =================================================
 
+def _data_dir() -> Path:
+    return Path(os.environ.get("DATA_DIR", "/opt/mediawize/data"))
+
+
 def _schools_path() -> Path:
     data_dir = os.environ.get("DATA_DIR", "/opt/mediawize/data")
     return Path(data_dir) / "schools.json"
 
 
 def _load_schools() -> list[dict]:
-    p = _schools_path()
-    if not p.exists():
-        return []
-    raw = p.read_text(encoding="utf-8").strip()
-    return json.loads(raw) if raw else []
-
-
-def _save_schools(items: list[dict]) -> None:
-    p = _schools_path()
-    p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(items, indent=2, ensure_ascii=False), encoding="utf-8")
+    # strikt: een corrupt schools.json moet opvallen, niet als lege lijst verder
+    return read_json(_schools_path(), list, strict=True)
 
 
 # =================================================
@@ -109,18 +150,32 @@ def _save_schools(items: list[dict]) -> None:
 @admin_bp.get("/schools")
 @admin_required
 def admin_schools():
-    schools = sorted(
-        _load_schools(),
-        key=lambda s: (s.get("name") or "").lower(),
-    )
+    page, per_page = clamp_paging(request.args.get("page"), request.args.get("per_page"))
+    q = (request.args.get("q") or "").strip()
+    desc = request.args.get("dir") == "desc"
+
+    # gecachte, voorgesorteerde index; alleen de gevraagde pagina naar de template
+    result = query_schools(school_index(_schools_path()), q=q, desc=desc, page=page, per_page=per_page)
+
     return render_template(
         "admin/schools.html",
-        schools=schools,
+        schools=result.items,
+        pagination=result,
+        filters={"q": q, "dir": "desc" if desc else "asc", "per_page": per_page},
         active_tab="schools",
         page_title="Scholen",
     )
 
 
+@admin_bp.get("/schools/search")
+@admin_required
+def admin_schools_search():
+    """Type-ahead voor schoolvelden (zelfde antwoord als /schools/search in de hoofdapp)."""
+    q = (request.args.get("q") or "").strip()[:100]
+    hits = school_index(_schools_path()).search(q)
+    return jsonify([{"id": s.get("id"), "name": s.get("name") or ""} for s in hits])
+
+
 # =================================================
 # DATA HELPERS – TEACHERS
 # =================================================
@@ -131,17 +186,7 @@ def _teachers_path() -> Path:
 
 
 def _load_teachers() -> list[dict]:
-    p = _teachers_path()
-    if not p.exists():
-        return []
-    raw = p.read_text(encoding="utf-8").strip()
-    return json.loads(raw) if raw else []
-
-
-def _save_teachers(items: list[dict]) -> None:
-    p = _teachers_path()
-    p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(items, indent=2, ensure_ascii=False), encoding="utf-8")
+    return read_json(_teachers_path(), list, strict=True)
 
 
 # =================================================
@@ -151,16 +196,211 @@ def _save_teachers(items: list[dict]) -> None:
 @admin_bp.get("/teachers")
 @admin_required
 def admin_teachers():
-    schools = _load_schools()
-    teachers = _load_teachers()
-    school_map = {s["id"]: s["name"] for s in schools}
+    page, per_page = clamp_paging(request.args.get("page"), request.args.get("per_page"))
+    q = (request.args.get("q") or "").strip()
+    school_id = (request.args.get("school") or "").strip()
+    active_arg = request.args.get("active") or ""
+    active = {"1": True, "0": False}.get(active_arg)
+    sort = request.args.get("sort") or "name"
+    if sort not in TEACHER_SORTS:
+        sort = "name"
+    desc = request.args.get("dir") == "desc"
+
+    schools = school_index(_schools_path())
+    result = teacher_index(_teachers_path()).query(
+        q=q, school_id=school_id, active=active, sort=sort, desc=desc, page=page, per_page=per_page,
+    )
+    # alleen de scholen van de docenten op deze pagina opzoeken
+    school_map = {
+        t.get("school_id"): (schools.get(t.get("school_id")) or {}).get("name", "Onbekend")
+        for t in result.items
+    }
 
     return render_template(
         "admin/teachers.html",
-        teachers=teachers,
-        schools=schools,
+        teachers=result.items,
+        # geen volledige scholenlijst meer: de schoolvelden zoeken via admin_schools_search
+        selected_school=schools.get(school_id),
         school_map=school_map,
+        pagination=result,
+        filters={
+            "q": q,
+            "school": school_id,
+            "active": active_arg if active is not None else "",
+            "sort": sort,
+            "dir": "desc" if desc else "asc",
+            "per_page": per_page,
+        },
         active_tab="teachers",
         page_title="Docenten",
     )
 
+
+# =================================================
+# STUDENTS – BULK IMPORT
+# =================================================
+
+def _users_path() -> Path:
+    data_dir = os.environ.get("DATA_DIR", "/opt/mediawize/data")
+    return Path(data_dir) / "users.json"
+
+
+def _render_students_import(results=None, error=None):
+    schools = sorted(_load_schools(), key=lambda s: (s.get("name") or "").lower())
+    return render_template(
+        "docent/leerlingen_import.html",
+        base_template="admin/base_admin.html",
+        schools=schools,
+        results=results,
+        error=error,
+        active_tab="teachers",
+        page_title="Leerlingen importeren",
+    )
+
+
+@admin_bp.get("/students/import")
+@admin_required
+def admin_students_import():
+    return _render_students_import()
+
+
+@admin_bp.post("/students/import")
+@admin_required
+@admission_controlled("import")
+def admin_students_import_post():
+    school_id = (request.form.get("school_id") or "").strip()
+    if school_id and not any(s.get("id") == school_id for s in _load_schools()):
+        return _render_students_import(error="Kies een geldige school.")
+
+    f = request.files.get("file")
+    if not f or not f.filename:
+        return _render_students_import(error="Kies een CSV-bestand.")
+
+    raw = f.read(MAX_CSV_BYTES + 1)
+    if len(raw) > MAX_CSV_BYTES:
+        return _render_students_import(error="Bestand is te groot (maximaal 2MB).")
+
+    text = decode_csv(raw)
+
+    rows, errors = parse_students_csv(text)
+    results = import_students(_users_path(), rows, school_id=school_id) if rows else []
+
+    return _render_students_import(results=sorted(results + errors, key=lambda r: r["line"]))
+
+
+# =================================================
+# CSV EXPORT / IMPORT – SCHOOLS & TEACHERS
+# =================================================
+
+def _csv_response(chunks, filename: str) -> Response:
+    # streamen: rijen gaan per chunk naar de client, niet als één groot bestand
+    return Response(
+        stream_with_context(chunks),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def _csv_text_from_request() -> str | None:
+    """CSV uit upload, of uit het verborgen veld na een dry-run."""
+    text = request.form.get("csv_text")
+    if text:
+        return text[: MAX_CSV_BYTES]
+    f = request.files.get("file")
+    if not f or not f.filename:
+        return None
+    raw = f.read(MAX_CSV_BYTES + 1)
+    if len(raw) > MAX_CSV_BYTES:
+        return None
+    return decode_csv(raw)
+
+
+def _render_import_result(kind: str, plan: ImportPlan, csv_text: str, dry_run: bool):
+    return render_template(
+        "admin/import_result.html",
+        kind=kind,
+        plan=plan,
+        csv_text=csv_text if dry_run else "",
+        dry_run=dry_run,
+        active_tab=kind,
+        page_title="Import " + ("scholen" if kind == "schools" else "docenten"),
+    )
+
+
+@admin_bp.get("/schools.csv")
+@admin_required
+def admin_schools_export():
+    schools = school_index(_schools_path()).schools
+    return _csv_response(iter_csv(schools, SCHOOL_CSV_FIELDS), "scholen.csv")
+
+
+@admin_bp.get("/teachers.csv")
+@admin_required
+def admin_teachers_export():
+    schools = school_index(_schools_path())
+    teachers = teacher_index(_teachers_path()).teachers
+
+    def rows():
+        for t in teachers:
+            yield {**t, "school": (schools.get(t.get("school_id")) or {}).get("name", "")}
+
+    return _csv_response(iter_csv(rows(), TEACHER_CSV_FIELDS), "docenten.csv")
+
+
+@admin_bp.post("/schools/import")
+@admin_required
+def admin_schools_import():
+    text = _csv_text_from_request()
+    if text is None:
+        flash("Kies een CSV-bestand (maximaal 2MB).", "error")
+        return redirect(url_for("admin.admin_schools"))
+
+    dry_run = request.form.get("dry_run") == "1"
+    if dry_run:
+        plan = plan_school_import(text, _load_schools())
+        return _render_import_result("schools", plan, text, dry_run=True)
+
+    # één gelockte read-modify-write; diff opnieuw tegen de actuele data
+    with json_transaction(_schools_path(), list) as txn:
+        plan = plan_school_import(text, txn.data)
+        if plan.has_changes:
+            apply_plan(txn.data, plan, "id", alt_key="slug")
+        else:
+            txn.rollback()
+
+    flash(f"{len(plan.added)} toegevoegd, {len(plan.updated)} bijgewerkt.", "ok")
+    return _render_import_result("schools", plan, text, dry_run=False)
+
+
+@admin_bp.post("/teachers/import")
+@admin_required
+def admin_teachers_import():
+    text = _csv_text_from_request()
+    if text is None:
+        flash("Kies een CSV-bestand (maximaal 2MB).", "error")
+        return redirect(url_for("admin.admin_teachers"))
+
+    schools = school_index(_schools_path())
+    dry_run = request.form.get("dry_run") == "1"
+    if dry_run:
+        plan = plan_teacher_import(text, _load_teachers(), schools)
+        return _render_import_result("teachers", plan, text, dry_run=True)
+
+    with json_transaction(_teachers_path(), list) as txn:
+        plan = plan_teacher_import(text, txn.data, schools)
+        if plan.has_changes:
+            apply_plan(txn.data, plan, "id", alt_key="email")
+        else:
+            txn.rollback()
+
+    # dashboard tellers in één update
+    changes = [(stats.TOTALS, "teachers", len(plan.added))]
+    changes += [(stats.TEACHERS_PER_SCHOOL, t["school_id"], 1) for t in plan.added]
+    for upd in plan.updated:
+        if "school_id" in upd["changes"]:
+            old_sid, new_sid = upd["changes"]["school_id"]
+            changes += [(stats.TEACHERS_PER_SCHOOL, old_sid, -1), (stats.TEACHERS_PER_SCHOOL, new_sid, 1)]
+    stats.record(_data_dir(), changes)
+
+    flash(f"{len(plan.added)} toegevoegd, {len(plan.updated)} bijgewerkt.", "ok")
+    return _render_import_result("teachers", plan, text, dry_run=False)
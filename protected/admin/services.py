@@ -1 +1,397 @@
+# protected/admin/services.py
+"""
+Server-side paginering, sortering en filtering voor de admin lijsten.
 
+De indexen worden per proces gecacht (FileCache) en alleen opnieuw
+opgebouwd als teachers.json / schools.json veranderen. Een pagina kost dan:
+- zonder filters of alleen actief/inactief: O(per_page) (slice van een
+  voorgesorteerde lijst)
+- met schoolfilter: O(k log k) over alleen de docenten van die school
+- met tekst: substring-zoeken via trigram posting sets (SubstringIndex)
+  op naam + e-mail (docenten) of naam + slug (scholen): "jansen" vindt ook
+  "pjansen@school.nl"; daarna O(k log k) over alleen de treffers
+"""
+from __future__ import annotations
+
+import csv
+import io
+import math
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+from modules.core.bulk_import import csv_escape, csv_unescape
+from modules.core.school_index import SchoolIndex
+from modules.core.storage import FileCache
+from modules.core.text_index import SubstringIndex, normalize_query
+
+PER_PAGE_DEFAULT = 50
+PER_PAGE_MAX = 200
+
+TEACHER_SORTS = ("name", "email", "created")
+
+
+@dataclass
+class Page:
+    items: list[dict[str, Any]]
+    total: int
+    page: int
+    per_page: int
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.page < self.pages
+
+
+def clamp_paging(page: Any, per_page: Any) -> tuple[int, int]:
+    """Querystring waarden -> (page >= 1, 1 <= per_page <= PER_PAGE_MAX)."""
+    try:
+        page = int(page)
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        per_page = int(per_page)
+    except (TypeError, ValueError):
+        per_page = PER_PAGE_DEFAULT
+    return max(1, page), max(1, min(PER_PAGE_MAX, per_page))
+
+
+def _slice(positions: Sequence[int], items: list[dict], total: int, page: int, per_page: int) -> Page:
+    pages = max(1, math.ceil(total / per_page))
+    page = min(page, pages)
+    start = (page - 1) * per_page
+    return Page([items[p] for p in positions[start:start + per_page]], total, page, per_page)
+
+
+# =================================================
+# TEACHERS
+# =================================================
+
+class TeacherIndex:
+    def __init__(self, teachers: list[dict[str, Any]]):
+        self.teachers = [t for t in teachers if isinstance(t, dict)]
+        self._active = [bool(t.get("active")) for t in self.teachers]
+
+        self._text = SubstringIndex(f"{t.get('name') or ''}\n{t.get('email') or ''}" for t in self.teachers)
+
+        sort_keys = {
+            "name": lambda p: ((self.teachers[p].get("name") or "").lower(), p),
+            "email": lambda p: ((self.teachers[p].get("email") or "").lower(), p),
+            "created": lambda p: (self.teachers[p].get("created_at") or "", p),
+        }
+        positions = range(len(self.teachers))
+        self._order: dict[str, list[int]] = {k: sorted(positions, key=f) for k, f in sort_keys.items()}
+        self._rank: dict[str, list[int]] = {}
+        for k, order in self._order.items():
+            rank = [0] * len(order)
+            for r, p in enumerate(order):
+                rank[p] = r
+            self._rank[k] = rank
+        # per actief-vlag dezelfde voorgesorteerde lijsten
+        self._order_active: dict[bool, dict[str, list[int]]] = {
+            flag: {k: [p for p in order if self._active[p] == flag] for k, order in self._order.items()}
+            for flag in (True, False)
+        }
+
+        self._by_school: dict[str, list[int]] = {}
+        for p, t in enumerate(self.teachers):
+            self._by_school.setdefault(t.get("school_id") or "", []).append(p)
+
+    def __len__(self) -> int:
+        return len(self.teachers)
+
+    def query(
+        self,
+        q: str = "",
+        school_id: str = "",
+        active: bool | None = None,
+        sort: str = "name",
+        desc: bool = False,
+        page: int = 1,
+        per_page: int = PER_PAGE_DEFAULT,
+    ) -> Page:
+        sort = sort if sort in TEACHER_SORTS else "name"
+        q = normalize_query(q)
+        rank = self._rank[sort]
+
+        if q:
+            hits = self._text.search(q)
+            if school_id:
+                hits.intersection_update(self._by_school.get(school_id, []))
+            candidates = sorted(hits, key=rank.__getitem__)
+        elif school_id:
+            candidates = sorted(self._by_school.get(school_id, []), key=rank.__getitem__)
+        elif active is not None:
+            candidates = self._order_active[active][sort]
+            active = None  # al gefilterd
+        else:
+            candidates = self._order[sort]
+
+        if active is not None:
+            candidates = [p for p in candidates if self._active[p] == active]
+        if desc:
+            candidates = candidates[::-1]
+
+        return _slice(candidates, self.teachers, len(candidates), page, per_page)
+
+
+_teacher_cache: FileCache[TeacherIndex] = FileCache(TeacherIndex, list)
+
+
+def teacher_index(teachers_path: Path) -> TeacherIndex:
+    return _teacher_cache.get(teachers_path)
+
+
+# =================================================
+# SCHOOLS
+# =================================================
+
+def query_schools(
+    index: SchoolIndex,
+    q: str = "",
+    desc: bool = False,
+    page: int = 1,
+    per_page: int = PER_PAGE_DEFAULT,
+) -> Page:
+    q = normalize_query(q)
+    n = len(index.schools)
+    positions: Sequence[int] = range(n - 1, -1, -1) if desc else range(n)
+    if q:
+        # schools staan al op naam gesorteerd: positie-volgorde = naam-volgorde
+        positions = sorted(index.substring.search(q), reverse=desc)
+    return _slice(positions, index.schools, len(positions), page, per_page)
+
+
+# =================================================
+# CSV EXPORT / IMPORT
+# =================================================
+
+SCHOOL_CSV_FIELDS = ("id", "name", "slug", "primary_color", "secondary_color", "logo_path")
+TEACHER_CSV_FIELDS = ("id", "name", "email", "school_id", "school", "active", "created_at")
+CSV_CHUNK_ROWS = 500
+
+_HEX_COLOR = re.compile(r"^#(?:[0-9a-fA-F]{3}){1,2}$")
+_TRUE = {"1", "true", "ja", "yes", "actief", "y", "j"}
+_FALSE = {"0", "false", "nee", "no", "inactief", "n"}
+
+
+def iter_csv(rows: Iterable[dict[str, Any]], fields: Sequence[str]) -> Iterator[str]:
+    """
+    CSV als stroom van tekst-chunks (per CSV_CHUNK_ROWS regels), zodat een
+    export nooit als één groot bestand in het geheugen staat. Cellen die als
+    formule zouden starten worden geëscaped (csv_escape); de import haalt
+    dat weer weg.
+    """
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=list(fields), extrasaction="ignore", lineterminator="\r\n")
+    buf.write("\ufeff")  # BOM: Excel opent utf-8 dan goed
+    writer.writeheader()
+    n = 0
+    for row in rows:
+        writer.writerow({k: ("" if row.get(k) is None else csv_escape(row.get(k))) for k in fields})
+        n += 1
+        if n % CSV_CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _csv_rows(text: str) -> list[tuple[int, dict[str, str]]]:
+    first_line = text.split("\n", 1)[0]
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    reader.fieldnames = [(f or "").strip().lower() for f in (reader.fieldnames or [])]
+    return [
+        (reader.line_num, {k: csv_unescape((v or "").strip()) for k, v in row.items() if k})
+        for row in reader
+    ]
+
+
+@dataclass
+class ImportPlan:
+    """Diff van een CSV import t.o.v. de huidige data."""
+    added: list[dict[str, Any]] = field(default_factory=list)
+    updated: list[dict[str, Any]] = field(default_factory=list)  # {"before", "after", "changes"}
+    unchanged: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)   # {"line", "message"}
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.updated)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _diff(before: dict[str, Any], after: dict[str, Any]) -> dict[str, tuple[Any, Any]]:
+    return {k: (before.get(k), v) for k, v in after.items() if before.get(k) != v}
+
+
+def plan_school_import(text: str, schools: list[dict[str, Any]]) -> ImportPlan:
+    """
+    Match op id, anders slug, anders naam (case-insensitive).
+    Lege cellen laten bestaande waarden staan.
+    """
+    plan = ImportPlan()
+    by_id = {s.get("id"): s for s in schools if s.get("id")}
+    by_slug = {(s.get("slug") or "").lower(): s for s in schools if s.get("slug")}
+    by_name = {(s.get("name") or "").lower(): s for s in schools if s.get("name")}
+    seen: set[str] = set()
+
+    for line, row in _csv_rows(text):
+        name = row.get("name") or row.get("naam") or ""
+        slug = (row.get("slug") or "").lower()
+        values = {
+            "name": name,
+            "slug": slug,
+            "primary_color": row.get("primary_color") or "",
+            "secondary_color": row.get("secondary_color") or "",
+            "logo_path": row.get("logo_path") or "",
+        }
+        bad_color = next((c for c in (values["primary_color"], values["secondary_color"])
+                          if c and not _HEX_COLOR.match(c)), None)
+        if bad_color:
+            plan.errors.append({"line": line, "message": f"Ongeldige kleur '{bad_color}'."})
+            continue
+
+        found = by_id.get(row.get("id")) or (by_slug.get(slug) if slug else None) or by_name.get(name.lower())
+        key = (found or {}).get("id") or slug or name.lower()
+        if not key:
+            plan.errors.append({"line": line, "message": "Naam of slug ontbreekt."})
+            continue
+        if key in seen:
+            plan.errors.append({"line": line, "message": "School staat dubbel in dit bestand."})
+            continue
+        seen.add(key)
+
+        slug_owner = by_slug.get(slug) if slug else None
+        if slug_owner is not None and slug_owner is not found:
+            plan.errors.append({"line": line, "message": f"Slug '{slug}' is al in gebruik."})
+            continue
+
+        if found is None:
+            if not name:
+                plan.errors.append({"line": line, "message": "Naam ontbreekt voor nieuwe school."})
+                continue
+            plan.added.append({"id": uuid.uuid4().hex, **values, "created_at": _now()})
+            continue
+
+        changes = _diff(found, {k: v for k, v in values.items() if v})
+        if changes:
+            plan.updated.append({"before": found, "after": {**found, **{k: v for k, (_, v) in changes.items()}},
+                                 "changes": changes})
+        else:
+            plan.unchanged += 1
+
+    return plan
+
+
+def plan_teacher_import(text: str, teachers: list[dict[str, Any]], schools: SchoolIndex) -> ImportPlan:
+    """
+    Match op e-mail. School via kolom school_id, of school (naam of slug).
+    """
+    plan = ImportPlan()
+    by_email = {(t.get("email") or "").lower(): t for t in teachers if t.get("email")}
+    by_school_key: dict[str, str] = {}
+    for s in schools.schools:
+        for k in (s.get("slug"), s.get("name")):
+            if k:
+                by_school_key.setdefault(k.lower(), s["id"])
+    seen: set[str] = set()
+
+    for line, row in _csv_rows(text):
+        email = (row.get("email") or row.get("e-mail") or "").lower()
+        if not email or "@" not in email:
+            plan.errors.append({"line": line, "message": "Ongeldig e-mailadres."})
+            continue
+        if email in seen:
+            plan.errors.append({"line": line, "message": "E-mailadres staat dubbel in dit bestand."})
+            continue
+        seen.add(email)
+
+        school_id = row.get("school_id") or ""
+        if school_id and schools.get(school_id) is None:
+            plan.errors.append({"line": line, "message": f"Onbekende school_id '{school_id}'."})
+            continue
+        if not school_id and row.get("school"):
+            school_id = by_school_key.get(row["school"].lower(), "")
+            if not school_id:
+                plan.errors.append({"line": line, "message": f"Onbekende school '{row['school']}'."})
+                continue
+
+        active_raw = (row.get("active") or row.get("actief") or "").lower()
+        if active_raw and active_raw not in _TRUE | _FALSE:
+            plan.errors.append({"line": line, "message": f"Ongeldige waarde voor active: '{active_raw}'."})
+            continue
+
+        values: dict[str, Any] = {}
+        if row.get("name") or row.get("naam"):
+            values["name"] = row.get("name") or row.get("naam")
+        if school_id:
+            values["school_id"] = school_id
+        if active_raw:
+            values["active"] = active_raw in _TRUE
+
+        found = by_email.get(email)
+        if found is None:
+            if not school_id:
+                plan.errors.append({"line": line, "message": "School ontbreekt voor nieuwe docent."})
+                continue
+            plan.added.append({
+                "id": uuid.uuid4().hex,
+                "name": values.get("name", ""),
+                "email": email,
+                "school_id": school_id,
+                "role": "docent",
+                "active": values.get("active", True),
+                "created_at": _now(),
+            })
+            continue
+
+        changes = _diff(found, values)
+        if changes:
+            plan.updated.append({"before": found, "after": {**found, **values}, "changes": changes})
+        else:
+            plan.unchanged += 1
+
+    return plan
+
+
+def apply_plan(items: list[dict[str, Any]], plan: ImportPlan, key: str, alt_key: str | None = None) -> None:
+    """
+    Voer een plan door op `items` (in place), gematcht op `key` ("id").
+    Oude records zonder `key` worden op `alt_key` gematcht (e-mail, slug),
+    case-insensitive; zonder beide worden ze overgeslagen.
+    """
+    now = _now()
+    pos: dict[Any, int] = {}
+    alt: dict[str, int] = {}
+    for i, it in enumerate(items):
+        if it.get(key):
+            pos[it[key]] = i
+        elif alt_key and it.get(alt_key):
+            alt[str(it[alt_key]).lower()] = i
+    for upd in plan.updated:
+        before = upd["before"]
+        if before.get(key):
+            i = pos.get(before[key])
+        elif alt_key and before.get(alt_key):
+            i = alt.get(str(before[alt_key]).lower())
+        else:
+            i = None
+        if i is not None:
+            items[i] = {**upd["after"], "updated_at": now}
+    items.extend(plan.added)
@@ -0,0 +1,70 @@
+# tools/bench_password_hash.py
+"""
+Benchmark voor het wachtwoord-hashing beleid: hoeveel logins per seconde
+kan één core verifiëren per instelling?
+
+Gebruik:
+    python tools/bench_password_hash.py
+    python tools/bench_password_hash.py scrypt:16384:8:1 pbkdf2:sha256:600000 -n 20
+
+Kies daarna PASSWORD_HASH_METHOD (env) bewust: logins/s/core x aantal
+gunicorn workers moet ruim boven de piek liggen (een hele klas binnen een minuut).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash  # noqa: E402
+
+from modules.core.passwords import canonical_params, hash_password  # noqa: E402
+
+DEFAULT_METHODS = [
+    "scrypt:32768:8:1",
+    "scrypt:16384:8:1",
+    "scrypt:8192:8:1",
+    "pbkdf2:sha256:1000000",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:260000",
+]
+
+
+def bench(method: str, iterations: int) -> tuple[float, float]:
+    """Returns (ms per verify, verifies per seconde) op één core."""
+    password = "Voorbeeld-wachtwoord-123"
+    stored = hash_password(password, method=method)
+    check_password_hash(stored, password)  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        check_password_hash(stored, password)
+    elapsed = time.perf_counter() - start
+    per_login = elapsed / iterations
+    return per_login * 1000, 1 / per_login
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("methods", nargs="*", default=DEFAULT_METHODS, help="werkzeug hash methods")
+    parser.add_argument("-n", "--iterations", type=int, default=10, help="verifies per methode")
+    args = parser.parse_args()
+
+    print(f"{'methode':<28} {'ms/login':>10} {'logins/s/core':>14}")
+    for method in args.methods:
+        try:
+            params = canonical_params(method)
+        except ValueError as e:
+            print(f"{method:<28} ongeldig: {e}")
+            continue
+        ms, per_sec = bench(method, args.iterations)
+        print(f"{params:<28} {ms:>10.1f} {per_sec:>14.1f}")
+    print(f"\ncores: {os.cpu_count()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# tools/build_responsive_images.py
+"""
+Breedte-varianten van de landingspagina-afbeeldingen maken (offline stap).
+
+Gebruik:
+    python tools/build_responsive_images.py
+    python tools/build_responsive_images.py --widths 360 640 960 --quality 78
+
+Schrijft voor elke afbeelding in static/assets/images die een template via
+responsive_image('assets/images/...') gebruikt een set kleinere webp's naar
+static/assets/images/responsive/<naam>-<breedte>w.webp, plus
+responsive/index.json met de afmetingen van origineel en varianten. De app
+leest alleen die index (geen Pillow nodig op de server); de varianten gaan
+gewoon mee in de asset-fingerprinting.
+
+Varianten die nieuwer zijn dan hun bron worden overgeslagen, dus opnieuw
+draaien na het vervangen van één afbeelding is goedkoop. Varianten van
+afbeeldingen die geen template (meer) gebruikt worden opgeruimd; --all maakt
+ze toch voor alles in de map. Commit de output.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+STATIC_DIR = ROOT / "static"
+SOURCE_DIR = STATIC_DIR / "assets" / "images"
+TEMPLATES_DIR = ROOT / "templates"
+OUT_NAME = "responsive"
+DEFAULT_WIDTHS = (360, 640, 960, 1280)
+SOURCE_SUFFIXES = {".webp", ".png", ".jpg", ".jpeg"}
+
+_RESPONSIVE_CALL_RE = re.compile(r"""responsive_image\(\s*['"]([^'"]+)['"]""")
+
+
+def referenced_images(templates_dir: Path = TEMPLATES_DIR) -> set[str]:
+    """Static-paden die templates aan responsive_image() geven ("assets/images/x.webp")."""
+    found: set[str] = set()
+    for path in templates_dir.rglob("*.html"):
+        found.update(m.lstrip("/") for m in _RESPONSIVE_CALL_RE.findall(path.read_text(encoding="utf-8")))
+    return found
+
+
+def build(
+    source_dir: Path,
+    widths: list[int],
+    quality: int,
+    force: bool = False,
+    only: set[str] | None = None,
+) -> dict:
+    """Varianten + index.json; `only` = static-paden om mee te nemen (None = alles)."""
+    out_dir = source_dir / OUT_NAME
+    out_dir.mkdir(exist_ok=True)
+    index: dict[str, dict] = {}
+
+    for src in sorted(source_dir.iterdir()):
+        if not src.is_file() or src.suffix.lower() not in SOURCE_SUFFIXES:
+            continue
+        if only is not None and _static_path(src) not in only:
+            continue
+        with Image.open(src) as im:
+            width, height = im.size
+            variants = []
+            for w in sorted(set(widths)):
+                if w >= width:
+                    continue  # nooit opschalen; het origineel is de grootste variant
+                h = round(height * w / width)
+                target = out_dir / f"{src.stem}-{w}w.webp"
+                variants.append({"width": w, "height": h, "file": target.name})
+                if not force and target.exists() and target.stat().st_mtime >= src.stat().st_mtime:
+                    continue
+                frame = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+                frame.resize((w, h), Image.LANCZOS).save(target, "WEBP", quality=quality, method=6)
+                print(f"  {OUT_NAME}/{target.name}  {target.stat().st_size // 1024} KB")
+
+        index[src.name] = {"width": width, "height": height, "variants": variants}
+
+    # verweesde varianten (bron weg of breedte niet meer gevraagd) opruimen
+    wanted = {v["file"] for entry in index.values() for v in entry["variants"]}
+    for old in out_dir.glob("*.webp"):
+        if old.name not in wanted:
+            old.unlink()
+
+    (out_dir / "index.json").write_text(json.dumps(index, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    return index
+
+
+def _static_path(path: Path) -> str:
+    try:
+        return path.resolve().relative_to(STATIC_DIR).as_posix()
+    except ValueError:
+        return path.name  # --source buiten static/: dan telt alleen de bestandsnaam
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--widths", type=int, nargs="+", default=list(DEFAULT_WIDTHS))
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--force", action="store_true", help="alles opnieuw genereren")
+    parser.add_argument("--source", type=Path, default=SOURCE_DIR)
+    parser.add_argument("--all", action="store_true",
+                        help="alle afbeeldingen in de map, niet alleen die templates gebruiken")
+    args = parser.parse_args()
+
+    only = None if args.all else referenced_images()
+    index = build(args.source, args.widths, args.quality, args.force, only)
+    for name, entry in index.items():
+        original = os.path.getsize(args.source / name) // 1024
+        sizes = ", ".join(f"{v['width']}w" for v in entry["variants"]) or "-"
+        print(f"{name}: {entry['width']}x{entry['height']} ({original} KB) -> {sizes}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
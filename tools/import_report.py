@@ -0,0 +1,84 @@
+# tools/import_report.py
+"""
+Wat kost het importeren van de app? Per module (of per top-level package) de
+import-tijd volgens `python -X importtime`, plus RSS na het laden.
+
+Gebruik:
+    python tools/import_report.py                 # main app, top 25 packages
+    python tools/import_report.py --target admin_app --modules -n 40
+    python tools/import_report.py --check docx lxml numpy
+
+Met --check faalt het script (exit 1) als een van de genoemde modules al bij
+het opstarten geladen wordt; handig om lazy imports zo te houden.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import resource, sys, time
+t = time.perf_counter()
+import {target}
+elapsed = time.perf_counter() - t
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print("__REPORT__", round(elapsed * 1000, 1), rss_kb, ",".join(sorted(sys.modules)))
+"""
+
+
+def run(target: str) -> tuple[list[tuple[str, int, int]], float, int, set[str]]:
+    """Returns ([(module, self_us, cumulative_us)], wall ms, maxrss KB, geladen modules)."""
+    env = dict(os.environ)
+    # nooit tegen de echte data dir opstarten
+    env["DATA_DIR"] = env.get("IMPORT_REPORT_DATA_DIR") or tempfile.mkdtemp(prefix="mediawize-import-")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(target=target)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    report = next(l for l in proc.stdout.splitlines() if l.startswith("__REPORT__"))
+    _, wall_ms, rss_kb, modules = report.split(" ", 3)
+    return rows, float(wall_ms), int(rss_kb), set(modules.split(","))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target", default="app", help="module om te importeren (app of admin_app)")
+    parser.add_argument("--modules", action="store_true", help="per module i.p.v. per top-level package")
+    parser.add_argument("-n", type=int, default=25, help="aantal regels")
+    parser.add_argument("--check", nargs="*", default=[], help="deze modules mogen niet geladen zijn")
+    args = parser.parse_args()
+
+    rows, wall_ms, rss_kb, loaded = run(args.target)
+
+    totals: dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name if args.modules else name.split(".")[0]] += self_us
+
+    print(f"import {args.target}: {wall_ms:.0f} ms, maxrss {rss_kb / 1024:.1f} MB, {len(loaded)} modules")
+    print(f"{'self ms':>9}  {'%':>5}  {'module' if args.modules else 'package'}")
+    total_us = sum(totals.values()) or 1
+    for name, us in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:args.n]:
+        print(f"{us / 1000:9.1f}  {100 * us / total_us:5.1f}  {name}")
+
+    eager = [m for m in args.check if m in loaded]
+    if eager:
+        print(f"\nBij het opstarten geladen (zou lazy moeten zijn): {', '.join(eager)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
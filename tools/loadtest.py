@@ -0,0 +1,263 @@
+# tools/loadtest.py
+"""
+Login-storm load test voor de hoofdapp (de "08:30 burst").
+
+- seedt een tijdelijke DATA_DIR met N leerlingen, docenten en scholen
+- start create_app() in een aparte (server)proces via werkzeug's WSGI server
+- laat `--concurrency` virtuele leerlingen tegelijk inloggen:
+    GET /login -> POST /login -> GET /leerling/ (leerling.dashboard)
+- rapporteert per endpoint p50/p95/p99 latency en throughput
+
+Gebruik:
+    python tools/loadtest.py --users 500 --concurrency 50
+    python tools/loadtest.py --users 200 --hash-method scrypt:16384:8:1 --server-processes 4
+    python tools/loadtest.py --url http://127.0.0.1:8501 --data-dir /tmp/seed  # eigen server (bijv. gunicorn)
+
+De server draait in een eigen proces zodat de client-threads de GIL van de
+app niet delen. Met --server-processes N forkt werkzeug N workers (ongeveer
+zoals gunicorn -w N).
+"""
+from __future__ import annotations
+
+import argparse
+import http.cookiejar
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = "loadtest-123"
+
+
+# ------------------------------------------------------------
+# Seed data
+# ------------------------------------------------------------
+def seed(data_dir: Path, users: int, teachers: int, schools: int, hash_method: str) -> list[str]:
+    """Schrijf users.json, teachers.json en schools.json; geeft leerling e-mails terug."""
+    from werkzeug.security import generate_password_hash
+
+    from modules.core.passwords import canonical_params
+    from modules.core.storage import write_json
+
+    # één hash voor iedereen: de verify-kosten per login blijven realistisch,
+    # maar seeden duurt geen minuten
+    password_hash = generate_password_hash(PASSWORD, method=hash_method)
+    params = canonical_params(hash_method)
+
+    school_items = [
+        {"id": uuid.uuid4().hex, "name": f"Loadtest school {i:04d}", "slug": f"school-{i}",
+         "primary_color": "#22c55e", "secondary_color": "#86efac", "logo_path": ""}
+        for i in range(schools)
+    ]
+
+    user_items: dict[str, dict] = {}
+    teacher_items: list[dict] = []
+    for i in range(teachers):
+        email = f"docent{i}@loadtest.nl"
+        school = school_items[i % len(school_items)]
+        user_items[email] = {"email": email, "password_hash": password_hash, "password_method": params,
+                             "role": "docent", "is_admin": False}
+        teacher_items.append({"id": uuid.uuid4().hex, "name": f"Docent {i}", "email": email,
+                              "school_id": school["id"], "role": "docent", "active": True})
+
+    student_emails = []
+    for i in range(users):
+        email = f"leerling{i}@loadtest.nl"
+        school = school_items[i % len(school_items)]
+        user_items[email] = {"email": email, "password_hash": password_hash, "password_method": params,
+                             "role": "leerling", "is_admin": False, "school_id": school["id"]}
+        student_emails.append(email)
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    write_json(data_dir / "schools.json", school_items)
+    write_json(data_dir / "teachers.json", teacher_items)
+    write_json(data_dir / "users.json", user_items)
+    return student_emails
+
+
+# ------------------------------------------------------------
+# Server
+# ------------------------------------------------------------
+def _serve(data_dir: str, port: int, processes: int, hash_method: str) -> None:
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["PASSWORD_HASH_METHOD"] = hash_method
+    import logging
+
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app = create_app()
+    if processes > 1:
+        server = make_server("127.0.0.1", port, app, threaded=False, processes=processes)
+    else:
+        server = make_server("127.0.0.1", port, app, threaded=True)
+    server.serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server kwam niet op binnen {timeout}s")
+
+
+# ------------------------------------------------------------
+# Client
+# ------------------------------------------------------------
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+
+def _request(opener, recorder: Recorder, name: str, url: str, data: dict | None, expect: int) -> int:
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    start = time.perf_counter()
+    try:
+        with opener.open(url, data=body, timeout=60) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    recorder.add(name, time.perf_counter() - start, status == expect)
+    return status
+
+
+def run_student(base_url: str, email: str, recorder: Recorder) -> None:
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), _NoRedirect)
+    _request(opener, recorder, "GET /login", f"{base_url}/login", None, 200)
+    status = _request(opener, recorder, "POST /login", f"{base_url}/login",
+                      {"email": email, "password": PASSWORD}, 302)
+    if status == 302:
+        _request(opener, recorder, "GET /leerling/", f"{base_url}/leerling/", None, 200)
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def report(recorder: Recorder, wall: float) -> dict[str, dict[str, float]]:
+    out = {}
+    for name, values in recorder.latencies.items():
+        v = sorted(values)
+        out[name] = {
+            "count": len(v),
+            "errors": recorder.errors.get(name, 0),
+            "mean_ms": statistics.fmean(v) * 1000,
+            "p50_ms": _percentile(v, 50) * 1000,
+            "p95_ms": _percentile(v, 95) * 1000,
+            "p99_ms": _percentile(v, 99) * 1000,
+            "rps": len(v) / wall if wall else 0.0,
+        }
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="aantal leerlingen (= logins)")
+    parser.add_argument("--teachers", type=int, default=50)
+    parser.add_argument("--schools", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=25, help="gelijktijdige virtuele leerlingen")
+    parser.add_argument("--hash-method", default=os.environ.get("PASSWORD_HASH_METHOD", "scrypt"))
+    parser.add_argument("--server-processes", type=int, default=1)
+    parser.add_argument("--url", help="bestaande server gebruiken i.p.v. er zelf een te starten")
+    parser.add_argument("--data-dir", help="DATA_DIR om te seeden (standaard: tijdelijke map)")
+    parser.add_argument("--json", action="store_true", help="rapport als JSON")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    data_dir = Path(args.data_dir) if args.data_dir else Path(tempfile.mkdtemp(prefix="mediawize-loadtest-"))
+    if not args.data_dir:
+        tmp_dir = data_dir
+
+    server = None
+    try:
+        t = time.perf_counter()
+        emails = seed(data_dir, args.users, args.teachers, max(1, args.schools), args.hash_method)
+        print(f"seed: {len(emails)} leerlingen in {data_dir} ({time.perf_counter() - t:.1f}s)", file=sys.stderr)
+
+        base_url = (args.url or "").rstrip("/")
+        if not base_url:
+            port = _free_port()
+            ctx = multiprocessing.get_context("spawn")
+            server = ctx.Process(target=_serve, args=(str(data_dir), port, args.server_processes, args.hash_method),
+                                 daemon=True)
+            server.start()
+            _wait_for_port(port)
+            base_url = f"http://127.0.0.1:{port}"
+
+        recorder = Recorder()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda e: run_student(base_url, e, recorder), emails))
+        wall = time.perf_counter() - start
+
+        result = report(recorder, wall)
+        if args.json:
+            print(json.dumps({"wall_s": wall, "endpoints": result}, indent=2))
+        else:
+            print(f"{'endpoint':<16} {'n':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+            for name, r in result.items():
+                print(f"{name:<16} {r['count']:>6} {r['errors']:>5} {r['p50_ms']:>9.1f} "
+                      f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['rps']:>8.1f}")
+            print(f"\n{len(emails)} logins in {wall:.2f}s ({len(emails) / wall:.1f} logins/s), "
+                  f"concurrency {args.concurrency}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join(5)
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())